@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Measure how process_log.py scales with the size of the log file.
+    python src/benchmark.py generate <output file> --lines 1M
+        Write a synthetic log file (see synthetic_log.py).
+    python src/benchmark.py run --sizes 1M,10M,100M --baseline benchmark/baseline.json
+        Generate a synthetic log file of each size in the work directory (they are kept and
+        reused by later runs with the same options), run process_log.py --report on it, and
+        write the throughput, the peak memory and the time of the phases and of the analyzers
+        of each size into <work directory>/results.json. If the baseline file exists, the
+        results are compared with it, and the exit status is 1 if the throughput of a size
+        drops or its peak memory grows by more than --tolerance. With --save-baseline, the
+        results are written into the baseline file instead.
+The options of the synthetic log files (--hosts, --resources, --skew, --span, --burst-rate,
+--error-rate, --seed) are the same for both commands, and the options after "--" are passed
+to process_log.py, e.g. "-- --batch-size 100000".
+Author: Yuan Huang
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+from collections import OrderedDict
+import synthetic_log
+
+PROCESS_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "process_log.py")
+
+# The suffixes of the sizes, e.g. 10M.
+SUFFIXES = {"K": 10 ** 3, "M": 10 ** 6, "G": 10 ** 9}
+
+def parse_size(text):
+    """
+    Parse a number of lines with an optional suffix, e.g. "100K" or "10M".
+    Args:
+        text(str): the number of lines.
+    Returns:
+        lines(int): the number of lines.
+    Raises:
+        ValueError: Error occurs when the text is not a number of lines.
+    """
+    text = text.strip().upper()
+    if text and text[-1] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+def format_size(lines):
+    """
+    Format a number of lines with a suffix if it is round, e.g. 10M.
+    Args:
+        lines(int): the number of lines.
+    Returns:
+        text(str): the number of lines.
+    """
+    for suffix in ("G", "M", "K"):
+        if lines >= SUFFIXES[suffix] and lines % SUFFIXES[suffix] == 0:
+            return "{0}{1}".format(lines // SUFFIXES[suffix], suffix)
+    return str(lines)
+
+def make_generator(args):
+    """
+    Make the LogGenerator of the options.
+    Args:
+        args(argparse.Namespace): the options.
+    Returns:
+        LogGenerator object.
+    """
+    return synthetic_log.LogGenerator(hosts=args.hosts, resources=args.resources,
+                                      skew=args.skew, span=args.span,
+                                      burst_rate=args.burst_rate, error_rate=args.error_rate,
+                                      seed=args.seed)
+
+def synthetic_path(workdir, generator, lines):
+    """
+    Get the name of the synthetic log file of a size, which depends on all the options, so
+    a file is only reused with the same options.
+    Args:
+        workdir(str): the work directory.
+        generator(LogGenerator): the generator of the file.
+        lines(int): the number of lines.
+    Returns:
+        path(str): the name of the file.
+    """
+    name = "log_{0}_h{1}_r{2}_z{3}_s{4}_b{5}_e{6}_seed{7}.txt".format(
+        format_size(lines), generator.hosts, generator.resources, generator.skew,
+        generator.span, generator.burst_rate, generator.error_rate, generator.seed)
+    return os.path.join(workdir, name)
+
+def run_process_log(infile, outdir, options):
+    """
+    Run process_log.py --report on a log file.
+    Args:
+        infile(str): the name of the log file.
+        outdir(str): the output directory, which also gets process.log.
+        options(list): the other options of process_log.py.
+    Returns:
+        (report, seconds): the report of the run (see run_stats.py), and the wall time of
+            the run including the start of Python.
+    Raises:
+        RuntimeError: Error occurs when process_log.py fails.
+    """
+    outdir = os.path.abspath(outdir)
+    if os.path.isdir(outdir):
+        shutil.rmtree(outdir)
+    os.makedirs(outdir)
+    command = [sys.executable, PROCESS_LOG, os.path.abspath(infile), outdir + os.sep,
+               "--report"] + options
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        status = subprocess.call(command, cwd=outdir, stdout=devnull)
+    seconds = time.time() - start
+    if status != 0:
+        raise RuntimeError("process_log.py fails on {0}, see {1}"
+                           .format(infile, os.path.join(outdir, "process.log")))
+    with open(os.path.join(outdir, "report.json")) as reader:
+        return (json.load(reader, object_pairs_hook=OrderedDict), seconds)
+
+def summarize(report, seconds):
+    """
+    Get the numbers of a run that are compared between runs.
+    Args:
+        report(dict): the report of process_log.py.
+        seconds(float): the wall time of the run.
+    Returns:
+        summary(OrderedDict): the numbers of lines, the wall time, the throughput, the peak
+            memory and the time of the phases and of the analyzers.
+    """
+    summary = OrderedDict()
+    summary["lines"] = report["lines"]
+    summary["seconds"] = seconds
+    summary["lines_per_second"] = report["lines"] / seconds if seconds > 0 else None
+    summary["peak_memory_mb"] = report["peak_memory_mb"]
+    summary["phases"] = OrderedDict((name, phase["seconds"])
+                                    for (name, phase) in report["phases"].items())
+    summary["analyzers"] = OrderedDict((name, analyzer["seconds"])
+                                       for (name, analyzer) in report["analyzer_seconds"].items())
+    return summary
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the results with the baseline.
+    Args:
+        results(dict), baseline(dict): the runs of the sizes, see run_benchmark.
+        tolerance(float): the fraction that the throughput may drop and the peak memory may
+            grow before it is a regression.
+    Returns:
+        (rows, regressions): the text rows of the comparison, and the rows of the regressions.
+    """
+    (rows, regressions) = ([], [])
+    for (size, run) in results["runs"].items():
+        base = baseline.get("runs", {}).get(size)
+        if base is None:
+            rows.append("{0:>6}: no baseline".format(size))
+            continue
+        for (key, worse) in (("lines_per_second", lambda new, old: new < old * (1 - tolerance)),
+                             ("peak_memory_mb", lambda new, old: new > old * (1 + tolerance))):
+            (new, old) = (run.get(key), base.get(key))
+            if new is None or not old:
+                continue
+            row = "{0:>6}: {1:<16} {2:>12.1f} -> {3:>12.1f} ({4:+.1%})".format(
+                size, key, old, new, new / old - 1)
+            if worse(new, old):
+                row += " REGRESSION"
+                regressions.append(row)
+            rows.append(row)
+    if results["options"] != baseline.get("options"):
+        rows.append("The baseline is of the options {0}".format(baseline.get("options")))
+    return (rows, regressions)
+
+def run_benchmark(args, options):
+    """
+    Run process_log.py on the synthetic log file of each size.
+    Args:
+        args(argparse.Namespace): the options of the benchmark.
+        options(list): the options of process_log.py.
+    Returns:
+        results(OrderedDict): the options, the environment and the summary of the fastest
+            of the repeated runs of each size.
+    """
+    generator = make_generator(args)
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+    results = OrderedDict()
+    results["options"] = options
+    results["generator"] = OrderedDict((key, getattr(generator, key)) for key in
+                                       ("hosts", "resources", "skew", "span", "burst_rate",
+                                        "error_rate", "seed"))
+    results["python"] = platform.python_version()
+    results["platform"] = platform.platform()
+    results["time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    results["runs"] = OrderedDict()
+    for size in [parse_size(text) for text in args.sizes.split(",")]:
+        infile = synthetic_path(args.workdir, generator, size)
+        if not os.path.isfile(infile):
+            print("Generating {0} lines into {1}...".format(size, infile))
+            generator.write(infile + ".part", size)
+            os.rename(infile + ".part", infile)
+        best = None
+        for _ in range(args.repeat):
+            (report, seconds) = run_process_log(infile, os.path.join(args.workdir, "output"),
+                                                options)
+            summary = summarize(report, seconds)
+            if best is None or summary["seconds"] < best["seconds"]:
+                best = summary
+        print("{0:>6}: {1:.1f} s, {2:.0f} lines/s, {3} MB".format(
+            format_size(size), best["seconds"], best["lines_per_second"],
+            best["peak_memory_mb"]))
+        results["runs"][format_size(size)] = best
+    return results
+
+def write_json(path, data):
+    """
+    Write data into a JSON file.
+    Args:
+        path(str): the name of the file.
+        data(dict): the data.
+    """
+    with open(path, "w") as writer:
+        json.dump(data, writer, indent=2)
+        writer.write("\n")
+
+def main(argv):
+    """
+    Run the command of the arguments.
+    Args:
+        argv(list): the command line arguments, the ones after "--" are passed to
+            process_log.py.
+    Returns:
+        status(int): the exit status, 1 if there is a regression.
+    """
+    options = []
+    if "--" in argv:
+        (argv, options) = (argv[:argv.index("--")], argv[argv.index("--")+1:])
+
+    generator_parser = argparse.ArgumentParser(add_help=False)
+    generator_parser.add_argument("--hosts", type=int, default=10000,
+                                  help="The number of distinct hosts")
+    generator_parser.add_argument("--resources", type=int, default=2000,
+                                  help="The number of distinct resources")
+    generator_parser.add_argument("--skew", type=float, default=1.1,
+                                  help="The exponent of the Zipf distribution of the hosts "
+                                       "and the resources")
+    generator_parser.add_argument("--span", type=int, default=30 * 24 * 3600,
+                                  help="The number of seconds from the first to the last line")
+    generator_parser.add_argument("--burst-rate", type=float, default=0.0005,
+                                  help="The probability that a line starts a burst of failed "
+                                       "logins")
+    generator_parser.add_argument("--error-rate", type=float, default=0.0,
+                                  help="The probability that a line is malformed")
+    generator_parser.add_argument("--seed", type=int, default=0,
+                                  help="The seed of the random numbers")
+
+    parser = argparse.ArgumentParser(description="Benchmark process_log.py on synthetic logs")
+    commands = parser.add_subparsers(dest="command")
+    generate = commands.add_parser("generate", parents=[generator_parser],
+                                   help="Write a synthetic log file")
+    generate.add_argument("output_file", help="The name of the log file")
+    generate.add_argument("--lines", default="1M", help="The number of lines, e.g. 1M")
+    run = commands.add_parser("run", parents=[generator_parser],
+                              help="Run process_log.py on synthetic logs of several sizes")
+    run.add_argument("--sizes", default="1M,10M,100M",
+                     help="A comma-separated list of the numbers of lines")
+    run.add_argument("--workdir", default="benchmark",
+                     help="The directory of the synthetic logs and the results")
+    run.add_argument("--repeat", type=int, default=1,
+                     help="Run each size this many times and keep the fastest run")
+    run.add_argument("--baseline", help="The JSON file of the baseline results")
+    run.add_argument("--save-baseline", action="store_true",
+                     help="Write the results into the baseline file")
+    run.add_argument("--tolerance", type=float, default=0.1,
+                     help="The fraction that the throughput may drop or the peak memory may "
+                          "grow before it is a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        make_generator(args).write(args.output_file, parse_size(args.lines))
+        return 0
+
+    if args.save_baseline and args.baseline is None:
+        parser.error("--save-baseline requires --baseline")
+    results = run_benchmark(args, options)
+    write_json(os.path.join(args.workdir, "results.json"), results)
+    if args.baseline is None:
+        return 0
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print("The baseline is saved to {0}".format(args.baseline))
+        return 0
+    if not os.path.isfile(args.baseline):
+        print("The baseline {0} doesn't exist, use --save-baseline".format(args.baseline))
+        return 0
+    with open(args.baseline) as reader:
+        baseline = json.load(reader, object_pairs_hook=OrderedDict)
+    (rows, regressions) = compare(results, baseline, args.tolerance)
+    print("\n".join(rows))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -8,17 +8,32 @@ Author: Yuan Huang
 """
 import unittest
 import datetime as dt
+import calendar
+import read_entry
+import utility
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class BlockedHosts(object):
     """
     The class that keeps track of the failed login and block further activities if a host
     fails to login for a number of times consecutively within a specified time window.
+    The hosts can be names or integer IDs.
     """
     # Private Constants:
     # The name of indices in the monitor_dict and block_dict.
     (__LAST_EVENT, __TIME_LEFT, __CHANCES_LEFT) = (0, 1, 2)
-    def __init__(self, monitor_seconds=20, block_seconds=300, chances=3):
+    def __init__(self, monitor_seconds=20, block_seconds=300, chances=3, epoch=False,
+                 resources=None):
         """
+        Args:
+            epoch(bool): True if the "Time" of the entries is in integer epoch seconds
+                (read_entry.read_entry(line, epoch=True)), False if it is a datetime object.
+            resources(utility.Vocabulary): if the requests of the entries are integer IDs
+                (read_entry.read_entry(line, resources=resources)), the vocabulary of the
+                resources.
         Public variables:
             monitor_time: the time period during which a number of failed login attempts will
                 trigger the block event
@@ -33,6 +48,12 @@ class BlockedHosts(object):
         self.__monitor_time = monitor_seconds
         self.__block_time = block_seconds
         self.__chances = chances
+        self.__epoch = epoch
+        self.__resources = resources
+        if epoch:
+            self.__difference = epoch_difference
+        else:
+            self.__difference = time_difference
 
         self.__monitor = {}
         self.__block = {}
@@ -43,14 +64,14 @@ class BlockedHosts(object):
         blocked and update the block dictionary accordingly.
         Args:
             host(str): the host name of the entry. The host is already in the block dictionary.
-            time(datetime): the time of the new entry.
+            time(datetime or int): the time of the new entry.
         Returns:
             is_blocked: True if the entry needs to be blocked; False otherwise.
         """
         is_blocked = False
         if host in self.__block:
             status = self.__block[host]
-            delta_time = time_difference(status[self.__LAST_EVENT], time)
+            delta_time = self.__difference(status[self.__LAST_EVENT], time)
             if delta_time <= status[self.__TIME_LEFT]:
                 is_blocked = True
                 status[self.__LAST_EVENT] = time
@@ -65,10 +86,10 @@ class BlockedHosts(object):
         added to block dictionary and update the monitor dictionary accordingly.
         Args:
             host(str): the host name of the entry. The host is already in the monitor dictionary.
-            time(datetime): the time of the new entry.
+            time(datetime or int): the time of the new entry.
         """
         status = self.__monitor[host]
-        delta_time = time_difference(status[self.__LAST_EVENT], time)
+        delta_time = self.__difference(status[self.__LAST_EVENT], time)
         if delta_time <= status[self.__TIME_LEFT]:
             if status[self.__CHANCES_LEFT] == 1:
                 self.__monitor.pop(host, None)
@@ -85,17 +106,63 @@ class BlockedHosts(object):
         Given a new entry, update the status of monitor and block dictionaries. Return whether the
         entry needs to be blocked.
         Args:
-            entry(dict): A Apache log dictionary.
+            entry(LogRecord or dict): A Apache log record.
+        Returns:
+            is_blocked: True if the entry needs to be blocked; False otherwise.
+        """
+        if isinstance(entry, dict):
+            entry = read_entry.LogRecord.from_dict(entry)
+        return self.__update(entry[read_entry.HOST], entry[read_entry.TIME],
+                             entry[read_entry.REQUEST], entry[read_entry.STATUS])
+
+    def update_batch(self, batch):
+        """
+        Given a LogBatch, update the status of monitor and block dictionaries in the order of
+        the lines. Only the lines of the hosts that are monitored or blocked, or that fail to
+        login in the batch are checked one by one; the other lines can't change the status.
+        Args:
+            batch(LogBatch): the batch of log items.
+        Returns:
+            blocked(list): the indices of the lines in the batch that need to be blocked.
+        Raises:
+            NotImplementedError: Error occurs when the BlockedHosts is not in epoch mode or
+            has no vocabulary of the resources.
+        """
+        if self.__difference is not epoch_difference or self.__resources is None:
+            raise NotImplementedError("update_batch needs epoch=True and resources")
+        if len(batch) == 0:
+            return []
+        login = self.__login()
+        hosts = list(self.__block) + list(self.__monitor)
+        if login is not None:
+            failed = (batch.status == 401) & (batch.request == login)
+            hosts.extend(np.unique(batch.host[failed]).tolist())
+        indices = np.flatnonzero(np.in1d(batch.host, np.array(hosts, dtype=np.int64)))
+
+        blocked = []
+        for (idx, host, time, request, status) in zip(
+                indices.tolist(), batch.host[indices].tolist(), batch.time[indices].tolist(),
+                batch.request[indices].tolist(), batch.status[indices].tolist()):
+            if self.__update(host, time, request, status):
+                blocked.append(idx)
+        return blocked
+
+    def __update(self, host, time, request, status):
+        """
+        Update the status of monitor and block dictionaries with the fields of an entry.
+        Args:
+            host: the host of the entry.
+            time(datetime or int): the time of the entry.
+            request: the request of the entry.
+            status(int): the status of the entry.
         Returns:
             is_blocked: True if the entry needs to be blocked; False otherwise.
         """
-        host = entry["Host"]
-        time = entry["Time"]
         is_blocked = False
         if host in self.__block:
             is_blocked = self.__update_block(host, time)
         else:
-            if entry["Request"] == "/login" and entry["Status"] == 401:
+            if status == 401 and request == self.__login():
                 if host in self.__monitor:
                     self.__update_monitor(host, time)
                 else:
@@ -105,6 +172,148 @@ class BlockedHosts(object):
                     self.__monitor.pop(host, None)
         return is_blocked
 
+    def merge(self, other, hosts=None, replay=None):
+        """
+        Merge another BlockedHosts that is updated with the entries following the entries of
+        this one (e.g. the next part of the log file), starting with no host monitored or
+        blocked. The status of other is exact for all hosts except the hosts monitored or
+        blocked by this one at the end. The entries of those hosts are replayed from their
+        status in this one, and side by side from an empty status like in other, until the
+        two status are the same; after that the status of other is exact for them too. The
+        entries of all those hosts are replayed in one pass, which stops once every host
+        reaches the same status, and the hosts without entries in other aren't replayed.
+        Args:
+            other(BlockedHosts): the BlockedHosts of the following entries.
+            hosts(list): if the hosts are IDs, hosts[idx] is the ID in this BlockedHosts of
+                the host ID idx in other (utility.Vocabulary.merge).
+            replay(function): replay(hosts) returns an iterable of (key, entry) for the
+                entries of any of the hosts (a set) that other is updated with, in order.
+                entry is the LogRecord or dict with the IDs of this BlockedHosts, key
+                identifies the entry.
+        Returns:
+            changed(list): a list of (key, is_blocked) for the replayed entries that need to
+                be blocked while other decided not to, or the other way around.
+        Raises:
+            ValueError: Error occurs when replay is not given but there are monitored or
+            blocked hosts.
+        """
+        carried = (self.__monitor, self.__block)
+        self.__monitor = {}
+        self.__block = {}
+        for (status, other_status) in ((self.__monitor, other.__monitor),
+                                       (self.__block, other.__block)):
+            for (host, value) in other_status.iteritems():
+                if hosts is not None:
+                    host = hosts[host]
+                status[host] = list(value)
+
+        pending = {}
+        for host in set(carried[0]) | set(carried[1]):
+            current = self.__empty()
+            if host in carried[0]:
+                current.__monitor[host] = carried[0][host]
+            else:
+                current.__block[host] = carried[1][host]
+            pending[host] = (current, self.__empty())
+        if pending and hosts is not None:
+            # the hosts that other has never seen keep their status
+            present = set(hosts)
+            for host in [host for host in pending if host not in present]:
+                self.__carry(host, pending.pop(host)[0])
+        if pending and replay is None:
+            raise ValueError("replay is needed to merge with monitored or blocked hosts")
+
+        changed = []
+        if pending:
+            for (key, entry) in replay(set(pending)):
+                if isinstance(entry, dict):
+                    entry = read_entry.LogRecord.from_dict(entry)
+                host = entry[read_entry.HOST]
+                if host not in pending:
+                    continue
+                (current, fresh) = pending[host]
+                is_blocked = current.update(entry)
+                if is_blocked != fresh.update(entry):
+                    changed.append((key, is_blocked))
+                if current.__status(host) == fresh.__status(host):
+                    del pending[host]
+                    if not pending:
+                        break
+        # other doesn't reach the status of these hosts before their last entries
+        for (host, (current, _)) in pending.iteritems():
+            self.__carry(host, current)
+        return changed
+
+    def tracked(self):
+        """
+        Get the numbers of hosts being tracked, e.g. to watch the memory.
+        Returns:
+            (monitored, blocked): the numbers of hosts in the monitor and block dictionaries.
+        """
+        return (len(self.__monitor), len(self.__block))
+
+    def blocked(self, time):
+        """
+        Get the hosts that are blocked at a time, e.g. the time of the last entry.
+        Args:
+            time(datetime or int): the time.
+        Returns:
+            A list of tuples. In each tuple, the first element is the host, the second item
+            is the number of seconds left until the block ends. The hosts blocked the longest
+            come first.
+        """
+        hosts = []
+        for (host, status) in self.__block.items():
+            left = status[self.__TIME_LEFT] - self.__difference(status[self.__LAST_EVENT], time)
+            if left >= 0:
+                hosts.append((host, left))
+        hosts.sort(key=lambda item: (item[1], item[0]), reverse=True)
+        return hosts
+
+    def __empty(self):
+        """
+        Create a BlockedHosts with the same settings and no host monitored or blocked.
+        Returns:
+            BlockedHosts object.
+        """
+        return BlockedHosts(self.__monitor_time, self.__block_time, self.__chances, self.__epoch,
+                            self.__resources)
+
+    def __carry(self, host, current):
+        """
+        Set the status of a host to its status in another BlockedHosts.
+        Args:
+            host: the host.
+            current(BlockedHosts): the BlockedHosts with the status of the host.
+        """
+        self.__monitor.pop(host, None)
+        self.__block.pop(host, None)
+        if host in current.__monitor:
+            self.__monitor[host] = current.__monitor[host]
+        if host in current.__block:
+            self.__block[host] = current.__block[host]
+
+    def __status(self, host):
+        """
+        Get the status of a host.
+        Args:
+            host: the host.
+        Returns:
+            (monitor, block): the values of the host in the monitor and block dictionaries,
+            None if the host is not in the dictionary.
+        """
+        return (self.__monitor.get(host), self.__block.get(host))
+
+    def __login(self):
+        """
+        Get the key of the login resource.
+        Returns:
+            "/login", or its ID if the requests are integer IDs.
+        """
+        if self.__resources is None:
+            return "/login"
+        return self.__resources.get("/login")
+
 def time_difference(time_before, time_after):
     """
     Calculate the difference between two time variables in units of seconds.
@@ -116,6 +325,17 @@ def time_difference(time_before, time_after):
     """
     return (time_after-time_before).total_seconds()
 
+def epoch_difference(time_before, time_after):
+    """
+    Calculate the difference between two times in epoch seconds.
+    Args:
+        time_before(int): time in epoch seconds that happens earlier
+        time_after(int): time in epoch seconds that happens later
+    Returns:
+        diff_time(int): the time difference in units of seconds
+    """
+    return time_after-time_before
+
 class TestBlockedHosts(unittest.TestCase):
     def setUp(self):
         time = []
@@ -160,6 +380,101 @@ class TestBlockedHosts(unittest.TestCase):
             is_blocked = blocked.update(entry)
             if is_blocked:
                 id_list.append(i)
+        self.assertEqual(tuple(id_list), (5, 6, 8, 9))
+
+    def test_blocked(self):
+        blocked = BlockedHosts()
+        for entry in self.data[:10]:
+            blocked.update(entry)
+        self.assertEqual(blocked.blocked(self.time[9]), [("A", 287)])
+        self.assertEqual(blocked.blocked(self.time[10]), [])
+
+    def test_update_vocabulary(self):
+        resources = utility.Vocabulary()
+        blocked = BlockedHosts(resources=resources)
+        id_list = []
+        for i in range(len(self.data)):
+            entry = dict(self.data[i])
+            entry["Request"] = resources[entry["Request"]]
+            is_blocked = blocked.update(entry)
+            if is_blocked:
+                id_list.append(i)
+        self.assertEqual(tuple(id_list), (5, 6, 8, 9))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_update_batch(self):
+        hosts = utility.Vocabulary()
+        resources = utility.Vocabulary()
+        lines = []
+        for entry in self.data:
+            lines.append('{0} - - [{1} -0400] "GET {2} HTTP/1.0" {3} 0'.format(
+                entry["Host"], entry["Time"].strftime("%d/%b/%Y:%H:%M:%S"),
+                entry["Request"], entry["Status"]))
+        blocked = BlockedHosts(epoch=True, resources=resources)
+        id_list = blocked.update_batch(read_entry.read_batch(lines[:6], hosts, resources))
+        id_list += [6+i for i in blocked.update_batch(read_entry.read_batch(lines[6:], hosts,
+                                                                            resources))]
+        self.assertEqual(tuple(id_list), (5, 6, 8, 9))
+
+    def test_merge(self):
+        resources = utility.Vocabulary()
+        data = []
+        for entry in self.data:
+            entry = dict(entry)
+            entry["Time"] = calendar.timegm(entry["Time"].timetuple())
+            entry["Request"] = resources[entry["Request"]]
+            data.append(entry)
+        for split in range(len(data)):
+            blocked = BlockedHosts(epoch=True, resources=resources)
+            id_list = [i for i in range(split) if blocked.update(data[i])]
+            other = BlockedHosts(epoch=True, resources=resources)
+            other_list = [i for i in range(split, len(data)) if other.update(data[i])]
+
+            def replay(hosts):
+                return [(i, data[i]) for i in range(split, len(data))
+                        if data[i]["Host"] in hosts]
+            for (i, is_blocked) in blocked.merge(other, replay=replay):
+                if is_blocked:
+                    other_list.append(i)
+                else:
+                    other_list.remove(i)
+            self.assertEqual(tuple(sorted(id_list + other_list)), (5, 6, 8, 9))
+            self.assertEqual(blocked.update(data[-1]), False)
+
+        blocked = BlockedHosts(epoch=True, resources=resources)
+        blocked.update(data[0])
+        self.assertRaises(ValueError, blocked.merge, BlockedHosts(epoch=True))
+
+        # one pass for all the carried hosts, none for the hosts other hasn't seen
+        blocked = BlockedHosts(epoch=True, resources=resources)
+        for entry in data[:6]:
+            blocked.update(entry)
+        hosts = sorted(set(entry["Host"] for entry in data[:6]))
+        calls = []
+
+        def replay_once(hosts):
+            calls.append(hosts)
+            return [(i, data[i]) for i in range(6, len(data)) if data[i]["Host"] in hosts]
+        blocked.merge(BlockedHosts(epoch=True, resources=resources), hosts=[],
+                      replay=replay_once)
+        self.assertEqual(calls, [])
+        self.assertEqual(blocked.update(data[6]), True)
+        blocked = BlockedHosts(epoch=True, resources=resources)
+        for entry in data[:6]:
+            blocked.update(entry)
+        blocked.merge(BlockedHosts(epoch=True, resources=resources), hosts=hosts,
+                      replay=replay_once)
+        self.assertEqual(len(calls), 1)
+
+    def test_update_epoch(self):
+        blocked = BlockedHosts(epoch=True)
+        id_list = []
+        for i in range(len(self.data)):
+            entry = dict(self.data[i])
+            entry["Time"] = calendar.timegm(entry["Time"].timetuple())
+            is_blocked = blocked.update(read_entry.LogRecord.from_dict(entry))
+            if is_blocked:
+                id_list.append(i)
         self.assertEqual(tuple(id_list), (5, 6, 8, 9))
                 #log.info("UnitTest: To block: {0}".format(entry))
 
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+This module contains:
+    save_checkpoint():
+        A function that saves the LogAnalysis of the start of a log file into a checkpoint.
+    load_checkpoint():
+        A function that loads the LogAnalysis from a checkpoint, if the log file still starts
+        with the bytes that are read into it.
+    complete_lines():
+        A function that returns the end of the last complete line of a log file.
+A checkpoint is a pickle file with the LogAnalysis (before it is finalized), the byte offset
+up to which the log file is read, and the signature of the bytes before the offset. When
+lines are appended to the log file, e.g. every day, a later run loads the checkpoint and only
+reads the lines after the offset. The results are the same as reading the whole log file.
+The signature only hashes the first and the last block before the offset, so checking it
+doesn't read the whole log file.
+Author: Yuan Huang
+"""
+
+import os
+import hashlib
+import shutil
+import tempfile
+import unittest
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import log_analysis
+
+CHECKPOINT_VERSION = 5
+HASH_BLOCK_SIZE = 1 << 16
+
+def offset_signature(data, offset):
+    """
+    Get the signature of the bytes of a log file before an offset.
+    Args:
+        data(mmap or str): the content of the log file.
+        offset(int): the byte offset.
+    Returns:
+        signature(dict): the offset and the md5 hashes of the first and the last
+            HASH_BLOCK_SIZE bytes before the offset.
+    """
+    head = data[:min(offset, HASH_BLOCK_SIZE)]
+    tail = data[max(offset - HASH_BLOCK_SIZE, 0):offset]
+    return {"offset": offset, "head": hashlib.md5(head).hexdigest(),
+            "tail": hashlib.md5(tail).hexdigest()}
+
+def complete_lines(data, size):
+    """
+    Get the end of the last complete line of a log file. A line without the new line
+    character at the end of the file may still be written, so it is left to the next run.
+    Args:
+        data(mmap or str): the content of the log file, None if the file is empty.
+        size(int): the size of the log file.
+    Returns:
+        end(int): the byte position after the last new line character.
+    """
+    if data is None or size == 0:
+        return 0
+    if data[size-1:size] == b"\n":
+        return size
+    return data.rfind(b"\n", 0, size) + 1
+
+def save_checkpoint(path, analysis, data, offset):
+    """
+    Save the LogAnalysis of the start of a log file into a checkpoint. The checkpoint is
+    written to a temporary file first and moved into place, so an unfinished checkpoint is
+    never loaded.
+    Args:
+        path(str): the name of the checkpoint file.
+        analysis(LogAnalysis): the LogAnalysis that is not finalized yet.
+        data(mmap or str): the content of the log file, None if the file is empty.
+        offset(int): the byte offset up to which the log file is read into analysis.
+    """
+    state = {"version": CHECKPOINT_VERSION,
+             "signature": offset_signature(data or b"", offset),
+             "analyzers": analysis.analyzers,
+             "capacity": analysis.capacity,
+             "group_by": analysis.group_by,
+             "time_histogram": analysis.time_histogram,
+             "analysis": analysis}
+    (handle, temp) = tempfile.mkstemp(prefix=os.path.basename(path) + ".",
+                                      dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(handle, "wb") as writer:
+            pickle.dump(state, writer, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp, path)
+    except:
+        os.remove(temp)
+        raise
+
+def load_checkpoint(path, data, size, analyzers, log=None, quarantine=None, capacity=None,
+                    group_by=None, time_histogram=False):
+    """
+    Load the LogAnalysis from a checkpoint of a log file.
+    Args:
+        path(str): the name of the checkpoint file.
+        data(mmap or str): the content of the log file, None if the file is empty.
+        size(int): the size of the log file.
+        analyzers(list): the names of the analyzers that should run.
+        log(logging.Logger): the logger of the loaded LogAnalysis.
+        quarantine(Quarantine): the Quarantine of the loaded LogAnalysis.
+        capacity(int): the capacity of the top hosts and resources (LogAnalysis).
+        group_by(list): the fields to group by (LogAnalysis).
+        time_histogram(bool): True if the TimeWindow keeps the counts of the seconds
+            (LogAnalysis).
+    Returns:
+        (analysis, offset): the LogAnalysis and the byte offset to continue reading the log
+            file from, or None if there is no checkpoint, the checkpoint can't be read, or
+            it is not of the same analyzers, capacity, fields to group by and TimeWindow mode
+            or of the start of the log file.
+    """
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "rb") as reader:
+            state = pickle.load(reader)
+    except Exception:
+        return None
+    if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION or \
+       state["analyzers"] != analyzers or state["capacity"] != capacity or \
+       state["group_by"] != [tuple(fields) for fields in group_by or []] or \
+       state["time_histogram"] != time_histogram:
+        return None
+    offset = state["signature"]["offset"]
+    if offset > size or offset_signature(data or b"", offset) != state["signature"]:
+        return None
+    analysis = state["analysis"]
+    analysis.set_log(log, quarantine)
+    return (analysis, offset)
+
+class TestCheckpoint(unittest.TestCase):
+    """
+    Unittest Class for saving and loading the checkpoints.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "checkpoint")
+        self.lines = []
+        for second in range(0, 300, 3):
+            (host, request, status) = ("A", "/login", 401) if second % 60 < 9 else \
+                                      ("B" if second % 2 else "C", "/x", 200)
+            self.lines.append('{0} - - [01/Jul/1995:00:{1:02d}:{2:02d} -0400] "GET {3} HTTP/1.0" '
+                              '{4} 10\n'.format(host, second // 60, second % 60, request, status))
+        self.data = b"".join(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_complete_lines(self):
+        self.assertEqual(complete_lines(None, 0), 0)
+        self.assertEqual(complete_lines(b"a\nb\n", 4), 4)
+        self.assertEqual(complete_lines(b"a\nb", 3), 2)
+        self.assertEqual(complete_lines(b"ab", 2), 0)
+
+    def test_resume(self):
+        expected = log_analysis.LogAnalysis()
+        for line in self.lines:
+            expected.update(line)
+        expected.finalize()
+
+        for split in (0, 1, 37, len(self.lines)):
+            analysis = log_analysis.LogAnalysis()
+            for line in self.lines[:split]:
+                analysis.update(line)
+            offset = len(b"".join(self.lines[:split]))
+            save_checkpoint(self.path, analysis, self.data[:offset], offset)
+
+            (analysis, start) = load_checkpoint(self.path, self.data, len(self.data),
+                                                analysis.analyzers)
+            self.assertEqual(start, offset)
+            for line in self.data[start:].splitlines(True):
+                analysis.update(line)
+            analysis.finalize()
+            self.assertEqual(analysis.blocked_entries, expected.blocked_entries)
+            self.assertEqual(analysis.hosts.top(3, 0), expected.hosts.top(3, 0))
+            self.assertEqual(analysis.time_window.top(), expected.time_window.top())
+            self.assertEqual(analysis.time_window.top_no_overlap(),
+                             expected.time_window.top_no_overlap())
+            self.assertEqual(analysis.time_stat.get_hourly_hosts(),
+                             expected.time_stat.get_hourly_hosts())
+
+    def test_outdated(self):
+        analysis = log_analysis.LogAnalysis()
+        self.assertEqual(load_checkpoint(self.path, self.data, len(self.data),
+                                         analysis.analyzers), None)
+        save_checkpoint(self.path, analysis, self.data, 100)
+        self.assertEqual(load_checkpoint(self.path, self.data, 99, analysis.analyzers), None)
+        self.assertEqual(load_checkpoint(self.path, b"x" + self.data[1:], len(self.data),
+                                         analysis.analyzers), None)
+        self.assertEqual(load_checkpoint(self.path, self.data, len(self.data), ["hosts"]), None)
+        self.assertEqual(load_checkpoint(self.path, self.data, len(self.data),
+                                         analysis.analyzers, capacity=100), None)
+        self.assertEqual(load_checkpoint(self.path, self.data, len(self.data),
+                                         analysis.analyzers, group_by=[(0,)]), None)
+        self.assertEqual(load_checkpoint(self.path, self.data, len(self.data),
+                                         analysis.analyzers, time_histogram=True), None)
+        self.assertEqual(load_checkpoint(self.path, self.data, len(self.data),
+                                         analysis.analyzers)[1], 100)
+        with open(self.path, "wb") as writer:
+            writer.write(b"broken")
+        self.assertEqual(load_checkpoint(self.path, self.data, len(self.data),
+                                         analysis.analyzers), None)
+
+if __name__ == '__main__':
+    unittest.main()
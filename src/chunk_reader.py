@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the classes to read a log file in large chunks of lines.
+    ChunkReader:
+        Read a log file through a memory map. The edges of the chunks are aligned to the new
+        lines, so a byte range of the file that starts at the start of a line can be read on
+        its own, e.g. by a worker process.
+    CompressedReader:
+        Read a gzip, bz2 or xz compressed log file from start to end. The file is
+        decompressed by a background thread into a bounded queue of chunks.
+    open_reader():
+        A function that opens a log file with the reader for its compression.
+    reraise():
+        A function that raises an exception again with its traceback, e.g. in another
+        thread, on both Python 2 and Python 3.
+Author: Yuan Huang
+"""
+
+import os
+import sys
+import mmap
+import gzip
+import bz2
+import shutil
+import tempfile
+import threading
+import unittest
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if sys.version_info[0] < 3:
+    # The three-argument raise is a syntax error on Python 3, so it is compiled at run time.
+    exec("def reraise(error_type, error, trace):\n"
+         "    raise error_type, error, trace\n")
+else:
+    def reraise(error_type, error, trace):
+        """
+        Raise an exception again with its traceback.
+        Args:
+            error_type, error, trace: the exception info (sys.exc_info()).
+        """
+        raise error.with_traceback(trace)
+
+# The default number of bytes in a chunk.
+CHUNK_SIZE = 1 << 24
+
+# The maximum number of decompressed chunks waiting in the queue of a CompressedReader.
+QUEUE_SIZE = 4
+
+# The magic bytes at the start of the compressed files.
+MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"))
+
+def compression(infile):
+    """
+    Detect the compression of a file from its first bytes.
+    Args:
+        infile(str): the name of the file.
+    Returns:
+        "gzip", "bz2", "xz", or None if the file is not compressed.
+    """
+    with open(infile, "rb") as reader:
+        head = reader.read(6)
+    for (magic, name) in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+def open_reader(infile, chunk_size=CHUNK_SIZE):
+    """
+    Open a log file with a CompressedReader if it is compressed, or a ChunkReader otherwise.
+    Args:
+        infile(str): the name of the file.
+        chunk_size(int): the number of bytes in a chunk.
+    Returns:
+        ChunkReader or CompressedReader object.
+    """
+    if compression(infile) is not None:
+        return CompressedReader(infile, chunk_size)
+    return ChunkReader(infile, chunk_size)
+
+class ChunkReader(object):
+    """
+    The class that memory-maps a file and reads its lines in chunks.
+    Example: with ChunkReader(infile) as reader:
+                 for (lines, positions) in reader.batches(10000): ...
+    Args:
+        infile(str): the name of the file.
+        chunk_size(int): the number of bytes in a chunk; a chunk is extended to the end of
+            its last line.
+    Public variables:
+        size(int): the size of the file in bytes.
+        data(mmap): the memory map of the file, None if the file is empty.
+    """
+    def __init__(self, infile, chunk_size=CHUNK_SIZE):
+        self.__chunk_size = chunk_size
+        self.__file = open(infile, "rb")
+        self.size = os.fstat(self.__file.fileno()).st_size
+        self.data = None
+        if self.size > 0:
+            self.data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        """
+        Close the memory map and the file.
+        """
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def align(self, position):
+        """
+        Get the start of the first line at or after a byte position.
+        Args:
+            position(int): the byte position.
+        Returns:
+            start(int): the byte position of the start of the line, or the size of the file
+                if there is no line after the position.
+        """
+        if position <= 0:
+            return 0
+        if position >= self.size:
+            return self.size
+        end = self.data.find(b"\n", position - 1)
+        if end < 0:
+            return self.size
+        return end + 1
+
+    def split(self, parts):
+        """
+        Split the file into byte ranges of about the same size, at the starts of lines.
+        Args:
+            parts(int): the number of ranges.
+        Returns:
+            ranges(list): a list of (start, end) byte positions, empty ranges are dropped.
+        """
+        starts = [self.align(self.size * idx // parts) for idx in range(parts)] + [self.size]
+        return [(start, end) for (start, end) in zip(starts[:-1], starts[1:]) if start < end]
+
+    def chunks(self, start=0, end=None):
+        """
+        Read a byte range of the file in chunks that end at the end of a line.
+        Args:
+            start(int): the start of a line.
+            end(int): the end of the range, the start of a line or the size of the file.
+        Returns:
+            A generator of (position, chunk), the byte position and the content of the chunk.
+        """
+        if end is None:
+            end = self.size
+        while start < end:
+            stop = self.align(min(start + self.__chunk_size, end))
+            stop = min(max(stop, start + 1), end)
+            yield (start, self.data[start:stop])
+            start = stop
+
+    def batches(self, batch_size, start=0, end=None):
+        """
+        Read the lines in a byte range of the file in batches. A batch doesn't cross the edge
+        of a chunk, so the last batch of a chunk may be smaller.
+        Args:
+            batch_size(int): the maximum number of lines in a batch.
+            start(int), end(int): the byte range, see ChunkReader.chunks.
+        Returns:
+            A generator of (lines, positions), positions are the byte positions of the lines
+            (a numpy array if numpy is installed).
+        """
+        for (position, chunk) in self.chunks(start, end):
+            lines = list(BytesIO(chunk))
+            positions = self.__positions(position, chunk, lines)
+            for idx in range(0, len(lines), batch_size):
+                yield (lines[idx:idx+batch_size], positions[idx:idx+batch_size])
+
+    @staticmethod
+    def __positions(position, chunk, lines):
+        """
+        Get the byte positions of the lines of a chunk.
+        Args:
+            position(int): the byte position of the chunk.
+            chunk(str): the content of the chunk.
+            lines(list): the lines of the chunk.
+        Returns:
+            positions(numpy.ndarray or list): the byte positions of the lines.
+        """
+        if np is not None:
+            ends = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord(b"\n"))
+            positions = np.empty(len(lines), dtype=np.int64)
+            positions[0] = position
+            positions[1:] = ends[:len(lines)-1] + (position + 1)
+            return positions
+        positions = []
+        for line in lines:
+            positions.append(position)
+            position += len(line)
+        return positions
+
+    def lines(self, start=0, end=None):
+        """
+        Read the lines in a byte range of the file one by one.
+        Args:
+            start(int), end(int): the byte range, see ChunkReader.chunks.
+        Returns:
+            A generator of the lines.
+        """
+        for (_, chunk) in self.chunks(start, end):
+            for line in BytesIO(chunk):
+                yield line
+
+class CompressedReader(ChunkReader):
+    """
+    The class that reads a compressed log file in chunks of lines. The chunks are decompressed
+    by a background thread, so the decompression overlaps with the parsing of the lines;
+    at most QUEUE_SIZE chunks are waiting in memory. The file can only be read once from the
+    start, and the byte positions are in the decompressed content.
+    Args:
+        infile(str): the name of the file.
+        chunk_size(int): the number of bytes decompressed at once.
+    Public variables:
+        size(int): the number of decompressed bytes that are read so far.
+        data: None, the content can't be indexed.
+    Raises:
+        ImportError: Error occurs when the file is compressed with xz and lzma is not installed.
+    """
+    def __init__(self, infile, chunk_size=CHUNK_SIZE):
+        method = compression(infile)
+        if method == "gzip":
+            self.__file = gzip.GzipFile(infile, "rb")
+        elif method == "bz2":
+            self.__file = bz2.BZ2File(infile, "rb")
+        elif method == "xz":
+            if lzma is None:
+                raise ImportError("lzma is required to read the xz compressed file")
+            self.__file = lzma.LZMAFile(infile, "rb")
+        else:
+            raise IOError("The file {0} is not compressed".format(infile))
+        self.__chunk_size = chunk_size
+        self.size = 0
+        self.data = None
+        self.__queue = queue.Queue(QUEUE_SIZE)
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__decompress)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __decompress(self):
+        """
+        Decompress the file chunk by chunk into the queue, until the end of the file or
+        until the reader is closed. An error is passed to the queue to be raised by chunks().
+        """
+        try:
+            while not self.__stop.is_set():
+                block = self.__file.read(self.__chunk_size)
+                self.__put(block)
+                if not block:
+                    break
+        except Exception:
+            self.__put(sys.exc_info())
+
+    def __put(self, item):
+        """
+        Put an item into the queue, waiting until there is space or the reader is closed.
+        Args:
+            item: the decompressed block, or the information of an error.
+        """
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        """
+        Stop the decompression thread and close the file.
+        """
+        self.__stop.set()
+        self.__thread.join()
+        self.__file.close()
+
+    def align(self, position):
+        raise NotImplementedError("a compressed file can't be read from a byte position")
+
+    def split(self, parts):
+        raise NotImplementedError("a compressed file can't be split")
+
+    def chunks(self, start=0, end=None):
+        """
+        Read the decompressed content in chunks that end at the end of a line.
+        Args:
+            start(int), end(int): only the whole file (start=0, end=None) can be read.
+        Returns:
+            A generator of (position, chunk), the byte position and the content of the chunk.
+        Raises:
+            NotImplementedError: Error occurs when a byte range is given.
+        """
+        if start != 0 or end is not None:
+            raise NotImplementedError("a compressed file can't be read from a byte position")
+        rest = b""
+        while True:
+            block = self.__queue.get()
+            if isinstance(block, tuple):
+                reraise(*block)
+            if not block:
+                break
+            # The last incomplete line is kept until the next block.
+            stop = block.rfind(b"\n") + 1
+            if stop == 0:
+                rest += block
+                continue
+            chunk = rest + block[:stop]
+            rest = block[stop:]
+            yield (self.size, chunk)
+            self.size += len(chunk)
+        if rest:
+            yield (self.size, rest)
+            self.size += len(rest)
+
+class TestChunkReader(unittest.TestCase):
+    """
+    Unittest Class for reading a file in chunks.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.infile = os.path.join(self.directory, "log.txt")
+        self.lines = ["line {0}\n".format("x" * idx) for idx in range(20)] + ["last"]
+        with open(self.infile, "w") as writer:
+            writer.writelines(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_batches(self):
+        with ChunkReader(self.infile, chunk_size=50) as reader:
+            lines = []
+            for (batch, positions) in reader.batches(3):
+                self.assertTrue(len(batch) <= 3)
+                for (line, position) in zip(batch, positions):
+                    self.assertEqual(reader.data[position:position+len(line)], line)
+                lines.extend(batch)
+            self.assertEqual(lines, self.lines)
+            self.assertEqual(list(reader.lines()), self.lines)
+
+    def test_split(self):
+        with ChunkReader(self.infile, chunk_size=7) as reader:
+            self.assertEqual(reader.align(1), len(self.lines[0]))
+            self.assertEqual(reader.align(len(self.lines[0])), len(self.lines[0]))
+            for parts in (1, 3, 50):
+                ranges = reader.split(parts)
+                self.assertEqual(ranges[0][0], 0)
+                self.assertEqual(ranges[-1][1], reader.size)
+                lines = []
+                for (start, end) in ranges:
+                    lines.extend(reader.lines(start, end))
+                self.assertEqual(lines, self.lines)
+
+    def test_compressed(self):
+        for (method, open_file) in (("gzip", gzip.GzipFile), ("bz2", bz2.BZ2File)):
+            infile = self.infile + "." + method
+            writer = open_file(infile, "wb")
+            writer.writelines(self.lines)
+            writer.close()
+            self.assertEqual(compression(infile), method)
+            with open_reader(infile, chunk_size=7) as reader:
+                self.assertTrue(isinstance(reader, CompressedReader))
+                lines = []
+                for (batch, positions) in reader.batches(4):
+                    lines.extend(batch)
+                self.assertEqual(lines, self.lines)
+                self.assertEqual(positions[-1], reader.size - len(self.lines[-1]))
+            with open_reader(infile, chunk_size=7) as reader:
+                self.assertEqual(next(reader.lines()), self.lines[0])
+        self.assertEqual(compression(self.infile), None)
+        self.assertTrue(isinstance(open_reader(self.infile), ChunkReader))
+
+    def test_corrupt(self):
+        infile = self.infile + ".gzip"
+        writer = gzip.GzipFile(infile, "wb")
+        writer.writelines(self.lines)
+        writer.close()
+        with open(infile, "rb") as reader:
+            data = reader.read()
+        with open(infile, "wb") as writer:
+            writer.write(data[:len(data) // 2])
+        with open_reader(infile, chunk_size=7) as reader:
+            self.assertRaises((IOError, EOFError), list, reader.lines())
+
+    def test_empty(self):
+        open(self.infile, "w").close()
+        with ChunkReader(self.infile) as reader:
+            self.assertEqual(reader.split(4), [])
+            self.assertEqual(list(reader.lines()), [])
+
+if __name__ == '__main__':
+    unittest.main()
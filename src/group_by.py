@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class to group the log entries by any combination of their fields, e.g. by
+(status, request_type) or by (host, status), and to sum up the number of requests, the bytes
+and the smallest and largest sizes of each group in one pass.
+The key of a group is the tuple of the integer codes of its fields: the hosts and the
+resources are their vocabulary IDs and the request types are coded by
+read_entry.REQUEST_TYPE_CODES, so the keys are compact and are only decoded for the outputs.
+Each group gets a dense number when it is first seen, and its sums are kept in arrays.
+Global Variables:
+    FIELDS
+    COUNT
+    BYTES
+    MIN
+    MAX
+Functions:
+    parse_fields()
+Author: Yuan Huang
+"""
+import array
+import operator
+import pickle
+import unittest
+from collections import OrderedDict
+import utility
+import read_entry
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The fields that can be grouped by, by name, with their indices in the LogRecord. The user
+# is not kept in a LogBatch, so it can't be grouped by.
+FIELDS = OrderedDict((name, idx) for (idx, name) in enumerate(read_entry.LogRecord._fields)
+                     if idx != read_entry.USER)
+
+# COUNT, BYTES, MIN and MAX are public variables which can be used when set the sorting
+# method in the GroupBy.top() function, and are the indices of the sums it returns.
+# COUNT: The number of requests of a group
+# BYTES: The total bytes of a group
+# MIN, MAX: The smallest and the largest size of a request of a group
+(COUNT, BYTES, MIN, MAX) = range(4)
+
+def parse_fields(text):
+    """
+    Get the fields to group by from their names, e.g. "status,request_type".
+    Args:
+        text(str): the comma-separated names of the fields in FIELDS.
+    Returns:
+        fields(tuple): the indices of the fields in the LogRecord.
+    Raises:
+        KeyError: Error occurs when a field is unknown.
+        ValueError: Error occurs when there is no field or a field is repeated.
+    """
+    names = [name.strip().lower() for name in text.split(",") if name.strip()]
+    fields = tuple(FIELDS[name] for name in names)
+    if not fields or len(set(fields)) != len(fields):
+        raise ValueError("The fields to group by should be distinct: {0}".format(text))
+    return fields
+
+class GroupBy(object):
+    """
+    The class that sums up the entries of each group of the values of some fields.
+    Example: groups = GroupBy((read_entry.STATUS, read_entry.REQUEST_TYPE))
+             groups.update(entry)
+             groups.top(10, COUNT)
+    Args:
+        fields(tuple): the indices of the fields in the LogRecord, e.g. from parse_fields().
+        hosts(utility.Vocabulary), resources(utility.Vocabulary): if the hosts or the
+            requests of the entries are integer IDs, the vocabularies to get their names.
+    Public variables:
+        fields(tuple): see Args.
+        name(str): the names of the fields joined by "_", e.g. "status_request_type".
+    """
+    class __Names(object):
+        """
+        The decoded keys of the groups by their numbers, to break ties in top().
+        """
+        def __init__(self, groups):
+            self.__groups = groups
+
+        def __getitem__(self, group):
+            return self.__groups.decode(group)
+
+    def __init__(self, fields, hosts=None, resources=None):
+        """
+        Private members:
+            __names(list): the vocabulary to decode each field, None if the values are kept.
+            __get(function): get the values of the fields from a LogRecord.
+            __type(int): the position of the request type in the key, None if it is not a
+                field.
+            __groups(dict): the key of a group as its key, the number of the group as value.
+            __keys(list): the key of each group by its number.
+            __columns(tuple): the number of requests, the bytes and the smallest and largest
+                sizes of each group, in array('l') indexed by the number of the group.
+        """
+        self.fields = tuple(fields)
+        self.name = "_".join(read_entry.LogRecord._fields[field] for field in self.fields)
+        vocabularies = {read_entry.HOST: hosts, read_entry.REQUEST: resources}
+        self.__names = [vocabularies.get(field) for field in self.fields]
+        self.__get = self.__getter()
+        self.__type = (self.fields.index(read_entry.REQUEST_TYPE)
+                       if read_entry.REQUEST_TYPE in self.fields else None)
+        self.__groups = {}
+        self.__keys = []
+        self.__columns = tuple(array.array('l') for _ in range(4))
+
+    def __len__(self):
+        """
+        Get the number of groups.
+        """
+        return len(self.__keys)
+
+    def __getstate__(self):
+        """
+        Get the state to pickle, e.g. into a checkpoint. The getter of the fields is a
+        lambda, it is made again when unpickled.
+        """
+        state = self.__dict__.copy()
+        del state["_GroupBy__get"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__get = self.__getter()
+
+    def __getter(self):
+        """
+        Make the function to get the values of the fields from a LogRecord, as a tuple.
+        """
+        if len(self.fields) == 1:
+            field = self.fields[0]
+            return lambda entry: (entry[field],)
+        return operator.itemgetter(*self.fields)
+
+    def __add(self, key, count, total, low, high):
+        """
+        Add the sums of some entries into a group, create the group if it is new.
+        Args:
+            key(tuple): the key of the group.
+            count(int), total(int), low(int), high(int): the number of the entries, their
+                bytes and their smallest and largest sizes.
+        """
+        (counts, totals, lows, highs) = self.__columns
+        group = self.__groups.get(key)
+        if group is None:
+            self.__groups[key] = len(self.__keys)
+            self.__keys.append(key)
+            counts.append(count)
+            totals.append(total)
+            lows.append(low)
+            highs.append(high)
+            return
+        counts[group] += count
+        totals[group] += total
+        if low < lows[group]:
+            lows[group] = low
+        if high > highs[group]:
+            highs[group] = high
+
+    def update(self, entry):
+        """Add the info of entry into the sums of its group.
+        Args:
+            entry(LogRecord or dict): the record of a log item.
+        """
+        if isinstance(entry, dict):
+            entry = read_entry.LogRecord.from_dict(entry)
+        key = self.__get(entry)
+        if self.__type is not None:
+            key = list(key)
+            key[self.__type] = read_entry.REQUEST_TYPE_CODES[key[self.__type]]
+            key = tuple(key)
+        size = entry[read_entry.SIZE]
+        self.__add(key, 1, size, size, size)
+
+    def update_batch(self, batch):
+        """Add the info of a LogBatch into the sums of the groups. The entries of each group in
+        the batch are summed up with numpy first, so each group is added to once for each batch.
+        Args:
+            batch(LogBatch): the batch of log items.
+        """
+        if len(batch) == 0:
+            return
+        columns = [getattr(batch, read_entry.LogRecord._fields[field]) for field in self.fields]
+        keys, inverse = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+        # The sizes sorted by group, each group is a slice starting at starts[group].
+        order = np.argsort(inverse, kind="mergesort")
+        sizes = batch.size[order]
+        counts = np.bincount(inverse)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = [counts, np.add.reduceat(sizes, starts), np.minimum.reduceat(sizes, starts),
+                np.maximum.reduceat(sizes, starts)]
+        for (key, count, total, low, high) in zip(keys.tolist(),
+                                                  *[column.tolist() for column in sums]):
+            self.__add(tuple(key), count, total, low, high)
+
+    def merge(self, other, hosts=None, resources=None):
+        """Add the sums of another GroupBy of the same fields, e.g. of another part of the
+        log file. The groups of other that are new are numbered after the groups of this
+        GroupBy, in the order of other.
+        Args:
+            other(GroupBy): the other GroupBy.
+            hosts(list), resources(list): if the hosts or the requests are IDs, hosts[idx]
+                is the ID in this GroupBy of the host ID idx in other, and the same for
+                resources (utility.Vocabulary.merge).
+        """
+        ids = {read_entry.HOST: hosts, read_entry.REQUEST: resources}
+        mapped = [(pos, ids[field]) for (pos, field) in enumerate(self.fields)
+                  if ids.get(field) is not None]
+        (counts, totals, lows, highs) = other.__columns
+        for (group, key) in enumerate(other.__keys):
+            if mapped:
+                key = list(key)
+                for (pos, new_ids) in mapped:
+                    key[pos] = new_ids[key[pos]]
+                key = tuple(key)
+            self.__add(key, counts[group], totals[group], lows[group], highs[group])
+
+    def decode(self, group):
+        """
+        Get the values of the fields of a group.
+        Args:
+            group(int): the number of the group.
+        Returns:
+            values(tuple): the values of the fields, with the names of the hosts, the
+                resources and the request types.
+        """
+        values = list(self.__keys[group])
+        for (pos, names) in enumerate(self.__names):
+            if names is not None:
+                values[pos] = names.names[values[pos]]
+        if self.__type is not None:
+            values[self.__type] = read_entry.REQUEST_TYPE_NAMES[values[self.__type]]
+        return tuple(values)
+
+    def get(self, group):
+        """
+        Get the sums of a group.
+        Args:
+            group(int): the number of the group.
+        Returns:
+            sums(tuple): the number of requests, the bytes and the smallest and largest sizes,
+                indexed by COUNT, BYTES, MIN and MAX.
+        """
+        return tuple(column[group] for column in self.__columns)
+
+    def top(self, number, sort_method=COUNT, per=None):
+        """
+        Get the groups with the largest sums, overall or within each value of some of the
+        fields, e.g. the top hosts of each status when grouping by (host, status).
+        Args:
+            number(int): the number of groups, overall or within each value of per.
+            sort_method: can only take values COUNT, BYTES, MIN or MAX.
+            per(tuple): the indices of some of the fields to get the top groups within each of
+                their values, None for the top groups overall.
+        Returns:
+            A list of tuples. In each tuple, the first element is the values of the fields
+            (GroupBy.decode), the second is the sums of the group (GroupBy.get). The groups
+            are in descending order of the sums within each value of per, and the values of
+            per are in ascending order. The ties are broken by the values of the fields.
+        Raises:
+            NotImplementedError: Error occurs when choosen feature is not COUNT, BYTES, MIN
+                or MAX.
+            ValueError: Error occurs when per is not some of the fields.
+        """
+        if sort_method not in (COUNT, BYTES, MIN, MAX):
+            raise NotImplementedError
+        column = self.__columns[sort_method]
+        names = self.__Names(self)
+        parts = {(): range(len(self.__keys))}
+        if per:
+            positions = [self.fields.index(field) for field in per]
+            parts = {}
+            for (group, key) in enumerate(self.__keys):
+                parts.setdefault(tuple(key[pos] for pos in positions), []).append(group)
+            parts = dict((tuple(self.decode(groups[0])[pos] for pos in positions), groups)
+                         for groups in parts.values())
+        result = []
+        for part in sorted(parts):
+            groups = parts[part]
+            groups, _ = utility.nlargest_array(number, [column[group] for group in groups],
+                                               groups, names)
+            result.extend((self.decode(group), self.get(group)) for group in groups)
+        return result
+
+class TestGroupBy(unittest.TestCase):
+    """
+    Unittest Class for grouping the entries by their fields.
+    """
+    def setUp(self):
+        self.lines = []
+        for (host, request_type, status, size) in [("A", "GET", 200, 10), ("B", "GET", 200, 30),
+                                                   ("A", "POST", 200, 5), ("A", "GET", 404, 0),
+                                                   ("C", "GET", 200, 20), ("B", "HEAD", 304, 0),
+                                                   ("B", "GET", 404, 0), ("A", "GET", 200, 15)]:
+            self.lines.append('{0} - - [01/Jul/1995:00:00:01 -0400] "{1} /x HTTP/1.0" '
+                              '{2} {3}'.format(host, request_type, status, size))
+
+    def check(self, status_type, host_status):
+        self.assertEqual(len(status_type), 4)
+        self.assertEqual(status_type.top(2, COUNT), [((200, "GET"), (4, 75, 10, 30)),
+                                                     ((404, "GET"), (2, 0, 0, 0))])
+        self.assertEqual(status_type.top(1, MIN), [((200, "GET"), (4, 75, 10, 30))])
+        self.assertEqual(host_status.top(1, BYTES, per=(read_entry.STATUS,)),
+                         [(("A", 200), (3, 30, 5, 15)), (("B", 304), (1, 0, 0, 0)),
+                          (("A", 404), (1, 0, 0, 0))])
+        self.assertEqual(host_status.top(1, COUNT, per=(read_entry.HOST,))[0],
+                         (("A", 200), (3, 30, 5, 15)))
+
+    def test_parse_fields(self):
+        self.assertEqual(parse_fields("status, Request_Type"),
+                         (read_entry.STATUS, read_entry.REQUEST_TYPE))
+        self.assertRaises(KeyError, parse_fields, "user")
+        self.assertRaises(ValueError, parse_fields, "host,host")
+        self.assertRaises(ValueError, parse_fields, ",")
+        self.assertEqual(GroupBy(parse_fields("host,status")).name, "host_status")
+
+    def test_update(self):
+        (status_type, host_status) = (GroupBy((read_entry.STATUS, read_entry.REQUEST_TYPE)),
+                                      GroupBy((read_entry.HOST, read_entry.STATUS)))
+        for line in self.lines:
+            entry = read_entry.read_entry(line, epoch=True, record=True)
+            status_type.update(entry)
+            host_status.update(entry)
+        self.check(status_type, host_status)
+        self.assertRaises(NotImplementedError, status_type.top, 1, 4)
+        self.assertRaises(ValueError, status_type.top, 1, COUNT, (read_entry.HOST,))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_update_batch(self):
+        (hosts, resources) = (utility.Vocabulary(), utility.Vocabulary())
+        status_type = GroupBy((read_entry.STATUS, read_entry.REQUEST_TYPE), hosts, resources)
+        host_status = GroupBy((read_entry.HOST, read_entry.STATUS), hosts, resources)
+        for lines in (self.lines[:3], self.lines[3:]):
+            batch = read_entry.read_batch(lines, hosts, resources)
+            status_type.update_batch(batch)
+            host_status.update_batch(batch)
+        self.check(status_type, host_status)
+
+    def test_merge(self):
+        (hosts, other_hosts) = (utility.Vocabulary(), utility.Vocabulary())
+        status_type = GroupBy((read_entry.STATUS, read_entry.REQUEST_TYPE))
+        other_status_type = GroupBy((read_entry.STATUS, read_entry.REQUEST_TYPE))
+        host_status = GroupBy((read_entry.HOST, read_entry.STATUS), hosts)
+        other_host_status = GroupBy((read_entry.HOST, read_entry.STATUS), other_hosts)
+        for (idx, line) in enumerate(self.lines):
+            (first, second, names) = ((status_type, host_status, hosts) if idx < 5 else
+                                      (other_status_type, other_host_status, other_hosts))
+            entry = read_entry.read_entry(line, epoch=True, record=True, hosts=names)
+            first.update(entry)
+            second.update(entry)
+        # The GroupBy of the parts are pickled back from the worker processes.
+        other_host_status = pickle.loads(pickle.dumps(other_host_status, pickle.HIGHEST_PROTOCOL))
+        status_type.merge(other_status_type)
+        host_status.merge(other_host_status, hosts.merge(other_hosts))
+        self.check(status_type, host_status)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class to find the keys with the largest sums of weights in a stream with a
+fixed number of counters (the Space-Saving algorithm), e.g. the most active hosts of a log
+file with tens of millions of distinct hosts.
+When a new key comes and all the counters are taken, the key takes over the counter with the
+smallest value, and the value is kept as the error of the key. So the value of a key is never
+less than its true sum, and more by at most its error, which is at most the smallest value
+(and at most the sum of all the weights divided by the number of counters). Every key whose
+true sum is larger than the smallest value is kept.
+Author: Yuan Huang
+"""
+
+import heapq
+import random
+import unittest
+
+class SpaceSaving(object):
+    """
+    The class that keeps the approximate sums of the weights of at most capacity keys.
+    Example: sketch = SpaceSaving(1000)
+             sketch.update(host, size)
+             sketch.top(10)
+    Args:
+        capacity(int): the number of counters.
+    Public variables:
+        capacity(int): see Args.
+        total(int): the sum of all the weights.
+    """
+    # Names for the indices of the list in SpaceSaving.__counters.
+    (__VALUE, __ERROR) = (0, 1)
+    def __init__(self, capacity):
+        """
+        Private members:
+            __counters(dict): the key as its key and a list as value, list[__VALUE, __ERROR]
+                = (the approximate sum of the weights, the most it is larger than the sum).
+            __heap(list): a min-heap with one (value, key) pair for each key. The values only
+                grow, so a pair is only brought up to date when it reaches the top.
+        """
+        if capacity < 1:
+            raise ValueError("The capacity should be positive")
+        self.capacity = capacity
+        self.total = 0
+        self.__counters = {}
+        self.__heap = []
+
+    def __len__(self):
+        return len(self.__counters)
+
+    def __contains__(self, key):
+        return key in self.__counters
+
+    def __iter__(self):
+        return iter(self.__counters)
+
+    def update(self, key, weight=1):
+        """
+        Add the weight to the sum of a key.
+        Args:
+            key: the key, e.g. a host ID.
+            weight(int): the weight, not negative.
+        """
+        self.total += weight
+        counter = self.__counters.get(key)
+        if counter is not None:
+            counter[self.__VALUE] += weight
+            return
+        if len(self.__counters) < self.capacity:
+            self.__counters[key] = [weight, 0]
+            heapq.heappush(self.__heap, (weight, key))
+            return
+        # A new key with no weight can't be larger than the smallest value.
+        if weight == 0:
+            return
+        (value, smallest) = self.__smallest()
+        del self.__counters[smallest]
+        self.__counters[key] = [value + weight, value]
+        heapq.heapreplace(self.__heap, (value + weight, key))
+
+    def __smallest(self):
+        """
+        Bring the top of the heap up to date.
+        Returns:
+            (value, key): the smallest value and its key.
+        """
+        heap = self.__heap
+        while True:
+            (value, key) = heap[0]
+            current = self.__counters[key][self.__VALUE]
+            if current == value:
+                return (value, key)
+            heapq.heapreplace(heap, (current, key))
+
+    def min(self):
+        """
+        Get the smallest value, the most that the value of a key is larger than its sum.
+        Returns:
+            value(int): the smallest value if all the counters are taken, 0 otherwise.
+        """
+        if len(self.__counters) < self.capacity:
+            return 0
+        return self.__smallest()[0]
+
+    def get(self, key):
+        """
+        Get the value and the error of a key.
+        Args:
+            key: the key.
+        Returns:
+            (value, error): the approximate sum and the most it is larger than the sum,
+                None if the key isn't kept.
+        """
+        counter = self.__counters.get(key)
+        if counter is None:
+            return None
+        return tuple(counter)
+
+    def top(self, number, keys=None):
+        """
+        Get the keys with the largest values.
+        Args:
+            number(int): the number of keys.
+            keys(iterable): the keys to search, in the order that ties are kept. Default is
+                all the keys kept.
+        Returns:
+            A list of tuples (value, error, key) in descending order of the values.
+        """
+        counters = self.__counters
+        if keys is None:
+            keys = counters
+        top_keys = heapq.nlargest(number, keys, key=lambda key: counters[key][self.__VALUE])
+        return [(counters[key][self.__VALUE], counters[key][self.__ERROR], key)
+                for key in top_keys]
+
+    def merge(self, other, keys=None):
+        """
+        Add the sums of another SpaceSaving, e.g. of another part of the log file. A key
+        that is missing from a full SpaceSaving may have a sum up to its smallest value, so
+        the smallest value is added to the value and the error of the key. Then the
+        capacity keys with the largest values are kept.
+        Args:
+            other(SpaceSaving): the other SpaceSaving of the same capacity.
+            keys(list): keys[key] is the key in this SpaceSaving of the key in other, e.g.
+                utility.Vocabulary.merge. None if the keys are the same.
+        """
+        (own_min, other_min) = (self.min(), other.min())
+        counters = {}
+        for (key, (value, error)) in other.__counters.items():
+            if keys is not None:
+                key = keys[key]
+            counters[key] = [value + own_min, error + own_min]
+        for (key, (value, error)) in self.__counters.items():
+            counter = counters.get(key)
+            if counter is None:
+                counters[key] = [value + other_min, error + other_min]
+            else:
+                counter[self.__VALUE] += value - own_min
+                counter[self.__ERROR] += error - own_min
+        if len(counters) > self.capacity:
+            kept = heapq.nlargest(self.capacity, counters,
+                                  key=lambda key: counters[key][self.__VALUE])
+            counters = dict((key, counters[key]) for key in kept)
+        self.__counters = counters
+        self.__heap = [(value, key) for (key, (value, _)) in counters.items()]
+        heapq.heapify(self.__heap)
+        self.total += other.total
+
+class TestSpaceSaving(unittest.TestCase):
+    """
+    Unittest Class for finding the keys with the largest sums.
+    """
+    def setUp(self):
+        # A skewed stream of 20000 keys out of 500, with weights.
+        random_state = random.Random(0)
+        self.stream = [(int(500 * random_state.random() ** 3), random_state.randint(0, 9))
+                       for _ in range(20000)]
+        self.sums = {}
+        for (key, weight) in self.stream:
+            self.sums[key] = self.sums.get(key, 0) + weight
+
+    def check(self, sketch):
+        self.assertTrue(len(sketch) <= sketch.capacity)
+        self.assertEqual(sketch.total, sum(self.sums.values()))
+        bound = sketch.min()
+        self.assertTrue(bound <= sketch.total / sketch.capacity)
+        for key in sketch:
+            (value, error) = sketch.get(key)
+            self.assertTrue(value - error <= self.sums[key] <= value)
+            self.assertTrue(error <= bound)
+        # Every key with a sum larger than the smallest value is kept.
+        for (key, total) in self.sums.items():
+            if total > bound:
+                self.assertTrue(key in sketch)
+
+    def test_exact(self):
+        sketch = SpaceSaving(1000)
+        for (key, weight) in self.stream:
+            sketch.update(key, weight)
+        self.assertEqual(sketch.min(), 0)
+        self.assertEqual(sorted((value, key) for (value, _, key) in sketch.top(1000)),
+                         sorted((value, key) for (key, value) in self.sums.items()))
+        self.assertTrue(all(error == 0 for (_, error, _) in sketch.top(1000)))
+
+    def test_update(self):
+        sketch = SpaceSaving(50)
+        for (key, weight) in self.stream:
+            sketch.update(key, weight)
+        self.check(sketch)
+        top = sketch.top(3)
+        self.assertEqual([key for (_, _, key) in top],
+                         sorted(self.sums, key=self.sums.get, reverse=True)[:3])
+        self.assertRaises(ValueError, SpaceSaving, 0)
+
+    def test_merge(self):
+        (first, second) = (SpaceSaving(50), SpaceSaving(50))
+        for (key, weight) in self.stream[:12000]:
+            first.update(key, weight)
+        # The keys of the second part are shifted, and mapped back when merging.
+        for (key, weight) in self.stream[12000:]:
+            second.update(key + 1000, weight)
+        first.merge(second, dict((key + 1000, key) for key in range(500)))
+        self.check(first)
+
+if __name__ == '__main__':
+    unittest.main()
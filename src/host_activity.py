@@ -11,6 +11,13 @@ Author: Yuan Huang
 import unittest
 import utility
 import random
+import array
+import read_entry
+import heavy_hitters
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # COUNT and SIZE are public variables which can be used when set
 # the sorting method in the HostActivity.top() function.
@@ -23,33 +30,172 @@ class HostActivity(object):
     """
     The class that record the number of activities and total size of resources by each
     host.
+    Args:
+        names(utility.Vocabulary): if the hosts of the entries are integer IDs
+            (read_entry.read_entry(line, hosts=names)), the vocabulary to get the host names.
+        capacity(int): if given, only this many hosts are kept for each of COUNT and SIZE
+            (heavy_hitters.SpaceSaving), so the memory doesn't grow with the number of
+            hosts. The top hosts are then approximate, their counts and sizes are larger
+            than the true ones by at most error_bound, and the order of the updates matters,
+            e.g. the lines of a batch are added host by host.
+    The hosts are indexed by their counts (utility.CountIndex) from the first time that the
+    top hosts by COUNT are asked for, and the index is kept up to date afterwards, so asking
+    again, e.g. for the live queries, costs O(number). The ties are broken by the host
+    names in ascending order.
     Example: host = HostActivity()
     """
     # Names for the indices of the list in HostActivity.__host.
     (__COUNT, __SIZE) = (0, 1)
-    def __init__(self):
+    def __init__(self, names=None, capacity=None):
         """
-        Contains a dictionary __host with host names as keys and a list as values.
+        Contains a dictionary __host with host names as keys and a list as values, or
+        two arrays indexed by the host IDs.
         Private members:
             __host(dict): The dictionary with user IP as its key and a list as value. The list is
                length 2, for example
                list[__COUNT, __SIZE] = (the total number of events of the user,
                                         the total size of resources requested by the user).
+            __names(Vocabulary): the host names of the IDs, None if the keys are host names.
+            __columns(tuple): if the hosts are IDs, the arrays (counts, sizes) indexed by
+                the host IDs are used instead of __host.
+            __sketches(tuple): if capacity is given, the SpaceSaving of the counts and the
+                one of the sizes are used instead.
+            __index(CountIndex): the index of the counts, None until it is needed.
         """
         self.__host = {}
+        self.__names = names
+        self.__columns = (array.array('l'), array.array('l'))
+        self.__sketches = None
+        if capacity is not None:
+            self.__sketches = (heavy_hitters.SpaceSaving(capacity),
+                               heavy_hitters.SpaceSaving(capacity))
+        self.__index = None
+
+    def __getstate__(self):
+        """
+        Get the state to pickle, e.g. into a checkpoint. The index is not pickled, it is
+        built again when it is needed.
+        """
+        state = self.__dict__.copy()
+        state["_HostActivity__index"] = None
+        return state
 
     def update(self, entry):
         """Add the info of entry into the statistics of each host.
         Args:
-            entry(dict): the dictionary of a log item.
+            entry(LogRecord or dict): the record of a log item.
         """
-        if entry["Host"] in self.__host:
-            self.__host[entry["Host"]][self.__COUNT] += 1
-            self.__host[entry["Host"]][self.__SIZE] += entry["Size"]
+        if isinstance(entry, dict):
+            entry = read_entry.LogRecord.from_dict(entry)
+        host = entry[read_entry.HOST]
+        if self.__sketches is not None:
+            self.__sketches[self.__COUNT].update(host)
+            self.__sketches[self.__SIZE].update(host, entry[read_entry.SIZE])
+            return
+        if self.__names is not None:
+            counts, sizes = self.__columns
+            if host >= len(counts):
+                # Grow the arrays for the new host IDs.
+                counts.extend([0] * (host + 1 - len(counts)))
+                sizes.extend([0] * (host + 1 - len(sizes)))
+            counts[host] += 1
+            sizes[host] += entry[read_entry.SIZE]
+            if self.__index is not None:
+                self.__index.move(host, counts[host] - 1, counts[host])
+            return
+
+        status = self.__host.get(host)
+        if status is not None:
+            status[self.__COUNT] += 1
+            status[self.__SIZE] += entry[read_entry.SIZE]
         else:
-            self.__host[entry["Host"]] = [0, 0]
-            self.__host[entry["Host"]][self.__COUNT] = 1
-            self.__host[entry["Host"]][self.__SIZE] = entry["Size"]
+            status = self.__host[host] = [1, entry[read_entry.SIZE]]
+        if self.__index is not None:
+            self.__index.move(host, status[self.__COUNT] - 1, status[self.__COUNT])
+
+    def update_batch(self, batch):
+        """Add the info of a LogBatch into the statistics of each host. The counts and
+        sizes are summed up with numpy if the hosts are IDs (HostActivity(names)).
+        Args:
+            batch(LogBatch): the batch of log items.
+        """
+        if self.__names is None:
+            for idx in range(len(batch)):
+                self.update(batch.record(idx))
+            return
+        if len(batch) == 0:
+            return
+        if self.__sketches is not None:
+            keys, inverse = np.unique(batch.host, return_inverse=True)
+            counts = np.bincount(inverse)
+            sizes = np.rint(np.bincount(inverse, weights=batch.size)).astype(np.int64)
+            (count_sketch, size_sketch) = self.__sketches
+            for (host, count, size) in zip(keys.tolist(), counts.tolist(), sizes.tolist()):
+                count_sketch.update(host, count)
+                size_sketch.update(host, size)
+            return
+
+        counts, sizes = self.__columns
+        length = int(batch.host.max()) + 1
+        if length > len(counts):
+            counts.extend([0] * (length - len(counts)))
+            sizes.extend([0] * (length - len(sizes)))
+        batch_counts = np.bincount(batch.host, minlength=length)
+        column = np.frombuffer(counts, dtype=np.int_)[:length]
+        column += batch_counts
+        np.frombuffer(sizes, dtype=np.int_)[:length] += np.rint(
+            np.bincount(batch.host, weights=batch.size, minlength=length)).astype(np.int_)
+        if self.__index is not None:
+            hosts = np.flatnonzero(batch_counts)
+            for (host, count, added) in zip(hosts.tolist(), column[hosts].tolist(),
+                                            batch_counts[hosts].tolist()):
+                self.__index.move(host, count - added, count)
+
+    def merge(self, other, hosts=None):
+        """Add the statistics of another HostActivity, e.g. of another part of the log file.
+        Args:
+            other(HostActivity): the other HostActivity.
+            hosts(list): if the hosts are IDs, hosts[idx] is the ID in this HostActivity of
+                the host ID idx in other (utility.Vocabulary.merge).
+        """
+        # The index is built again when it is needed
+        self.__index = None
+        if self.__sketches is not None:
+            for (sketch, other_sketch) in zip(self.__sketches, other.__sketches):
+                sketch.merge(other_sketch, hosts)
+            return
+        if self.__names is None:
+            for (host, (count, size)) in other.__host.iteritems():
+                status = self.__host.get(host)
+                if status is not None:
+                    status[self.__COUNT] += count
+                    status[self.__SIZE] += size
+                else:
+                    self.__host[host] = [count, size]
+            return
+
+        counts, sizes = self.__columns
+        other_counts, other_sizes = other.__columns
+        length = max(hosts[:len(other_counts)] or [-1]) + 1
+        if length > len(counts):
+            counts.extend([0] * (length - len(counts)))
+            sizes.extend([0] * (length - len(sizes)))
+        for (idx, count) in enumerate(other_counts):
+            if count > 0:
+                counts[hosts[idx]] += count
+                sizes[hosts[idx]] += other_sizes[idx]
+
+    def __keys(self):
+        """
+        Get the IDs of the hosts that have been recorded, in the order of the host names
+        in the vocabulary, so that the ties are in the same order as with the host
+        names as keys.
+        Returns:
+            A generator of the host IDs.
+        """
+        counts = self.__columns[self.__COUNT]
+        length = len(counts)
+        return (key for key in self.__names.itervalues() if key < length and counts[key] > 0)
 
     def top(self, number, sort_method):
         """
@@ -69,8 +215,71 @@ class HostActivity(object):
             idx = self.__SIZE
         else:
             raise NotImplementedError
-        keys, values = utility.nlargest_dict(number, self.__host, idx)
-        return zip(values, keys)
+        if self.__sketches is not None:
+            sketch = self.__sketches[idx]
+            # The ties are broken by the names, as with the CountIndex
+            top = sketch.top(number, sorted(sketch, key=self.__tie()))
+            return zip([value for (value, _, _) in top],
+                       self.__decode([key for (_, _, key) in top]))
+        if idx == self.__COUNT:
+            top = self.__count_index().top(number, self.__tie())
+            return zip([count for (count, _) in top], self.__decode([key for (_, key) in top]))
+        if self.__names is not None:
+            keys, values = utility.nlargest_column(number, self.__columns[idx], self.__keys())
+        else:
+            keys, values = utility.nlargest_dict(number, self.__host, idx)
+        return zip(values, self.__decode(keys))
+
+    def __tie(self):
+        """
+        Get the sort key that breaks the ties by the host names.
+        Returns:
+            tie(function): the name of a host ID, None if the hosts are the names.
+        """
+        return None if self.__names is None else self.__names.names.__getitem__
+
+    def __count_index(self):
+        """
+        Get the index of the counts, build it if there is none.
+        Returns:
+            index(CountIndex): the index of the hosts by their counts.
+        """
+        if self.__index is None:
+            if self.__names is not None:
+                counts = self.__columns[self.__COUNT]
+                self.__index = utility.CountIndex((key, counts[key]) for key in self.__keys())
+            else:
+                self.__index = utility.CountIndex((host, status[self.__COUNT])
+                                                  for (host, status) in self.__host.iteritems())
+        return self.__index
+
+    def error_bound(self, sort_method):
+        """
+        Get the most that a count or a size of the top hosts is larger than the true one.
+        Args:
+            sort_method: can only take values COUNT or SIZE.
+        Returns:
+            bound(int): 0 if the hosts are not approximate (capacity), or not yet.
+        Raises:
+            NotImplementedError: Error occurs when choosen feature is not COUNT or SIZE.
+        """
+        if sort_method not in (COUNT, SIZE):
+            raise NotImplementedError
+        if self.__sketches is None:
+            return 0
+        return self.__sketches[sort_method].min()
+
+    def __decode(self, keys):
+        """
+        Transform the keys of __host into host names.
+        Args:
+            keys(list): the keys of __host.
+        Returns:
+            A list of host names.
+        """
+        if self.__names is None:
+            return keys
+        return [self.__names.names[key] for key in keys]
 
     def sample(self, number):
         """
@@ -78,10 +287,17 @@ class HostActivity(object):
         Args:
             number(int): the number of random hosts.
         Returns:
-            A list of strings. Each string is the name of the host.
+            A list of strings. Each string is the name of the host. All the hosts are
+            returned if there are fewer than number.
         """
-        keys = random.sample(self.__host.keys(), number)
-        return zip(range(len(keys)), keys)
+        if self.__sketches is not None:
+            keys = list(self.__sketches[self.__COUNT])
+        elif self.__names is not None:
+            keys = list(self.__keys())
+        else:
+            keys = list(self.__host.keys())
+        keys = random.sample(keys, min(number, len(keys)))
+        return zip(range(len(keys)), self.__decode(keys))
 
 class TestHost(unittest.TestCase):
     def setUp(self):
@@ -112,5 +328,116 @@ class TestHost(unittest.TestCase):
         top = hosts.top(1, SIZE)
         self.assertEqual(top[0], (33, "E"))
 
+    def test_update_vocabulary(self):
+        names = utility.Vocabulary()
+        hosts = HostActivity(names)
+        for entry in self.data:
+            entry = dict(entry)
+            entry["Host"] = names[entry["Host"]]
+            hosts.update(entry)
+
+        top = hosts.top(1, COUNT)
+        self.assertEqual(top, [(3, "A")])
+        top = hosts.top(2, SIZE)
+        self.assertEqual(top, [(33, "E"), (23, "B")])
+        self.assertEqual(sorted(name for (_, name) in hosts.sample(6)), list("ABCDEF"))
+
+    def test_sample_fewer_hosts(self):
+        for names in (None, utility.Vocabulary()):
+            hosts = HostActivity(names)
+            self.assertEqual(list(hosts.sample(1000)), [])
+            for entry in self.data:
+                entry = dict(entry)
+                if names is not None:
+                    entry["Host"] = names[entry["Host"]]
+                hosts.update(entry)
+            self.assertEqual(sorted(name for (_, name) in hosts.sample(1000)), list("ABCDEF"))
+            self.assertEqual(len(hosts.sample(3)), 3)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_update_batch(self):
+        names = utility.Vocabulary()
+        lines = ['{0} - - [01/Jul/1995:00:00:01 -0400] "GET / HTTP/1.0" 200 {1}'.format(
+            entry["Host"], entry["Size"]) for entry in self.data]
+        hosts = HostActivity(names)
+        hosts.update_batch(read_entry.read_batch(lines[:4], names, utility.Vocabulary()))
+        hosts.update_batch(read_entry.read_batch(lines[4:], names, utility.Vocabulary()))
+
+        top = hosts.top(1, COUNT)
+        self.assertEqual(top, [(3, "A")])
+        top = hosts.top(2, SIZE)
+        self.assertEqual(top, [(33, "E"), (23, "B")])
+
+    def test_merge(self):
+        names = utility.Vocabulary()
+        hosts = HostActivity(names)
+        for entry in self.data[:4]:
+            hosts.update({"Host": names[entry["Host"]], "Size": entry["Size"]})
+        other_names = utility.Vocabulary()
+        other = HostActivity(other_names)
+        for entry in self.data[4:]:
+            other.update({"Host": other_names[entry["Host"]], "Size": entry["Size"]})
+        hosts.merge(other, names.merge(other_names))
+
+        top = hosts.top(1, COUNT)
+        self.assertEqual(top, [(3, "A")])
+        top = hosts.top(2, SIZE)
+        self.assertEqual(top, [(33, "E"), (23, "B")])
+
+        hosts = HostActivity()
+        other = HostActivity()
+        for entry in self.data[:4]:
+            hosts.update(entry)
+        for entry in self.data[4:]:
+            other.update(entry)
+        hosts.merge(other)
+        self.assertEqual(hosts.top(2, SIZE), [(33, "E"), (23, "B")])
+
+    def test_capacity(self):
+        names = utility.Vocabulary()
+        hosts = HostActivity(names, capacity=10)
+        exact = HostActivity(names)
+        for entry in self.data:
+            entry = {"Host": names[entry["Host"]], "Size": entry["Size"]}
+            hosts.update(entry)
+            exact.update(entry)
+        self.assertEqual(hosts.top(6, COUNT), exact.top(6, COUNT))
+        self.assertEqual(hosts.top(6, SIZE), exact.top(6, SIZE))
+        self.assertEqual(hosts.error_bound(COUNT), 0)
+
+        hosts = HostActivity(capacity=2)
+        for entry in self.data:
+            hosts.update(entry)
+        # The last hosts take over the counters, their counts are over by at most 5
+        self.assertEqual(hosts.top(2, COUNT), [(5, "E"), (5, "F")])
+        self.assertEqual(hosts.error_bound(COUNT), 5)
+        self.assertEqual(hosts.top(1, SIZE), [(44, "E")])
+        self.assertEqual(len(hosts.sample(5)), 2)
+        self.assertRaises(NotImplementedError, hosts.error_bound, 2)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_capacity_batch(self):
+        names = utility.Vocabulary()
+        lines = ['{0} - - [01/Jul/1995:00:00:01 -0400] "GET / HTTP/1.0" 200 {1}'.format(
+            entry["Host"], entry["Size"]) for entry in self.data]
+        hosts = HostActivity(names, capacity=10)
+        hosts.update_batch(read_entry.read_batch(lines[:4], names, utility.Vocabulary()))
+        other_names = utility.Vocabulary()
+        other = HostActivity(other_names, capacity=10)
+        other.update_batch(read_entry.read_batch(lines[4:], other_names, utility.Vocabulary()))
+        hosts.merge(other, names.merge(other_names))
+        self.assertEqual(hosts.top(1, COUNT), [(3, "A")])
+        self.assertEqual(hosts.top(2, SIZE), [(33, "E"), (23, "B")])
+
+    def test_update_record(self):
+        hosts = HostActivity()
+        for entry in self.data:
+            hosts.update(read_entry.LogRecord.from_dict(entry))
+
+        top = hosts.top(1, COUNT)
+        self.assertEqual(top, [(3, "A")])
+        top = hosts.top(2, SIZE)
+        self.assertEqual(top, [(33, "E"), (23, "B")])
+
 if __name__ == '__main__':
     unittest.main()
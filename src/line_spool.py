@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class that keeps a growing list of log lines with bounded memory, e.g. the blocked
+lines and the lines with server errors. The lines are kept in memory up to a number of bytes,
+and then spilled to a temporary file, so an attack or an outage with millions of such lines
+doesn't grow the memory. The lines are read back in the order they are added.
+Author: Yuan Huang
+"""
+
+import bisect
+import tempfile
+import unittest
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+# The number of bytes of lines kept in memory before they are spilled to the temporary file.
+SPILL_BYTES = 1 << 23
+
+# The number of bytes read at once from the temporary file.
+READ_BYTES = 1 << 20
+
+class LineSpool(object):
+    """
+    The class that keeps lines in order, in memory and then in a temporary file. It can be
+    appended to, iterated over (also while appending, and from any line), compared with
+    lists and pickled.
+    Example: spool = LineSpool()
+             spool.append(line)
+             for line in spool: writer.write(line)
+             for line in spool.lines(written): writer.write(line)
+    Args:
+        spill_bytes(int): the number of bytes of lines kept in memory.
+    """
+    def __init__(self, spill_bytes=SPILL_BYTES):
+        self.__spill_bytes = spill_bytes
+        self.__buffer = []
+        self.__buffer_bytes = 0
+        # The temporary file is only created when the lines are spilled.
+        self.__file = None
+        self.__spilled_lines = 0
+        self.__spilled_bytes = 0
+        # The indices of the spilled lines without the new line character (e.g. the last
+        # line of a rotated log file), they are spilled with it so the lines can be split.
+        self.__unterminated = set()
+        # The index of the first line and the byte position of each spill in the temporary
+        # file, to start reading from any line.
+        self.__spill_lines = []
+        self.__spill_positions = []
+
+    def append(self, line):
+        """
+        Add a line.
+        Args:
+            line(str): the line with the new line character.
+        """
+        self.__buffer.append(line)
+        self.__buffer_bytes += len(line)
+        if self.__buffer_bytes > self.__spill_bytes:
+            self.__spill()
+
+    def extend(self, lines):
+        """
+        Add lines.
+        Args:
+            lines(iterable): the lines, e.g. a list or another LineSpool.
+        """
+        for line in lines:
+            self.append(line)
+
+    def __spill(self):
+        """
+        Move the lines in memory to the end of the temporary file.
+        """
+        if self.__file is None:
+            self.__file = tempfile.TemporaryFile(prefix="spool.")
+        for (idx, line) in enumerate(self.__buffer):
+            if not line.endswith(b"\n"):
+                self.__unterminated.add(self.__spilled_lines + idx)
+                self.__buffer[idx] = line + b"\n"
+        data = b"".join(self.__buffer)
+        self.__spill_lines.append(self.__spilled_lines)
+        self.__spill_positions.append(self.__spilled_bytes)
+        self.__file.seek(self.__spilled_bytes)
+        self.__file.write(data)
+        self.__spilled_lines += len(self.__buffer)
+        self.__spilled_bytes += len(data)
+        self.__buffer = []
+        self.__buffer_bytes = 0
+
+    def close(self):
+        """
+        Remove the temporary file, and all the lines.
+        """
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        self.__buffer = []
+        self.__buffer_bytes = 0
+        self.__spilled_lines = 0
+        self.__spilled_bytes = 0
+        self.__unterminated = set()
+        self.__spill_lines = []
+        self.__spill_positions = []
+
+    def __len__(self):
+        return self.__spilled_lines + len(self.__buffer)
+
+    def __iter__(self):
+        return self.lines()
+
+    def lines(self, start=0):
+        """
+        Read the lines in order from a line on: the spilled lines from the temporary file in
+        blocks, and then the lines in memory. The lines added during the iteration are also
+        read. The reading starts at the spill that holds the first line, so the earlier
+        lines are not read again, e.g. when only the new lines are written.
+        Args:
+            start(int): the index of the first line.
+        Returns:
+            A generator of the lines.
+        """
+        # The byte position in the temporary file and the index of the next line, also
+        # when the next line is still in memory (it may be spilled while reading).
+        (position, count) = (0, 0)
+        spill = bisect.bisect_right(self.__spill_lines, start) - 1
+        if start >= self.__spilled_lines:
+            (position, count) = (self.__spilled_bytes, self.__spilled_lines)
+        elif spill >= 0:
+            (position, count) = (self.__spill_positions[spill], self.__spill_lines[spill])
+        while True:
+            if count < self.__spilled_lines:
+                self.__file.flush()
+                self.__file.seek(position)
+                block = self.__file.read(min(READ_BYTES, self.__spilled_bytes - position))
+                # All the spilled lines end with the new line character.
+                stop = block.rfind(b"\n") + 1
+                if stop == 0:
+                    block += self.__file.readline()
+                    stop = len(block)
+                position += stop
+                for line in BytesIO(block[:stop]):
+                    if count >= start:
+                        yield line[:-1] if count in self.__unterminated else line
+                    count += 1
+                continue
+            idx = count - self.__spilled_lines
+            if idx >= len(self.__buffer):
+                break
+            line = self.__buffer[idx]
+            position += len(line) if line.endswith(b"\n") else len(line) + 1
+            count += 1
+            if count > start:
+                yield line
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "LineSpool({0} lines, {1} spilled)".format(len(self), self.__spilled_lines)
+
+    def __getstate__(self):
+        """
+        Get the state to pickle, e.g. into a checkpoint or from a worker process. The lines
+        are pickled as a list, since the temporary file can't be shared.
+        """
+        return {"spill_bytes": self.__spill_bytes, "lines": list(self)}
+
+    def __setstate__(self, state):
+        self.__init__(state["spill_bytes"])
+        self.extend(state["lines"])
+
+class TestLineSpool(unittest.TestCase):
+    """
+    Unittest Class for keeping lines in memory and in a temporary file.
+    """
+    def setUp(self):
+        self.lines = ["line {0}\n".format("x" * (idx % 7)) for idx in range(100)] + ["last"]
+        # A line without the new line character in the middle
+        self.lines[50] = "rotated"
+
+    def test_spill(self):
+        spool = LineSpool(spill_bytes=20)
+        for (idx, line) in enumerate(self.lines):
+            spool.append(line)
+            self.assertEqual(len(spool), idx + 1)
+        self.assertEqual(list(spool), self.lines)
+        self.assertEqual(spool, self.lines)
+        self.assertTrue("spilled" in repr(spool))
+        spool.close()
+        self.assertEqual(list(spool), [])
+
+        spool = LineSpool(spill_bytes=1 << 20)
+        spool.extend(self.lines[:3])
+        self.assertEqual(spool, self.lines[:3])
+        self.assertNotEqual(spool, self.lines[:2])
+
+    def test_append_while_reading(self):
+        spool = LineSpool(spill_bytes=30)
+        spool.extend(self.lines[:10])
+        lines = []
+        for (idx, line) in enumerate(spool):
+            lines.append(line)
+            if idx < 50:
+                spool.append(self.lines[idx + 10])
+        self.assertEqual(lines, self.lines[:60])
+
+    def test_lines(self):
+        spool = LineSpool(spill_bytes=20)
+        for (idx, line) in enumerate(self.lines):
+            spool.append(line)
+            for start in (0, idx // 2, idx, idx + 1, idx + 5):
+                self.assertEqual(list(spool.lines(start)), self.lines[start:idx+1])
+
+        # Only the spill holding the first line is read from the temporary file
+        class Reads(object):
+            def __init__(self, data):
+                (self.data, self.bytes) = (data, 0)
+            def flush(self):
+                pass
+            def seek(self, position):
+                self.data.seek(position)
+            def read(self, size):
+                block = self.data.read(size)
+                self.bytes += len(block)
+                return block
+            def readline(self):
+                line = self.data.readline()
+                self.bytes += len(line)
+                return line
+        reads = Reads(spool._LineSpool__file)
+        spool._LineSpool__file = reads
+        # Line 92 is in the spill starting at line 90, the lines from 98 on are in memory
+        self.assertEqual(list(spool.lines(92)), self.lines[92:])
+        self.assertEqual(reads.bytes, sum(len(line) for line in self.lines[90:98]))
+
+    def test_pickle(self):
+        import pickle
+        spool = LineSpool(spill_bytes=20)
+        spool.extend(self.lines)
+        copy = pickle.loads(pickle.dumps(spool, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(copy, self.lines)
+        copy.append("more\n")
+        self.assertEqual(len(copy), len(self.lines) + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,655 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class that updates the selected feature classes with the entries of a log file,
+and keeps the logs selected for the line-based outputs. The LogAnalysis of consecutive
+parts of a log file can be merged in order into one LogAnalysis.
+Author: Yuan Huang
+"""
+import time
+import unittest
+from collections import OrderedDict, namedtuple
+import utility
+import read_entry
+import host_activity as host
+import resource_statistics as resource
+import block_hosts
+import time_window
+import time_statistics
+import line_spool
+import path_trie
+import group_by as grouping
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The number of busiest 60-minute periods kept by the TimeWindow.
+NUM_BUSY_HOURS = 10
+
+# An analyzer that can be selected in LogAnalysis: the indices of the LogRecord fields
+# that it reads, and the output files that it produces.
+Analyzer = namedtuple("Analyzer", ["fields", "outputs"])
+
+# The analyzers by name, in the order of their outputs.
+ANALYZERS = OrderedDict([
+    ("hosts", Analyzer((read_entry.HOST, read_entry.SIZE),
+                       ("hosts.txt", "hosts_sample.txt"))),
+    ("resources", Analyzer((read_entry.REQUEST, read_entry.SIZE),
+                           ("resources.txt", "resources_most_requested.txt",
+                            "resources_least_requested.txt"))),
+    ("time_window", Analyzer((read_entry.TIME, read_entry.OFFSET),
+                             ("hours.txt", "hours_no_overlap.txt"))),
+    ("blocked", Analyzer((read_entry.HOST, read_entry.TIME, read_entry.REQUEST,
+                          read_entry.STATUS),
+                         ("blocked.txt",))),
+    ("server_errors", Analyzer((read_entry.STATUS,), ("server_error.txt",))),
+    ("not_found", Analyzer((read_entry.REQUEST, read_entry.STATUS),
+                           ("resources_not_found.txt",))),
+    ("time_stat", Analyzer((read_entry.HOST, read_entry.TIME, read_entry.OFFSET),
+                           ("daily_hits.txt", "daily_hosts.txt", "hourly_hits.txt",
+                            "hourly_hosts.txt"))),
+    ("paths", Analyzer((read_entry.REQUEST, read_entry.SIZE), ("paths.txt",))),
+])
+
+# The analyzers that run unless others are selected. The tree of the paths keeps a node for
+# each prefix of each distinct resource, so it only runs when it is selected.
+DEFAULT_ANALYZERS = [name for name in ANALYZERS if name != "paths"]
+
+def analyzer_fields(analyzers):
+    """
+    Get the fields of the LogRecord that are read by the analyzers.
+    Args:
+        analyzers(list): the names of the analyzers, None for DEFAULT_ANALYZERS.
+    Returns:
+        fields(set): the indices of the fields, None if all the fields are read.
+    Raises:
+        KeyError: Error occurs when an analyzer is unknown.
+    """
+    if analyzers is None:
+        return None
+    fields = set()
+    for name in analyzers:
+        fields.update(ANALYZERS[name].fields)
+    return fields
+
+class LogAnalysis(object):
+    """
+    The class that updates the statistics of the hosts, the resources and the time, the busiest
+    periods and the blocked hosts with the entries of a log file. The host names and resource
+    names are transferred into integer IDs when reading the entries, and the time is in
+    integer epoch seconds.
+    Args:
+        mergeable(bool): True if the LogAnalysis reads a part of the log file, and is merged
+            in order into another LogAnalysis (LogAnalysis.merge). The byte positions of the
+            lines then need to be given to the update functions.
+        log(logging.Logger): the logger to warn about the lines with format error. If None,
+            the lines and the error messages are kept in errors.
+        quarantine(Quarantine): if given, the lines with format error are set aside into it
+            instead (quarantine.Quarantine), without a warning for each line.
+        analyzers(list): the names of the analyzers in ANALYZERS to run, None for
+            DEFAULT_ANALYZERS.
+        stats(RunStats): if given, the parsing and the updates of the analyzers are timed
+            into it (run_stats.RunStats).
+        capacity(int): if given, only this many hosts and resources are kept for the top
+            hosts and resources, which are then approximate (HostActivity and
+            ResourceStatistics). The least requested resources can't be found then.
+        group_by(list): the fields to group the entries by, a tuple of the indices of the
+            LogRecord fields for each GroupBy (group_by.parse_fields), e.g.
+            [(read_entry.STATUS, read_entry.REQUEST_TYPE)].
+        time_histogram(bool): True if the TimeWindow keeps the number of entries in each
+            second of the current window instead of the time of each entry, so its memory
+            doesn't grow with the traffic (TimeWindow histogram mode).
+    Raises:
+        KeyError: Error occurs when an analyzer is unknown.
+    Public variables:
+        analyzers(list): the names of the analyzers that run, in the order of ANALYZERS.
+        capacity(int): see Args.
+        group_by(list): see Args.
+        time_histogram(bool): see Args.
+        fields(set): the indices of the LogRecord fields read by the analyzers, None for all.
+            The lines should be parsed with read_entry(..., fields=fields).
+        host_names(utility.Vocabulary), resource_names(utility.Vocabulary): the vocabularies
+            of the host IDs and the resource IDs.
+        hosts(HostActivity), resources(ResourceStatistics), time_stat(TimeStatistics),
+            time_window(TimeWindow), blocked(BlockedHosts), paths(PathTrie): the feature
+            classes, None if their analyzers don't run.
+        groups(list): the GroupBy (group_by.GroupBy) of each tuple of fields in group_by.
+        blocked_entries(LineSpool): the blocked logs in order.
+        blocked_positions(list): if mergeable, the byte positions of the blocked logs.
+        server_errs(LineSpool): the logs with server errors in order.
+            The logs are spilled to temporary files past line_spool.SPILL_BYTES, so they
+            don't grow the memory however many there are.
+        resources_not_found(set), resources_not_found_order(list): the IDs of the resources
+            with status 404 (Not Found), in the order that they are first found.
+        entry_final(LogRecord): the last valid entry.
+        errors(list): the lines with format error, the error messages and the reason codes
+            (read_entry.EntryError), if there is no log.
+        num_lines(int), num_errors(int): the number of lines read, and of the lines with
+            format error.
+    """
+    def __init__(self, mergeable=False, log=None, analyzers=None, stats=None, quarantine=None,
+                 capacity=None, group_by=None, time_histogram=False):
+        self.__mergeable = mergeable
+        self.__log = log
+        self.__quarantine = quarantine
+        self.__stats = stats
+        self.fields = analyzer_fields(analyzers)
+        if analyzers is None:
+            analyzers = DEFAULT_ANALYZERS
+        self.analyzers = [name for name in ANALYZERS if name in analyzers]
+        self.capacity = capacity
+        self.group_by = [tuple(fields) for fields in group_by or []]
+        if self.fields is not None:
+            for fields in self.group_by:
+                self.fields.update(fields + (read_entry.SIZE,))
+        self.time_histogram = time_histogram
+
+        self.host_names = utility.Vocabulary()
+        self.resource_names = utility.Vocabulary()
+
+        (self.hosts, self.resources, self.time_stat, self.time_window,
+         self.blocked, self.paths) = (None, None, None, None, None, None)
+        if self.enabled("hosts"):
+            self.hosts = host.HostActivity(self.host_names, capacity)
+        if self.enabled("resources"):
+            self.resources = resource.ResourceStatistics(self.resource_names, capacity)
+        if self.enabled("time_stat"):
+            self.time_stat = time_statistics.TimeStatistics(epoch=True, host_ids=True)
+        if self.enabled("time_window"):
+            self.time_window = time_window.TimeWindow(hours=1, n_top=NUM_BUSY_HOURS, epoch=True,
+                                                      mergeable=mergeable,
+                                                      histogram=time_histogram)
+        if self.enabled("blocked"):
+            self.blocked = block_hosts.BlockedHosts(monitor_seconds=20, block_seconds=300,
+                                                    chances=3, epoch=True,
+                                                    resources=self.resource_names)
+        if self.enabled("paths"):
+            self.paths = path_trie.PathTrie(self.resource_names)
+        self.groups = [grouping.GroupBy(fields, self.host_names, self.resource_names)
+                       for fields in self.group_by]
+        self.__keep_server_errs = self.enabled("server_errors")
+        self.__keep_not_found = self.enabled("not_found")
+
+        self.blocked_entries = line_spool.LineSpool()
+        self.blocked_positions = []
+        self.server_errs = line_spool.LineSpool()
+        self.resources_not_found = set()
+        self.resources_not_found_order = []
+        self.entry_final = None
+        self.errors = []
+        self.num_lines = 0
+        self.num_errors = 0
+
+    def __getstate__(self):
+        """
+        Get the state to pickle, e.g. into a checkpoint. The logger, the RunStats and the
+        Quarantine are not pickled.
+        """
+        state = self.__dict__.copy()
+        state["_LogAnalysis__log"] = None
+        state["_LogAnalysis__stats"] = None
+        state["_LogAnalysis__quarantine"] = None
+        return state
+
+    def set_stats(self, stats):
+        """
+        Set the RunStats to time the parsing and the updates of the analyzers into, e.g. after
+        the LogAnalysis is loaded from a checkpoint.
+        Args:
+            stats(RunStats): the RunStats.
+        """
+        self.__stats = stats
+
+    def set_log(self, log, quarantine=None):
+        """
+        Set the logger to warn about the lines with format error, and the Quarantine to set
+        them aside into, e.g. after the LogAnalysis is loaded from a checkpoint.
+        Args:
+            log(logging.Logger): the logger.
+            quarantine(Quarantine): the Quarantine, None to warn about each line.
+        """
+        self.__log = log
+        self.__quarantine = quarantine
+
+    def enabled(self, name):
+        """
+        Check if an analyzer runs.
+        Args:
+            name(str): the name of the analyzer in ANALYZERS.
+        Returns:
+            True if the analyzer runs.
+        """
+        return name in self.analyzers
+
+    def sizes(self):
+        """
+        Get the sizes of the structures that grow with the log file, e.g. to watch the memory
+        (run_stats.Sampler). The sizes are read without locking, so they may be slightly off
+        while another thread updates the LogAnalysis.
+        Returns:
+            sizes(OrderedDict): the numbers of distinct hosts and resources, of the entries
+                in the current time window, of the monitored and blocked hosts, and of the
+                kept logs and resources not found.
+        """
+        sizes = OrderedDict()
+        sizes["distinct_hosts"] = len(self.host_names)
+        sizes["distinct_resources"] = len(self.resource_names)
+        if self.time_window is not None:
+            sizes["time_window_queue"] = self.time_window.queue_length()
+        if self.blocked is not None:
+            (sizes["monitored_hosts"], sizes["blocked_hosts"]) = self.blocked.tracked()
+            sizes["blocked_lines"] = len(self.blocked_entries)
+        if self.__keep_server_errs:
+            sizes["server_error_lines"] = len(self.server_errs)
+        if self.__keep_not_found:
+            sizes["resources_not_found"] = len(self.resources_not_found_order)
+        if self.paths is not None:
+            sizes["path_nodes"] = len(self.paths)
+        for groups in self.groups:
+            sizes["groups_" + groups.name] = len(groups)
+        return sizes
+
+    def __error(self, line, msg, reason):
+        """
+        Set aside a line with format error into the Quarantine, or warn about it, or keep
+        it in errors if there is no log.
+        Args:
+            line(str): the line.
+            msg(str): the error message.
+            reason(str): the reason code (read_entry.EntryError).
+        """
+        self.num_errors += 1
+        if self.__quarantine is not None:
+            self.__quarantine.add(line, reason)
+        elif self.__log is not None:
+            self.__log.warning("Entry format error: {0}{1}".format(line, msg))
+        else:
+            self.errors.append((line, msg, reason))
+
+    def __not_found(self, request):
+        """
+        Record a resource with status 404 (Not Found).
+        Args:
+            request(int): the ID of the resource.
+        """
+        if request not in self.resources_not_found:
+            self.resources_not_found.add(request)
+            self.resources_not_found_order.append(request)
+
+    def update(self, line, position=None):
+        """
+        Read a line of the log file and update the statistics with the entry.
+        Args:
+            line(str): the line of the log file.
+            position(int): the byte position of the line in the log file.
+        """
+        self.num_lines += 1
+        if self.__stats is not None and self.__stats.sample():
+            self.__update_sampled(line, position)
+            return
+        try:
+            record = read_entry.read_entry(line, epoch=True, record=True,
+                                           hosts=self.host_names, resources=self.resource_names,
+                                           fields=self.fields)
+        except read_entry.EntryError as error:
+            self.__error(line, str(error), error.reason)
+            return
+        self.entry_final = record
+
+        if self.hosts is not None:
+            self.hosts.update(record)
+        if self.time_window is not None:
+            self.time_window.update(record)
+        if self.time_stat is not None:
+            self.time_stat.update(record)
+        if self.resources is not None:
+            self.resources.update(record)
+        if self.paths is not None:
+            self.paths.update(record)
+        for groups in self.groups:
+            groups.update(record)
+        if self.blocked is not None:
+            self.__update_blocked(record, line, position)
+        if self.__keep_not_found and record.status == 404:
+            self.__not_found(record.request)
+        if self.__keep_server_errs and record.status >= 500 and record.status < 600:
+            self.server_errs.append(line)
+
+    def __update_blocked(self, record, line, position):
+        """
+        Update the blocked hosts with an entry, and keep the line if it is blocked.
+        Args:
+            record(LogRecord): the entry.
+            line(str): the line of the entry.
+            position(int): the byte position of the line in the log file.
+        """
+        if self.blocked.update(record) is True:
+            self.blocked_entries.append(line)
+            if self.__mergeable:
+                self.blocked_positions.append(position)
+
+    def __update_sampled(self, line, position):
+        """
+        Do the same as update, and time the parsing and the update of each analyzer into
+        the RunStats as a sampled line.
+        Args:
+            line(str): the line of the log file.
+            position(int): the byte position of the line in the log file.
+        """
+        stats = self.__stats
+        start = time.time()
+        try:
+            record = read_entry.read_entry(line, epoch=True, record=True,
+                                           hosts=self.host_names, resources=self.resource_names,
+                                           fields=self.fields)
+        except read_entry.EntryError as error:
+            stats.add_time("parse", time.time() - start, sampled=True)
+            self.__error(line, str(error), error.reason)
+            return
+        stats.add_time("parse", time.time() - start, sampled=True)
+        self.entry_final = record
+
+        updates = []
+        if self.hosts is not None:
+            updates.append(("hosts", lambda: self.hosts.update(record)))
+        if self.time_window is not None:
+            updates.append(("time_window", lambda: self.time_window.update(record)))
+        if self.time_stat is not None:
+            updates.append(("time_stat", lambda: self.time_stat.update(record)))
+        if self.resources is not None:
+            updates.append(("resources", lambda: self.resources.update(record)))
+        if self.paths is not None:
+            updates.append(("paths", lambda: self.paths.update(record)))
+        for groups in self.groups:
+            updates.append(("group_by_" + groups.name,
+                            lambda groups=groups: groups.update(record)))
+        if self.blocked is not None:
+            updates.append(("blocked", lambda: self.__update_blocked(record, line, position)))
+        if self.__keep_not_found:
+            updates.append(("not_found", lambda: record.status == 404 and
+                            self.__not_found(record.request)))
+        if self.__keep_server_errs:
+            updates.append(("server_errors", lambda: record.status >= 500 and
+                            record.status < 600 and self.server_errs.append(line)))
+        # The times are added to the RunStats after all the updates, so that the time of
+        # adding them is not counted as the time of the analyzers.
+        seconds = []
+        for (name, update) in updates:
+            begin = time.time()
+            update()
+            seconds.append((name, time.time() - begin))
+        for (name, second) in seconds:
+            stats.add_analyzer_time(name, second, sampled=True)
+        stats.add_time("aggregate", sum(second for (_, second) in seconds), sampled=True)
+
+    def update_batch(self, batch, positions=None):
+        """
+        Update the statistics with a LogBatch.
+        Args:
+            batch(LogBatch): the batch of log items.
+            positions(list or numpy.ndarray): the byte positions of the lines of the batch
+                in the log file.
+        """
+        self.num_lines += len(batch) + len(batch.errors)
+        for (entry, msg, reason) in batch.errors:
+            self.__error(entry, msg, reason)
+        if len(batch) == 0:
+            return
+        self.entry_final = batch.record(len(batch)-1)
+
+        updates = []
+        if self.hosts is not None:
+            updates.append(("hosts", self.hosts.update_batch))
+        if self.time_window is not None:
+            updates.append(("time_window", self.time_window.update_batch))
+        if self.time_stat is not None:
+            updates.append(("time_stat", self.time_stat.update_batch))
+        if self.resources is not None:
+            updates.append(("resources", self.resources.update_batch))
+        if self.paths is not None:
+            updates.append(("paths", self.paths.update_batch))
+        for groups in self.groups:
+            updates.append(("group_by_" + groups.name, groups.update_batch))
+        if self.blocked is not None:
+            updates.append(("blocked", lambda batch: self.__update_batch_blocked(batch,
+                                                                               positions)))
+        if self.__keep_not_found:
+            updates.append(("not_found", self.__update_batch_not_found))
+        if self.__keep_server_errs:
+            updates.append(("server_errors", self.__update_batch_server_errs))
+
+        stats = self.__stats
+        start = time.time()
+        for (name, update) in updates:
+            if stats is None:
+                update(batch)
+                continue
+            begin = time.time()
+            update(batch)
+            stats.add_analyzer_time(name, time.time() - begin)
+        if stats is not None:
+            stats.add_time("aggregate", time.time() - start)
+
+    def __update_batch_blocked(self, batch, positions):
+        """
+        Update the blocked hosts with a LogBatch, and keep the blocked lines.
+        Args:
+            batch(LogBatch): the batch of log items.
+            positions(list or numpy.ndarray): the byte positions of the lines of the batch.
+        """
+        for idx in self.blocked.update_batch(batch):
+            self.blocked_entries.append(batch.lines[idx])
+            if self.__mergeable:
+                self.blocked_positions.append(int(positions[idx]))
+
+    def __update_batch_not_found(self, batch):
+        """
+        Record the resources with status 404 (Not Found) in a LogBatch.
+        Args:
+            batch(LogBatch): the batch of log items.
+        """
+        requests = batch.request[batch.status == 404]
+        (requests, first) = np.unique(requests, return_index=True)
+        for request in requests[first.argsort()].tolist():
+            self.__not_found(request)
+
+    def __update_batch_server_errs(self, batch):
+        """
+        Keep the lines with server errors in a LogBatch.
+        Args:
+            batch(LogBatch): the batch of log items.
+        """
+        errors = (batch.status >= 500) & (batch.status < 600)
+        for idx in np.flatnonzero(errors).tolist():
+            self.server_errs.append(batch.lines[idx])
+
+    def merge(self, other, replay=None):
+        """
+        Merge a mergeable LogAnalysis of the part of the log file that follows the entries
+        of this LogAnalysis. The result is the same as updating this LogAnalysis with the
+        entries of other.
+        Args:
+            other(LogAnalysis): the mergeable LogAnalysis with the same analyzers.
+            replay(function): replay(hosts) returns an iterable of ((position, line), entry)
+                for the entries of any of the hosts (a set) in the part of other, in order. entry is the
+                LogRecord with the IDs of this LogAnalysis. It is needed to continue the
+                blocking of the hosts that are monitored or blocked at the end of this
+                LogAnalysis (BlockedHosts.merge).
+        """
+        host_ids = self.host_names.merge(other.host_names)
+        resource_ids = self.resource_names.merge(other.resource_names)
+
+        if self.hosts is not None:
+            self.hosts.merge(other.hosts, host_ids)
+        if self.resources is not None:
+            self.resources.merge(other.resources, resource_ids)
+        if self.paths is not None:
+            self.paths.merge(other.paths, resource_ids)
+        for (groups, other_groups) in zip(self.groups, other.groups):
+            groups.merge(other_groups, host_ids, resource_ids)
+        if self.time_stat is not None:
+            self.time_stat.merge(other.time_stat, host_ids)
+        if self.time_window is not None:
+            self.time_window.merge(other.time_window)
+
+        changed = []
+        if self.blocked is not None:
+            changed = self.blocked.merge(other.blocked, host_ids, replay)
+        removed = set(position for ((position, _), is_blocked) in changed if not is_blocked)
+        entries = [(position, line) for (position, line)
+                   in zip(other.blocked_positions, other.blocked_entries)
+                   if position not in removed]
+        entries.extend(key for (key, is_blocked) in changed if is_blocked)
+        for (position, line) in sorted(entries):
+            self.blocked_entries.append(line)
+            if self.__mergeable:
+                self.blocked_positions.append(position)
+
+        self.num_lines += other.num_lines
+        self.server_errs.extend(other.server_errs)
+        for request in other.resources_not_found_order:
+            self.__not_found(resource_ids[request])
+        for (line, msg, reason) in other.errors:
+            self.__error(line, msg, reason)
+        if other.entry_final is not None:
+            self.entry_final = other.entry_final
+            if self.entry_final.host is not None:
+                self.entry_final = self.entry_final._replace(host=host_ids[self.entry_final.host])
+            if self.entry_final.request is not None:
+                self.entry_final = self.entry_final._replace(
+                    request=resource_ids[self.entry_final.request])
+
+    def finalize(self, provisional=False):
+        """
+        At the end of the file, time window analysis needs extra operations to get the
+        final results.
+        Args:
+            provisional(bool): if True, the LogAnalysis can still be updated afterwards, e.g.
+                when the log file is still growing (TimeWindow.finalize).
+        Returns:
+            time_window(TimeWindow): the finalized TimeWindow to get the busiest periods
+                from, None if the time_window analyzer doesn't run.
+        """
+        if self.time_window is None or self.entry_final is None:
+            return self.time_window
+        return self.time_window.finalize(self.entry_final, provisional)
+
+class TestLogAnalysis(unittest.TestCase):
+    """
+    Unittest Class for updating and merging the LogAnalysis.
+    """
+    def setUp(self):
+        self.lines = []
+        for (second, host, request, status) in [(1, "A", "/login", 401), (2, "A", "/login", 401),
+                                                (3, "B", "/x", 404), (4, "A", "/login", 401),
+                                                (5, "A", "/", 200), (6, "B", "/y", 500),
+                                                (7, "C", "/x", 404), (9, "A", "/z", 200)]:
+            self.lines.append('{0} - - [01/Jul/1995:00:00:{1:02d} -0400] "GET {2} HTTP/1.0" '
+                              '{3} 10\n'.format(host, second, request, status))
+        self.positions = [sum(len(line) for line in self.lines[:idx])
+                          for idx in range(len(self.lines))]
+
+    def check(self, analysis):
+        analysis.finalize()
+        self.assertEqual(analysis.blocked_entries, self.lines[4:5] + self.lines[7:])
+        self.assertEqual(analysis.server_errs, self.lines[5:6])
+        self.assertEqual([analysis.resource_names.decode(idx)
+                          for idx in analysis.resources_not_found_order], ["/x"])
+        self.assertEqual(analysis.hosts.top(1, host.COUNT), [(5, "A")])
+        if analysis.paths is not None:
+            self.assertEqual(analysis.paths.get("/"), (8, 80))
+        self.assertEqual(analysis.time_window.top()[0], [8, "01/Jul/1995:00:00:01 -0400"])
+
+    def test_update(self):
+        analysis = LogAnalysis(analyzers=list(ANALYZERS))
+        for line in self.lines + ["bad line\n"]:
+            analysis.update(line)
+        self.assertEqual(analysis.errors[0][0], "bad line\n")
+        self.assertEqual(analysis.errors[0][2], read_entry.NO_PATTERN)
+        sizes = analysis.sizes()
+        self.assertEqual((sizes["distinct_hosts"], sizes["distinct_resources"]), (3, 5))
+        self.assertEqual((sizes["blocked_lines"], sizes["server_error_lines"]), (2, 1))
+        self.assertEqual(sizes["time_window_queue"], 8)
+        self.check(analysis)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_merge(self):
+        for split in range(len(self.lines)):
+            analysis = LogAnalysis(analyzers=list(ANALYZERS))
+            first = LogAnalysis(mergeable=True, analyzers=list(ANALYZERS))
+            second = LogAnalysis(mergeable=True, analyzers=list(ANALYZERS))
+            for (line, position) in zip(self.lines[:split], self.positions[:split]):
+                first.update(line, position)
+            batch = read_entry.read_batch(self.lines[split:], second.host_names,
+                                          second.resource_names)
+            second.update_batch(batch, self.positions[split:])
+
+            def replay(host_ids):
+                for (line, position) in zip(self.lines[split:], self.positions[split:]):
+                    record = read_entry.read_entry(line, epoch=True, record=True,
+                                                   hosts=analysis.host_names,
+                                                   resources=analysis.resource_names)
+                    if record.host in host_ids:
+                        yield ((position, line), record)
+            analysis.merge(first)
+            analysis.merge(second, replay)
+            self.check(analysis)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_analyzers(self):
+        analysis = LogAnalysis()
+        self.assertEqual(analysis.analyzers, DEFAULT_ANALYZERS)
+        self.assertTrue("paths" not in analysis.analyzers and analysis.paths is None)
+
+        analysis = LogAnalysis(analyzers=["blocked", "server_errors"])
+        self.assertEqual(analysis.analyzers, ["blocked", "server_errors"])
+        self.assertEqual(analysis.fields, set([read_entry.HOST, read_entry.TIME,
+                                               read_entry.REQUEST, read_entry.STATUS]))
+        self.assertTrue(analysis.hosts is None and analysis.time_stat is None)
+        batch = read_entry.read_batch(self.lines[:4], analysis.host_names,
+                                      analysis.resource_names, analysis.fields)
+        analysis.update_batch(batch)
+        for line in self.lines[4:]:
+            analysis.update(line)
+        analysis.finalize()
+        self.assertEqual(analysis.blocked_entries, self.lines[4:5] + self.lines[7:])
+        self.assertEqual(analysis.server_errs, self.lines[5:6])
+        self.assertEqual(analysis.resources_not_found_order, [])
+
+        analysis = LogAnalysis(analyzers=["server_errors"])
+        for line in self.lines:
+            analysis.update(line)
+        self.assertEqual(len(analysis.host_names), 0)
+        self.assertEqual(analysis.server_errs, self.lines[5:6])
+        self.assertRaises(KeyError, LogAnalysis, analyzers=["unknown"])
+
+        analysis = LogAnalysis(analyzers=["server_errors"],
+                               group_by=[(read_entry.HOST, read_entry.STATUS)])
+        self.assertEqual(analysis.fields, set([read_entry.HOST, read_entry.STATUS,
+                                               read_entry.SIZE]))
+        for line in self.lines:
+            analysis.update(line)
+        self.assertEqual(analysis.sizes()["groups_host_status"], 5)
+        self.assertEqual(analysis.groups[0].top(1), [(("A", 401), (3, 30, 10, 10))])
+
+    def test_time_histogram(self):
+        analysis = LogAnalysis(time_histogram=True)
+        for line in self.lines:
+            analysis.update(line)
+        self.assertEqual(analysis.sizes()["time_window_queue"], 8)
+        self.check(analysis)
+
+    def test_finalize_provisional(self):
+        analysis = LogAnalysis()
+        self.assertTrue(analysis.finalize(provisional=True) is analysis.time_window)
+        for line in self.lines[:5]:
+            analysis.update(line)
+        window = analysis.finalize(provisional=True)
+        self.assertEqual(window.top()[0], [5, "01/Jul/1995:00:00:01 -0400"])
+        for line in self.lines[5:]:
+            analysis.update(line)
+        self.check(analysis)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+This module contains:
+    CacheWriter:
+        A class that writes the parsed batches of a log file into a binary columnar cache.
+    CachedLines:
+        A sequence of the lines of a log file, read from the file when they are indexed.
+    load_cache():
+        A function that loads the cache of a log file with memory-mapped columns.
+    file_signature():
+        A function that returns the size, the modification time and the hash of a file.
+The cache of a log file is the directory <log file>.cache next to the log file. It contains
+one raw int64 file for each column of the LogBatch, the byte positions of the parsed lines
+and of the lines with format error in the log file, the host and resource names in the
+order of their IDs, and a meta file with the signature of the log file. The cache is only
+used if the signature of the log file still matches.
+Author: Yuan Huang
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import unittest
+import tempfile
+import utility
+import read_entry
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".cache"
+HASH_BLOCK_SIZE = 1 << 20
+POSITION = "position"
+ERROR_POSITION = "error_position"
+(HOSTS_FILE, RESOURCES_FILE, META_FILE) = ("hosts.txt", "resources.txt", "meta.json")
+
+def cache_path(infile):
+    """
+    Get the directory of the cache of a log file.
+    Args:
+        infile(str): the name of the log file.
+    Returns:
+        path(str): the directory of the cache.
+    """
+    return infile + CACHE_SUFFIX
+
+def file_signature(infile):
+    """
+    Get the signature of a file to tell whether the file is changed.
+    Args:
+        infile(str): the name of the file.
+    Returns:
+        signature(dict): the size, the modification time and the md5 hash of the file.
+    """
+    stat = os.stat(infile)
+    md5 = hashlib.md5()
+    with open(infile, "rb") as reader:
+        for block in iter(lambda: reader.read(HASH_BLOCK_SIZE), b""):
+            md5.update(block)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "md5": md5.hexdigest()}
+
+def write_names(filename, names):
+    """
+    Write the names of a vocabulary, one name in a line, in the order of their IDs.
+    Args:
+        filename(str): the name of the file.
+        names(list): the names of the vocabulary.
+    """
+    with open(filename, "wb") as writer:
+        for name in names:
+            writer.write(name + b"\n")
+
+def read_names(filename, vocabulary):
+    """
+    Read the names written by write_names into a vocabulary. The names are added in the
+    order of their IDs, so the vocabulary is iterated in the same order as when it is written.
+    Args:
+        filename(str): the name of the file.
+        vocabulary(utility.Vocabulary): an empty vocabulary.
+    """
+    with open(filename, "rb") as reader:
+        for name in reader:
+            vocabulary[name[:-1]]
+
+class CacheWriter(object):
+    """
+    A class that writes the parsed batches of a log file into the cache of the log file.
+    The batches are appended to the column files as they are parsed, and the cache is
+    only moved into place when it is closed, so an unfinished cache is never loaded.
+    Example: writer = CacheWriter(infile); writer.append(batch, lines);
+             writer.close(hosts, resources)
+    Private members:
+        __infile(str): the name of the log file.
+        __signature(dict): the signature of the log file when the writer is created.
+        __directory(str): the temporary directory of the cache.
+        __writers(dict): the opened column files.
+        __position(int): the byte position of the next line in the log file.
+        __counts(list): the number of parsed lines and the number of lines with format error.
+    """
+    def __init__(self, infile):
+        """
+        Args:
+            infile(str): the name of the log file.
+        Raises:
+            ImportError: Error occurs when numpy is not installed.
+        """
+        if np is None:
+            raise ImportError("numpy is required to write the cache")
+        self.__infile = infile
+        self.__signature = file_signature(infile)
+        self.__directory = tempfile.mkdtemp(prefix=os.path.basename(cache_path(infile)) + ".",
+                                            dir=os.path.dirname(os.path.abspath(infile)))
+        self.__writers = {}
+        for name in read_entry.LogBatch.COLUMNS + (POSITION, ERROR_POSITION):
+            self.__writers[name] = open(os.path.join(self.__directory, name + ".bin"), "wb")
+        self.__position = 0
+        self.__counts = [0, 0]
+
+    def append(self, batch, lines):
+        """
+        Append a batch to the cache.
+        Args:
+            batch(LogBatch): the batch read from lines by read_entry.read_batch.
+            lines(list): the chunk of lines of the batch, in the order of the log file.
+        """
+        starts = np.cumsum([0] + [len(line) for line in lines], dtype=np.int64)
+        positions = starts[:-1] + self.__position
+        self.__position += int(starts[-1])
+
+        parsed = np.zeros(len(lines), dtype=bool)
+        parsed[batch.index] = True
+        for name in read_entry.LogBatch.COLUMNS:
+            getattr(batch, name).astype(np.int64).tofile(self.__writers[name])
+        positions[parsed].tofile(self.__writers[POSITION])
+        positions[~parsed].tofile(self.__writers[ERROR_POSITION])
+        self.__counts[0] += len(batch)
+        self.__counts[1] += len(lines) - len(batch)
+
+    def close(self, hosts, resources):
+        """
+        Write the vocabularies and the meta file, and move the cache into place.
+        Args:
+            hosts(utility.Vocabulary): the vocabulary of the host IDs.
+            resources(utility.Vocabulary): the vocabulary of the resource IDs.
+        """
+        for writer in self.__writers.values():
+            writer.close()
+        write_names(os.path.join(self.__directory, HOSTS_FILE), hosts.names)
+        write_names(os.path.join(self.__directory, RESOURCES_FILE), resources.names)
+        meta = dict(self.__signature, version=CACHE_VERSION, lines=self.__counts[0],
+                    errors=self.__counts[1])
+        with open(os.path.join(self.__directory, META_FILE), "w") as writer:
+            json.dump(meta, writer)
+
+        path = cache_path(self.__infile)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(self.__directory, path)
+
+    def discard(self):
+        """
+        Remove the unfinished cache.
+        """
+        for writer in self.__writers.values():
+            writer.close()
+        shutil.rmtree(self.__directory, ignore_errors=True)
+
+class CachedLines(object):
+    """
+    A sequence of lines of a log file given by their byte positions. A line is read from
+    the log file only when it is indexed, e.g. for the blocked logs. The log file is kept
+    open while the CachedLines is used, and is shared with its slices.
+    Private members:
+        __reader(file): the log file opened in binary mode.
+        __positions(numpy.ndarray): the byte positions of the lines.
+    """
+    def __init__(self, infile, positions, reader=None):
+        """
+        Args:
+            infile(str): the name of the log file.
+            positions(numpy.ndarray): the byte positions of the lines.
+            reader(file): the opened log file to share, None to open it.
+        """
+        self.__reader = open(infile, "rb") if reader is None else reader
+        self.__positions = positions
+
+    def __len__(self):
+        return len(self.__positions)
+
+    def __getitem__(self, idx):
+        """
+        Args:
+            idx(int or slice): the index of the line, or a slice of the lines.
+        Returns:
+            line(str) or CachedLines object for a slice.
+        """
+        if isinstance(idx, slice):
+            return CachedLines(self.__reader.name, self.__positions[idx], self.__reader)
+        self.__reader.seek(int(self.__positions[idx]))
+        return self.__reader.readline()
+
+    def close(self):
+        """
+        Close the log file, also for the slices.
+        """
+        self.__reader.close()
+
+def load_cache(infile, hosts, resources):
+    """
+    Load the cache of a log file. The columns are memory-mapped, so they are read from the
+    disk only when they are used.
+    Args:
+        infile(str): the name of the log file.
+        hosts(utility.Vocabulary): an empty vocabulary to load the host IDs into.
+        resources(utility.Vocabulary): an empty vocabulary to load the resource IDs into.
+    Returns:
+        batch(LogBatch): the batch of the whole log file; or None if there is no cache or
+            the log file is changed after the cache is written.
+    Raises:
+        ImportError: Error occurs when numpy is not installed.
+    """
+    if np is None:
+        raise ImportError("numpy is required to load the cache")
+    path = cache_path(infile)
+    try:
+        with open(os.path.join(path, META_FILE), "r") as reader:
+            meta = json.load(reader)
+    except (IOError, OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    stat = os.stat(infile)
+    if meta["size"] != stat.st_size or meta["mtime"] != stat.st_mtime:
+        return None
+    if meta["md5"] != file_signature(infile)["md5"]:
+        return None
+
+    def column(name, length):
+        if length == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.memmap(os.path.join(path, name + ".bin"), dtype=np.int64, mode="r",
+                         shape=(length,))
+
+    read_names(os.path.join(path, HOSTS_FILE), hosts)
+    read_names(os.path.join(path, RESOURCES_FILE), resources)
+
+    errors = []
+    error_lines = CachedLines(infile, column(ERROR_POSITION, meta["errors"]))
+    for line in error_lines:
+        try:
+            read_entry.read_entry(line)
+        except read_entry.EntryError as error:
+            errors.append((line, str(error), error.reason))
+    error_lines.close()
+    lines = CachedLines(infile, column(POSITION, meta["lines"]))
+    batch = read_entry.LogBatch(lines, errors, [column(name, meta["lines"])
+                                                for name in read_entry.LogBatch.COLUMNS])
+    return batch
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestLogCache(unittest.TestCase):
+    """
+    Unittest Class for writing and loading the cache.
+    """
+    def setUp(self):
+        """
+        Write a small log file in a temporary directory.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.infile = os.path.join(self.directory, "log.txt")
+        self.lines = ['199.72.81.55 - - [01/Jul/1995:00:00:01 -0400] "POST /login HTTP/1.0" 401 -\n',
+                      'bad line\n',
+                      'unicomp6.unicomp.net - - [01/Jul/1995:00:00:06 -0400] "GET / HTTP/1.0" 200 3985\n',
+                      '199.72.81.55 - - [01/Jul/1995:00:00:09 -0400] "GET / HTTP/1.0" 200 3985\n']
+        with open(self.infile, "w") as writer:
+            writer.writelines(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self):
+        hosts = utility.Vocabulary()
+        resources = utility.Vocabulary()
+        writer = CacheWriter(self.infile)
+        for chunk in (self.lines[:3], self.lines[3:]):
+            writer.append(read_entry.read_batch(chunk, hosts, resources), chunk)
+        writer.close(hosts, resources)
+        return (hosts, resources)
+
+    def test_load_cache(self):
+        """
+        Test the loaded columns, vocabularies and lines are the same as the parsed ones.
+        """
+        cached_hosts = utility.Vocabulary()
+        cached_resources = utility.Vocabulary()
+        self.assertEqual(load_cache(self.infile, cached_hosts, cached_resources), None)
+        (hosts, resources) = self.write()
+        batch = load_cache(self.infile, cached_hosts, cached_resources)
+
+        self.assertEqual(cached_hosts, hosts)
+        self.assertEqual(list(cached_hosts), list(hosts))
+        self.assertEqual(cached_resources.names, resources.names)
+        expected = read_entry.read_batch(self.lines, utility.Vocabulary(), utility.Vocabulary())
+        self.assertEqual(len(batch), 3)
+        for name in read_entry.LogBatch.COLUMNS:
+            self.assertEqual(list(getattr(batch, name)), list(getattr(expected, name)))
+        self.assertEqual(batch.lines[2], self.lines[3])
+        self.assertEqual(list(batch.lines[1:]), self.lines[2:])
+        self.assertEqual(batch.errors[0][0], "bad line\n")
+        batch.lines.close()
+
+    def test_stale_cache(self):
+        """
+        Test the cache is not used after the log file is changed.
+        """
+        self.write()
+        with open(self.infile, "a") as writer:
+            writer.write(self.lines[0])
+        self.assertEqual(load_cache(self.infile, utility.Vocabulary(), utility.Vocabulary()),
+                         None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class to read the lines appended to a growing log file, like "tail -F".
+The file is kept open between the reads. When the log file is rotated (renamed and created
+again, or truncated in place), the rest of the old file is read before the new file.
+Author: Yuan Huang
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+import chunk_reader
+
+class LogFollower(object):
+    """
+    The class that reads the new complete lines of a growing log file.
+    Example: follower = LogFollower(infile)
+             while True:
+                 lines = follower.read()
+                 if not lines: time.sleep(1)
+    Args:
+        infile(str): the name of the log file.
+        chunk_size(int): the maximum number of bytes read at once.
+    Public variables:
+        position(int): the byte position of the next line to read in the current file.
+        rotations(int): the number of times the log file is found rotated or truncated.
+    """
+    def __init__(self, infile, chunk_size=chunk_reader.CHUNK_SIZE):
+        self.__infile = infile
+        self.__chunk_size = chunk_size
+        # The file is read without buffering, so that a read after the end of the file
+        # gets the lines that are appended later.
+        self.__file = io.open(infile, "rb", buffering=0)
+        self.__rest = b""
+        self.position = 0
+        self.rotations = 0
+
+    def close(self):
+        """
+        Close the log file.
+        """
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __read_lines(self):
+        """
+        Read the new complete lines of the current file. An incomplete line at the end of the
+        file is kept until its end is written.
+        Returns:
+            lines(list): the new lines.
+        """
+        data = self.__file.read(self.__chunk_size)
+        if not data:
+            return []
+        data = self.__rest + data
+        stop = data.rfind(b"\n") + 1
+        self.__rest = data[stop:]
+        self.position += stop
+        return list(BytesIO(data[:stop]))
+
+    def __rotated(self):
+        """
+        Check if the log file is rotated: the file name points to another file, or the file
+        is shorter than what is read.
+        Returns:
+            "moved", "truncated", or None if the log file is not rotated.
+        """
+        try:
+            stat = os.stat(self.__infile)
+        except OSError:
+            # The file is moved away and not created yet.
+            return None
+        current = os.fstat(self.__file.fileno())
+        if (stat.st_ino, stat.st_dev) != (current.st_ino, current.st_dev):
+            return "moved"
+        if stat.st_size < self.position + len(self.__rest):
+            return "truncated"
+        return None
+
+    def read(self):
+        """
+        Read the new complete lines of the log file, at most chunk_size bytes at once.
+        Returns:
+            lines(list): the new lines, empty if nothing new is written.
+        """
+        lines = self.__read_lines()
+        if lines:
+            return lines
+        rotated = self.__rotated()
+        if rotated is None:
+            return lines
+        if rotated == "moved":
+            # Read what is written to the old file since the last read.
+            while True:
+                new_lines = self.__read_lines()
+                if not new_lines:
+                    break
+                lines.extend(new_lines)
+            self.__file.close()
+            self.__file = io.open(self.__infile, "rb", buffering=0)
+        else:
+            self.__file.seek(0)
+        # The last line of the old file may have no new line character.
+        if self.__rest:
+            lines.append(self.__rest)
+        self.__rest = b""
+        self.position = 0
+        self.rotations += 1
+        return lines + self.__read_lines()
+
+class TestLogFollower(unittest.TestCase):
+    """
+    Unittest Class for following a growing log file.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.infile = os.path.join(self.directory, "log.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode="ab", infile=None):
+        with open(infile or self.infile, mode) as writer:
+            writer.write(data)
+
+    def test_read(self):
+        self.write(b"a\nb\nc")
+        with LogFollower(self.infile, chunk_size=3) as follower:
+            self.assertEqual(follower.read(), ["a\n"])
+            self.assertEqual(follower.read(), ["b\n"])
+            self.assertEqual(follower.read(), [])
+            self.write(b"cc\nd\n")
+            lines = []
+            while True:
+                new_lines = follower.read()
+                if not new_lines:
+                    break
+                lines.extend(new_lines)
+            self.assertEqual(lines, ["ccc\n", "d\n"])
+            self.assertEqual(follower.position, 10)
+            self.assertEqual(follower.rotations, 0)
+
+    def test_rotation(self):
+        self.write(b"a\n")
+        with LogFollower(self.infile) as follower:
+            self.assertEqual(follower.read(), ["a\n"])
+            self.write(b"b\nc")
+            os.rename(self.infile, self.infile + ".1")
+            self.assertEqual(follower.read(), ["b\n"])
+            self.assertEqual(follower.read(), [])
+            self.write(b"d\n")
+            self.assertEqual(follower.read(), ["c", "d\n"])
+            self.assertEqual(follower.rotations, 1)
+
+            # The file is truncated in place (copytruncate).
+            self.write(b"ff\n")
+            self.assertEqual(follower.read(), ["ff\n"])
+            self.write(b"", mode="wb")
+            self.write(b"e\n")
+            self.assertEqual(follower.read(), ["e\n"])
+            self.assertEqual(follower.rotations, 2)
+            self.assertEqual(follower.position, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Time the hot paths of the analysis one by one, on synthetic lines (see synthetic_log.py), so
+a slowdown can be traced to the component that causes it.
+    python src/microbenchmark.py --baseline benchmark/micro_baseline.json --save-baseline
+    python src/microbenchmark.py --baseline benchmark/micro_baseline.json
+The input of each case is prepared before it is timed. Each case is run --repeat times and
+the fastest run is kept; the time per operation (a line, an entry, a query or a push) is
+written into --output. If the baseline file exists, the exit status is 1 if a case is slower
+than the baseline by more than its threshold (THRESHOLDS, or --tolerance for the others).
+Author: Yuan Huang
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import unittest
+from collections import OrderedDict
+import utility
+import read_entry
+import time_window
+import benchmark
+import block_hosts
+import host_activity
+import synthetic_log
+
+# The thresholds of the cases that are too short to be timed precisely.
+THRESHOLDS = {"host_activity_top": 0.3, "nlargest_dict": 0.3}
+
+# The number of values kept by the top-k containers, as in LogAnalysis.
+N_TOP = 10
+
+def synthetic_lines(size, seed=0):
+    """
+    Get the lines of a synthetic log file, with about one host in 20 lines and one resource
+    in 200 lines.
+    Args:
+        size(int): the number of lines.
+        seed(int): the seed of the random numbers.
+    Returns:
+        lines(list): the lines.
+    """
+    generator = synthetic_log.LogGenerator(hosts=max(size // 20, 10),
+                                           resources=max(size // 200, 10),
+                                           burst_rate=0.005, seed=seed)
+    return list(generator.lines(size))
+
+def parsed_records(lines):
+    """
+    Parse the lines into LogRecords with integer IDs, as LogAnalysis does.
+    Args:
+        lines(list): the lines.
+    Returns:
+        (records, hosts, resources): the LogRecords, and the vocabularies of the hosts and
+            the resources.
+    """
+    (hosts, resources) = (utility.Vocabulary(), utility.Vocabulary())
+    records = [read_entry.read_entry(line, epoch=True, record=True, hosts=hosts,
+                                     resources=resources) for line in lines]
+    return (records, hosts, resources)
+
+def case_read_entry(size):
+    """
+    Parse lines with read_entry.read_entry.
+    """
+    lines = synthetic_lines(size)
+    def run():
+        (hosts, resources) = (utility.Vocabulary(), utility.Vocabulary())
+        for line in lines:
+            read_entry.read_entry(line, epoch=True, record=True, hosts=hosts,
+                                  resources=resources)
+    return (run, size)
+
+def case_time_window_update(size):
+    """
+    Update a TimeWindow with entries.
+    """
+    (records, _, _) = parsed_records(synthetic_lines(size))
+    def run():
+        window = time_window.TimeWindow(hours=1, n_top=N_TOP, epoch=True)
+        for record in records:
+            window.update(record)
+    return (run, size)
+
+def case_blocked_hosts_update(size):
+    """
+    Update a BlockedHosts with entries.
+    """
+    (records, _, resources) = parsed_records(synthetic_lines(size))
+    def run():
+        blocked = block_hosts.BlockedHosts(epoch=True, resources=resources)
+        for record in records:
+            blocked.update(record)
+    return (run, size)
+
+def case_host_activity_top(size):
+    """
+    Query the top hosts of a HostActivity.
+    """
+    (records, hosts, _) = parsed_records(synthetic_lines(size))
+    activity = host_activity.HostActivity(hosts)
+    for record in records:
+        activity.update(record)
+    queries = 20
+    def run():
+        for _ in range(queries):
+            activity.top(N_TOP, host_activity.COUNT)
+    return (run, queries)
+
+def case_nlargest_dict(size):
+    """
+    Find the largest values of a dictionary with utility.nlargest_dict.
+    """
+    counts = {}
+    for line in synthetic_lines(size):
+        host = line.split(" ", 1)[0]
+        counts.setdefault(host, [0, 0])[0] += 1
+    queries = 20
+    def run():
+        for _ in range(queries):
+            utility.nlargest_dict(N_TOP, counts, 0)
+    return (run, queries)
+
+def random_values(size):
+    """
+    Get random values to push into the top-k containers, mostly increasing like the counts
+    of the time windows.
+    Args:
+        size(int): the number of values.
+    Returns:
+        values(list): the values.
+    """
+    random_state = random.Random(0)
+    return [(random_state.randint(0, idx + 1), idx) for idx in range(size)]
+
+def case_heap_push(size):
+    """
+    Push values into a utility.Heap that keeps the largest ones.
+    """
+    values = random_values(size)
+    def run():
+        heap = utility.Heap(N_TOP)
+        for value in values:
+            heap.push(value)
+    return (run, size)
+
+def case_linked_list_insert(size):
+    """
+    Insert values into a utility.LinkedList that keeps the largest ones.
+    """
+    values = random_values(size)
+    def run():
+        linked_list = utility.LinkedList(N_TOP)
+        for value in values:
+            if linked_list.length < N_TOP or value > linked_list.min():
+                linked_list.sorted_insert_data(value)
+    return (run, size)
+
+# The cases by name, each prepares its input of a size and returns (run, operations).
+CASES = OrderedDict([("read_entry", case_read_entry),
+                     ("time_window_update", case_time_window_update),
+                     ("blocked_hosts_update", case_blocked_hosts_update),
+                     ("host_activity_top", case_host_activity_top),
+                     ("nlargest_dict", case_nlargest_dict),
+                     ("heap_push", case_heap_push),
+                     ("linked_list_insert", case_linked_list_insert)])
+
+def time_case(case, size, repeat):
+    """
+    Time a case.
+    Args:
+        case(function): the case in CASES.
+        size(int): the size of the input.
+        repeat(int): the number of runs, the fastest is kept.
+    Returns:
+        result(OrderedDict): the number of operations, the time of the fastest run and
+            the time per operation in microseconds.
+    """
+    (run, operations) = case(size)
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        run()
+        seconds = time.time() - start
+        if best is None or seconds < best:
+            best = seconds
+    result = OrderedDict()
+    result["operations"] = operations
+    result["seconds"] = best
+    result["us_per_operation"] = best * 1e6 / operations
+    return result
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the time per operation of the cases with the baseline.
+    Args:
+        results(dict), baseline(dict): the results of the cases.
+        tolerance(float): the fraction that a case may slow down before it is a regression,
+            if it is not in THRESHOLDS.
+    Returns:
+        (rows, regressions): the text rows of the comparison, and the rows of the regressions.
+    """
+    (rows, regressions) = ([], [])
+    for (name, result) in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            rows.append("{0:<22} no baseline".format(name))
+            continue
+        (new, old) = (result["us_per_operation"], base["us_per_operation"])
+        row = "{0:<22} {1:>10.3f} -> {2:>10.3f} us ({3:+.1%})".format(name, old, new,
+                                                                     new / old - 1)
+        if new > old * (1 + THRESHOLDS.get(name, tolerance)):
+            row += " REGRESSION"
+            regressions.append(row)
+        rows.append(row)
+    if results["size"] != baseline.get("size"):
+        rows.append("The baseline is of size {0}".format(baseline.get("size")))
+    return (rows, regressions)
+
+def main(argv):
+    """
+    Run the microbenchmarks.
+    Args:
+        argv(list): the command line arguments.
+    Returns:
+        status(int): the exit status, 1 if there is a regression.
+    """
+    parser = argparse.ArgumentParser(description="Time the hot paths of the analysis")
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help="A comma-separated list of the cases, from: {0}"
+                             .format(", ".join(CASES)))
+    parser.add_argument("--size", type=int, default=100000,
+                        help="The number of lines or values of the input of the cases")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Run each case this many times and keep the fastest run")
+    parser.add_argument("--output", default="microbenchmark.json",
+                        help="The JSON file of the results")
+    parser.add_argument("--baseline", help="The JSON file of the baseline results")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write the results into the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="The fraction that a case may slow down before it is a regression")
+    args = parser.parse_args(argv)
+    names = [name.strip() for name in args.cases.split(",") if name.strip()]
+    for name in names:
+        if name not in CASES:
+            parser.error("unknown case {0}, choose from: {1}".format(name, ", ".join(CASES)))
+    if args.save_baseline and args.baseline is None:
+        parser.error("--save-baseline requires --baseline")
+
+    results = OrderedDict()
+    results["size"] = args.size
+    results["python"] = platform.python_version()
+    results["platform"] = platform.platform()
+    results["time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    results["cases"] = OrderedDict()
+    for name in names:
+        result = time_case(CASES[name], args.size, args.repeat)
+        print("{0:<22} {1:>10.3f} us per operation".format(name, result["us_per_operation"]))
+        results["cases"][name] = result
+    benchmark.write_json(args.output, results)
+
+    if args.baseline is None:
+        return 0
+    if args.save_baseline:
+        benchmark.write_json(args.baseline, results)
+        print("The baseline is saved to {0}".format(args.baseline))
+        return 0
+    try:
+        with open(args.baseline) as reader:
+            baseline = json.load(reader, object_pairs_hook=OrderedDict)
+    except IOError:
+        print("The baseline {0} doesn't exist, use --save-baseline".format(args.baseline))
+        return 0
+    (rows, regressions) = compare(results, baseline, args.tolerance)
+    print("\n".join(rows))
+    return 1 if regressions else 0
+
+class TestMicrobenchmark(unittest.TestCase):
+    """
+    Unittest Class for the microbenchmarks.
+    """
+    def test_cases(self):
+        for (name, case) in CASES.items():
+            result = time_case(case, 200, 1)
+            self.assertTrue(result["operations"] > 0, name)
+            self.assertTrue(result["us_per_operation"] >= 0, name)
+
+    def test_compare(self):
+        results = {"size": 10, "cases": {"heap_push": {"us_per_operation": 1.2},
+                                         "nlargest_dict": {"us_per_operation": 1.2},
+                                         "read_entry": {"us_per_operation": 1.0}}}
+        baseline = {"size": 10, "cases": {"heap_push": {"us_per_operation": 1.0},
+                                          "nlargest_dict": {"us_per_operation": 1.0}}}
+        (rows, regressions) = compare(results, baseline, 0.1)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("heap_push"))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+This module contains:
+    process_part():
+        A function that reads a byte range of a log file into a mergeable LogAnalysis.
+    process_parallel():
+        A function that reads the parts of a log file in worker processes, and merges the
+        LogAnalysis of the parts in order.
+The LogAnalysis of the parts are merged in the order of the log file, so the outputs are the
+same as reading the whole log file in one process. The log file is split into byte ranges
+at line boundaries and read through a memory map (chunk_reader.ChunkReader). The hosts that are monitored or blocked
+at the end of a part are replayed over their lines in the next part, which are found in one
+pass by searching the host names at the start of the lines (BlockedHosts.merge).
+Author: Yuan Huang
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+import read_entry
+import log_analysis
+import chunk_reader
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The default number of lines in a batch read by a worker process.
+BATCH_SIZE = 10000
+
+def process_part(task):
+    """
+    Read a byte range of a log file into a mergeable LogAnalysis. It runs in the worker
+    processes of process_parallel.
+    Args:
+        task(tuple): (infile, start, end, batch_size, analyzers, capacity, group_by), the
+            name of the log file, the byte range, the number of lines in a batch, the names
+            of the analyzers, the capacity of the top hosts and resources and the fields to
+            group by (LogAnalysis).
+    Returns:
+        analysis(LogAnalysis): the mergeable LogAnalysis of the range.
+    """
+    (infile, start, end, batch_size, analyzers, capacity, group_by) = task
+    analysis = log_analysis.LogAnalysis(mergeable=True, analyzers=analyzers, capacity=capacity,
+                                        group_by=group_by)
+    with chunk_reader.ChunkReader(infile) as reader:
+        for (lines, positions) in reader.batches(batch_size, start, end):
+            batch = read_entry.read_batch(lines, analysis.host_names, analysis.resource_names,
+                                          analysis.fields)
+            analysis.update_batch(batch, positions[batch.index])
+    return analysis
+
+def replay_part(data, start, end, analysis, part=None):
+    """
+    Get the function to replay the entries of some hosts in a byte range of a log file.
+    Args:
+        data(mmap or str): the content of the log file.
+        start(int), end(int): the byte range.
+        analysis(LogAnalysis): the LogAnalysis that the IDs of the entries are from.
+        part(LogAnalysis): the LogAnalysis of the range, the hosts it hasn't seen are not
+            searched.
+    Returns:
+        replay(function): replay(hosts) returns a generator of ((position, line), entry)
+            for the lines of the host IDs in the range, found in one pass, see
+            LogAnalysis.merge.
+    """
+    def replay(hosts):
+        names = [analysis.host_names.decode(host) for host in sorted(hosts)]
+        if part is not None:
+            names = [name for name in names if name in part.host_names]
+        if not names:
+            return
+        pattern = re.compile(r"^(?:" + "|".join(re.escape(name) for name in names) +
+                             r")[^\S\n][^\n]*\n?", re.M)
+        for match in pattern.finditer(data, start, end):
+            line = match.group(0)
+            try:
+                entry = read_entry.read_entry(line, epoch=True, record=True,
+                                              hosts=analysis.host_names,
+                                              resources=analysis.resource_names)
+            except TypeError:
+                continue
+            if entry.host in hosts:
+                yield ((match.start(), line), entry)
+    return replay
+
+def process_parallel(infile, analysis, workers, batch_size=BATCH_SIZE):
+    """
+    Split a log file into parts, read the parts in worker processes and merge them in order.
+    Args:
+        infile(str): the name of the log file.
+        analysis(LogAnalysis): the LogAnalysis to merge the parts into, the parts run the
+            same analyzers with the same capacity and group by the same fields.
+        workers(int): the number of worker processes, the file is split into as many parts.
+        batch_size(int): the number of lines in a batch read by the workers.
+    Raises:
+        ImportError: Error occurs when numpy is not installed.
+    """
+    if np is None:
+        raise ImportError("numpy is required to read the log in parallel")
+    with chunk_reader.ChunkReader(infile) as reader:
+        ranges = reader.split(workers)
+        if not ranges:
+            return
+        tasks = [(infile, start, end, batch_size, analysis.analyzers, analysis.capacity,
+                  analysis.group_by) for (start, end) in ranges]
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            for ((start, end), part) in zip(ranges, pool.imap(process_part, tasks)):
+                analysis.merge(part, replay_part(reader.data, start, end, analysis, part))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+class TestParallel(unittest.TestCase):
+    """
+    Unittest Class for reading a log file in parallel.
+    """
+    def setUp(self):
+        """
+        Write a log file with failed logins around the boundaries of the parts.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.infile = os.path.join(self.directory, "log.txt")
+        lines = []
+        for second in range(0, 400, 2):
+            if second % 100 < 10:
+                (host, request, status) = ("A", "/login", 401)
+            elif second % 50 == 0:
+                (host, request, status) = ("B", "/x", 404)
+            else:
+                (host, request, status) = ("A" if second % 3 else "C", "/y", 200)
+            lines.append('{0} - - [01/Jul/1995:00:{1:02d}:{2:02d} -0400] "GET {3} HTTP/1.0" '
+                         '{4} {5}\n'.format(host, second // 60, second % 60, request, status,
+                                            second))
+        lines.insert(50, "bad line\n")
+        with open(self.infile, "w") as writer:
+            writer.writelines(lines)
+        self.lines = lines
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_process_parallel(self):
+        group_by = [(read_entry.HOST, read_entry.STATUS)]
+        expected = log_analysis.LogAnalysis(group_by=group_by)
+        for line in self.lines:
+            expected.update(line)
+        expected.finalize()
+        (top, top_no_overlap) = (expected.time_window.top(), expected.time_window.top_no_overlap())
+        for workers in (1, 2, 5, 13):
+            analysis = log_analysis.LogAnalysis(group_by=group_by)
+            process_parallel(self.infile, analysis, workers, batch_size=7)
+            analysis.finalize()
+            self.assertEqual(analysis.blocked_entries, expected.blocked_entries)
+            self.assertEqual(analysis.server_errs, expected.server_errs)
+            self.assertEqual(analysis.host_names.names, expected.host_names.names)
+            self.assertEqual(analysis.resources_not_found_order,
+                             expected.resources_not_found_order)
+            self.assertEqual(analysis.hosts.top(3, 0), expected.hosts.top(3, 0))
+            self.assertEqual(analysis.time_window.top(), top)
+            self.assertEqual(analysis.time_window.top_no_overlap(), top_no_overlap)
+            self.assertEqual(analysis.time_stat.get_hourly_hosts(),
+                             expected.time_stat.get_hourly_hosts())
+            self.assertEqual(analysis.groups[0].top(10), expected.groups[0].top(10))
+            self.assertEqual(len(analysis.errors), 1)
+
+        analysis = log_analysis.LogAnalysis(analyzers=["blocked"])
+        process_parallel(self.infile, analysis, 5, batch_size=7)
+        self.assertEqual(analysis.blocked_entries, expected.blocked_entries)
+        self.assertEqual(analysis.server_errs, [])
+
+    def test_replay_part(self):
+        data = "".join(self.lines)
+        analysis = log_analysis.LogAnalysis(analyzers=["blocked"])
+        for line in self.lines:
+            analysis.update(line)
+        (a_id, b_id) = (analysis.host_names["A"], analysis.host_names["B"])
+        start = len("".join(self.lines[:100]))
+        replay = replay_part(data, start, len(data), analysis)
+        positions = [position for ((position, _), _) in replay(set([a_id, b_id]))]
+        expected = [data.index(line, start) for line in self.lines[100:]
+                    if line.startswith(("A ", "B "))]
+        self.assertEqual(positions, expected)
+
+        part = log_analysis.LogAnalysis(mergeable=True, analyzers=["blocked"])
+        for line in self.lines[100:]:
+            if not line.startswith("B "):
+                part.update(line)
+        replay = replay_part(data, start, len(data), analysis, part)
+        self.assertEqual(list(replay(set([b_id]))), [])
+        self.assertEqual(len(list(replay(set([a_id, b_id])))), sum(
+            1 for line in self.lines[100:] if line.startswith("A ")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class to sum up the requests and the bandwidth of the resources by the prefixes of
+their paths, e.g. to find the directories under /images/ that use the most bandwidth.
+The paths are split after each "/", and each prefix is a node of a tree with the number of
+requests and the bandwidth of all the resources under it, so the resources share the nodes of
+their common prefixes. The nodes of the prefixes of a resource are found when it is first seen,
+and each request then adds to them, so the sums of any prefix are up to date at any time.
+Global Variables:
+    COUNT
+    BANDWIDTH
+Author: Yuan Huang
+"""
+import array
+import unittest
+import utility
+import read_entry
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# COUNT and BANDWIDTH are public variables which can be used when set the sorting method in
+# the PathTrie.top() function, the same as in resource_statistics.
+# COUNT: The total number of requests under a prefix
+COUNT = 0
+# BANDWIDTH: The total network traffic under a prefix
+BANDWIDTH = 2
+
+def split_path(path):
+    """
+    Split a path into the segments of the prefixes, after each "/".
+    Example: split_path("/images/logo.gif") returns ["/", "images/", "logo.gif"].
+    Args:
+        path(str): the path of a resource.
+    Returns:
+        segments(list): the segments, their concatenation is the path.
+    """
+    pieces = path.split("/")
+    segments = [piece + "/" for piece in pieces[:-1]]
+    if pieces[-1]:
+        segments.append(pieces[-1])
+    return segments
+
+class PathTrie(object):
+    """
+    The class that records the number of requests and the bandwidth of each prefix of the
+    resource paths.
+    Example: paths = PathTrie()
+             paths.update(entry)
+             paths.top("/images/", 10, BANDWIDTH)
+    Args:
+        names(utility.Vocabulary): if the requests of the entries are integer IDs
+            (read_entry.read_entry(line, resources=names)), the vocabulary to get the
+            resource names.
+    Unlike ResourceStatistics, the requests of "/" are counted, in the node of the prefix "/".
+    """
+    # The node of the empty prefix, the parent of all the other nodes.
+    __ROOT = 0
+    def __init__(self, names=None):
+        """
+        The nodes are numbered in the order they are created, so a parent is always before
+        its children.
+        Private members:
+            __names(Vocabulary): the resource names of the IDs, None if the keys are
+                resource names.
+            __parents(array), __counts(array), __bandwidths(array): the parent, the number of
+                requests and the bandwidth of each node. The parent of the root is -1.
+            __segments(list): the last segment of the prefix of each node.
+            __children(list): the nodes of the children of each node by their segments,
+                None if the node has no child.
+            __chains(dict): the nodes of the prefixes of each resource that has been recorded,
+                from the node of the resource up to the root.
+        """
+        self.__names = names
+        self.__parents = array.array('l', [-1])
+        self.__counts = array.array('l', [0])
+        self.__bandwidths = array.array('l', [0])
+        self.__segments = [""]
+        self.__children = [None]
+        self.__chains = {}
+
+    def __len__(self):
+        """
+        Get the number of nodes, including the root.
+        """
+        return len(self.__segments)
+
+    def __child(self, node, segment):
+        """
+        Get the child of a node, create it if there is none.
+        Args:
+            node(int): the node.
+            segment(str): the segment of the child.
+        Returns:
+            child(int): the node of the child.
+        """
+        children = self.__children[node]
+        if children is None:
+            children = self.__children[node] = {}
+        child = children.get(segment)
+        if child is None:
+            child = children[segment] = len(self.__segments)
+            self.__parents.append(node)
+            self.__counts.append(0)
+            self.__bandwidths.append(0)
+            self.__segments.append(segment)
+            self.__children.append(None)
+        return child
+
+    def __chain(self, res):
+        """
+        Get the nodes of the prefixes of a resource, create them if the resource is new.
+        Args:
+            res: the resource ID or name.
+        Returns:
+            chain(tuple): the nodes from the node of the resource up to the root.
+        """
+        chain = self.__chains.get(res)
+        if chain is None:
+            node = self.__ROOT
+            nodes = [node]
+            name = res if self.__names is None else self.__names.names[res]
+            for segment in split_path(name):
+                node = self.__child(node, segment)
+                nodes.append(node)
+            chain = self.__chains[res] = tuple(reversed(nodes))
+        return chain
+
+    def update(self, entry):
+        """Add the info of entry into the sums of the prefixes of its resource.
+        Args:
+            entry(LogRecord or dict): the record of a log item.
+        """
+        if isinstance(entry, dict):
+            entry = read_entry.LogRecord.from_dict(entry)
+        res = entry[read_entry.REQUEST]
+        chain = self.__chains.get(res)
+        if chain is None:
+            chain = self.__chain(res)
+        size = entry[read_entry.SIZE]
+        (counts, bandwidths) = (self.__counts, self.__bandwidths)
+        for node in chain:
+            counts[node] += 1
+            bandwidths[node] += size
+
+    def update_batch(self, batch):
+        """Add the info of a LogBatch into the sums of the prefixes. The requests and the
+        bandwidth of each resource in the batch are summed up with numpy first, so the
+        prefixes of a resource are added to once for each batch.
+        Args:
+            batch(LogBatch): the batch of log items.
+        """
+        if self.__names is None:
+            for idx in range(len(batch)):
+                self.update(batch.record(idx))
+            return
+        if len(batch) == 0:
+            return
+        keys, inverse = np.unique(batch.request, return_inverse=True)
+        counts = np.bincount(inverse)
+        bandwidths = np.rint(np.bincount(inverse, weights=batch.size)).astype(np.int64)
+        (node_counts, node_bandwidths) = (self.__counts, self.__bandwidths)
+        for (res, count, bandwidth) in zip(keys.tolist(), counts.tolist(), bandwidths.tolist()):
+            for node in self.__chain(res):
+                node_counts[node] += count
+                node_bandwidths[node] += bandwidth
+
+    def merge(self, other, resources=None):
+        """Add the sums of another PathTrie, e.g. of another part of the log file.
+        Args:
+            other(PathTrie): the other PathTrie.
+            resources(list): if the requests are IDs, resources[idx] is the ID in this
+                PathTrie of the resource ID idx in other (utility.Vocabulary.merge).
+        """
+        # The nodes of other in this PathTrie, the parents are mapped before their children
+        nodes = [self.__ROOT] * len(other)
+        for node in range(len(other)):
+            if node != self.__ROOT:
+                nodes[node] = self.__child(nodes[other.__parents[node]],
+                                           other.__segments[node])
+            self.__counts[nodes[node]] += other.__counts[node]
+            self.__bandwidths[nodes[node]] += other.__bandwidths[node]
+        for (res, chain) in other.__chains.iteritems():
+            if resources is not None:
+                res = resources[res]
+            self.__chains[res] = tuple(nodes[node] for node in chain)
+
+    def __find(self, prefix):
+        """
+        Find the node of a prefix.
+        Args:
+            prefix(str): the prefix.
+        Returns:
+            node(int): the node, None if no resource has the prefix.
+        """
+        node = self.__ROOT
+        for segment in split_path(prefix):
+            children = self.__children[node]
+            node = None if children is None else children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def get(self, prefix):
+        """
+        Get the sums of a prefix.
+        Args:
+            prefix(str): the prefix, e.g. "/images/" for all the resources under /images/.
+        Returns:
+            (count, bandwidth): the number of requests and the bandwidth of all the resources
+                with the prefix, (0, 0) if there is none.
+        """
+        node = self.__find(prefix)
+        if node is None:
+            return (0, 0)
+        return (self.__counts[node], self.__bandwidths[node])
+
+    def top(self, prefix, number, sort_method):
+        """
+        Get the children of a prefix with the largest sums, e.g. the directories and the
+        files right under a directory.
+        Args:
+            prefix(str): the prefix, "" for the root, whose only child is usually "/".
+            number(int): the number of children.
+            sort_method: can only take values COUNT or BANDWIDTH.
+        Returns:
+            A list of tuples. In each tuple, the first element is the count/bandwidth, the
+            second item is the prefix of the child. The ties are broken by the prefixes.
+        Raises:
+            NotImplementedError: Error occurs when choosen feature is not COUNT or BANDWIDTH.
+        """
+        if sort_method == COUNT:
+            column = self.__counts
+        elif sort_method == BANDWIDTH:
+            column = self.__bandwidths
+        else:
+            raise NotImplementedError
+        node = self.__find(prefix)
+        if node is None or self.__children[node] is None:
+            return []
+        children = self.__children[node].values()
+        keys, values = utility.nlargest_array(number, [column[child] for child in children],
+                                              children, self.__segments)
+        return [(value, prefix + self.__segments[child]) for (child, value) in zip(keys, values)]
+
+class TestPathTrie(unittest.TestCase):
+    """
+    Unittest Class for summing up the resources by the prefixes of their paths.
+    """
+    def setUp(self):
+        self.data = [{"Request": "/images/a.gif", "Size": 10},
+                     {"Request": "/images/a.gif", "Size": 10},
+                     {"Request": "/images/icons/b.gif", "Size": 5},
+                     {"Request": "/images/icons/c.gif", "Size": 7},
+                     {"Request": "/shuttle/countdown/", "Size": 30},
+                     {"Request": "/shuttle/countdown/video.mpg", "Size": 1000},
+                     {"Request": "/", "Size": 3}]
+
+    def check(self, paths):
+        self.assertEqual(paths.get(""), (7, 1065))
+        self.assertEqual(paths.get("/"), (7, 1065))
+        self.assertEqual(paths.get("/images/"), (4, 32))
+        self.assertEqual(paths.get("/shuttle/countdown/"), (2, 1030))
+        self.assertEqual(paths.get("/nothing/"), (0, 0))
+        self.assertEqual(paths.top("/", 2, BANDWIDTH), [(1030, "/shuttle/"), (32, "/images/")])
+        self.assertEqual(paths.top("/images/", 5, COUNT), [(2, "/images/a.gif"),
+                                                            (2, "/images/icons/")])
+        self.assertEqual(paths.top("/images/icons/", 1, BANDWIDTH),
+                         [(7, "/images/icons/c.gif")])
+        self.assertEqual(paths.top("/images/a.gif", 3, COUNT), [])
+
+    def test_split_path(self):
+        self.assertEqual(split_path("/images/logo.gif"), ["/", "images/", "logo.gif"])
+        self.assertEqual(split_path("/shuttle/"), ["/", "shuttle/"])
+        self.assertEqual(split_path("/"), ["/"])
+        self.assertEqual(split_path(""), [])
+        self.assertEqual("".join(split_path("a//b?c/d")), "a//b?c/d")
+
+    def test_update(self):
+        paths = PathTrie()
+        for entry in self.data:
+            paths.update(entry)
+        self.check(paths)
+        # The prefixes are shared: the root, /, images/, a.gif, icons/, b.gif, c.gif,
+        # shuttle/, countdown/ and video.mpg
+        self.assertEqual(len(paths), 10)
+        self.assertRaises(NotImplementedError, paths.top, "/", 1, 1)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_update_batch(self):
+        names = utility.Vocabulary()
+        lines = ['h - - [01/Jul/1995:00:00:01 -0400] "GET {0} HTTP/1.0" 200 {1}'.format(
+            entry["Request"], entry["Size"]) for entry in self.data]
+        paths = PathTrie(names)
+        paths.update_batch(read_entry.read_batch(lines[:3], utility.Vocabulary(), names))
+        paths.update_batch(read_entry.read_batch(lines[3:], utility.Vocabulary(), names))
+        self.check(paths)
+
+    def test_merge(self):
+        names = utility.Vocabulary()
+        paths = PathTrie(names)
+        for entry in self.data[:3]:
+            paths.update({"Request": names[entry["Request"]], "Size": entry["Size"]})
+        other_names = utility.Vocabulary()
+        other = PathTrie(other_names)
+        for entry in self.data[2:]:
+            other.update({"Request": other_names[entry["Request"]], "Size": entry["Size"]})
+        paths.merge(other, names.merge(other_names))
+        paths.update({"Request": names["/images/icons/b.gif"], "Size": 0})
+        self.assertEqual(paths.get("/images/icons/b.gif"), (3, 10))
+        self.assertEqual(paths.get("/images/"), (6, 37))
+        self.assertEqual(len(paths), 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,30 +7,98 @@ the user after three failed consecutive login attempts in 20 seconds.
 Args:
     input_file(string): The name of the input file
     output_dir(string): The directory where you want to put the output files
+    --batch-size(int): If positive, read the input file in batches of this many lines
+        and update the statistics with numpy (optional, requires numpy)
+    --cache: Load the parsed input file from its binary cache <input_file>.cache if the
+        cache is up to date, otherwise write the cache while reading (optional, requires numpy)
+    --workers(int): If positive, split the input file into this many parts, read them in
+        worker processes and merge the statistics in order (optional, requires numpy)
+    --analyzers(str): A comma-separated list of the analyzers to run (see
+        log_analysis.ANALYZERS), only their output files are written. By default all but
+        paths (log_analysis.DEFAULT_ANALYZERS), which only runs when it is listed.
+    --follow: Keep reading the lines appended to the input file, also after it is rotated,
+        and rewrite the output files every --interval seconds, until interrupted (Ctrl-C)
+    --interval(float): The number of seconds between the refreshes of the outputs in
+        --follow mode
+    --checkpoint(str): Resume from this checkpoint file if the input file still starts with
+        the bytes read into it, and save the checkpoint after reading (see checkpoint.py)
+    --report: Write the numbers of lines, the time and the throughput of the phases and of
+        the analyzers and the peak memory into <output_dir>/report.json (see run_stats.py)
+    --samples(str): Sample the memory, the number of lines read and the sizes of the large
+        structures every --sample-interval seconds while running, and write them into this
+        CSV (if it ends with .csv) or JSON file (see run_stats.Sampler)
+    --sample-interval(float): The number of seconds between the samples
+    --quarantine(str): Write the lines with format error with their reason codes into this
+        file instead of a warning for each line, <output_dir>/quarantine.txt by default. The
+        file is only created if there is such a line (see quarantine.py)
+    --serve(int): Answer the queries about the top hosts, the top resources, the busiest hours
+        and the blocked hosts over HTTP on this port of localhost while reading, from a
+        snapshot of the results taken every --serve-interval seconds (see query_server.py)
+    --serve-interval(float): The number of seconds between the snapshots of --serve
+    --top-capacity(int): Keep at most this many hosts and resources for each of the top
+        lists (Space-Saving, see heavy_hitters.py), so the memory of the hosts and the
+        resources doesn't grow with the log file. The top lists are then approximate, the
+        bounds of the errors are logged, and resources_least_requested.txt is not written
+    --group-by(str): Group the entries by these comma-separated fields (see
+        group_by.FIELDS), e.g. status,request_type, and write the number of requests, the
+        bytes and the smallest and largest sizes of the --group-top largest groups into
+        <output_dir>/group_by_<fields>.txt. With ":" and some of the fields after it, e.g.
+        host,status:status, the largest groups are written for each value of those fields.
+        Can be given more than once
+    --group-top(int): The number of groups written for --group-by
+    --time-histogram: Keep the number of entries in each second of the current 60-minute
+        window for the busiest hours, instead of the time of each entry, so the memory
+        doesn't grow with the traffic (see time_window.TimeWindow). The outputs are the same;
+        from a log earlier than the one before it on, the time of each entry is kept
+The input file can be compressed with gzip, bz2 or xz, which is detected automatically and
+decompressed in a background thread while reading. --cache and --workers are ignored then.
 Author: Yuan Huang
 """
 import os
-import sys
+import time
+import signal
+import argparse
 import traceback
 import read_entry
 import host_activity as host
 import resource_statistics as resource
-import block_hosts
-import time_window
-import time_statistics
 import utility
-
-def output_logs(path, entries, filename, msg):
+import log_cache
+import log_analysis
+import parallel
+import chunk_reader
+import log_follower
+import checkpoint
+import run_stats
+import quarantine
+import query_server
+import path_trie
+import group_by
+
+# The number of seconds to wait for new lines in --follow mode.
+FOLLOW_POLL_SECONDS = 1.0
+
+# The name of the report file in the output directory.
+REPORT_FILE = "report.json"
+
+# The name of the default quarantine file in the output directory.
+QUARANTINE_FILE = "quarantine.txt"
+
+def output_logs(path, entries, filename, msg, start=0):
     """
     Write the selected logs into log file
     Args:
-        entries(list): The list contains all the selected logs strings
+        entries(iterable): The selected logs strings, e.g. a LineSpool or a set
         filename(string): Name of the output file
         msg(string): Information about the output file
+        start(int): If positive, the first start logs of the LineSpool entries are already
+            in the file, and only the following logs are read and appended
     """
     try:
         log.info(msg)
-        with open(os.path.join(path, filename), "w") as writer:
+        if start > 0:
+            entries = entries.lines(start)
+        with open(os.path.join(path, filename), "a" if start > 0 else "w") as writer:
             for entry in entries:
                 writer.write(entry)
     except:
@@ -59,169 +127,560 @@ def output_statistics(path, records, filename, msg, with_count=True):
     except:
         log.info("Fail to output to file. \n{0}".format(traceback.format_exc()))
 
+def read_batches(reader, batch_size, cache=None, start=0, end=None):
+    """
+    Read the log file in batches of lines
+    Args:
+        reader(ChunkReader or CompressedReader): The input file
+        batch_size(int): The maximum number of lines in a batch
+        cache(log_cache.CacheWriter): If given, the batches are also written to the cache
+        start(int), end(int): The byte range of the input file to read
+    Returns:
+        A generator of LogBatch objects
+    """
+    for (lines, _) in reader.batches(batch_size, start, end):
+        # The cache keeps all the fields, so that it can be loaded for any analyzers
+        fields = analysis.fields if cache is None else None
+        start = time.time()
+        batch = read_entry.read_batch(lines, analysis.host_names, analysis.resource_names,
+                                      fields)
+        stats.add_time("parse", time.time() - start)
+        if cache is not None:
+            cache.append(batch, lines)
+        yield batch
+
+def stop_following(signum, frame):
+    """
+    Stop the --follow mode when the process is terminated, so that the final outputs
+    are written
+    """
+    raise KeyboardInterrupt()
+
+def log_error_bound(filename, bound):
+    """
+    Log how approximate a top list is with --top-capacity
+    Args:
+        filename(str): The name of the output file of the top list
+        bound(int): The most that a value in the list is larger than the true one
+    """
+    if analysis.capacity is not None:
+        log.info("The values in {0} are larger than the true ones by at most {1}"
+                 .format(filename, bound))
+
+def write_outputs(time_window, written):
+    """
+    Write the output files of the analyzers that run
+    Args:
+        time_window(TimeWindow): The finalized TimeWindow (LogAnalysis.finalize)
+        written(dict): The number of logs already written to the line-based output files
+            (blocked.txt and server_error.txt) by the file name, only the new logs are
+            appended. It is updated after writing.
+    """
+    hosts = analysis.hosts
+    resources = analysis.resources
+    time_stat = analysis.time_stat
+    blocked_entries = analysis.blocked_entries
+    server_errs = analysis.server_errs
+    resources_not_found_order = analysis.resources_not_found_order
+
+    # Feature 1
+    # Get the top ten active hosts;
+    # Write the name of hosts and number of activities to output file
+    if analysis.enabled("hosts"):
+        num_top_hosts = 10
+        top_hosts = hosts.top(num_top_hosts, host.COUNT)
+        output_statistics(outdir, top_hosts, "hosts.txt",
+                          "Output the top {0} active hosts to file {1}".format(num_top_hosts, "hosts.txt"))
+        log_error_bound("hosts.txt", hosts.error_bound(host.COUNT))
+
+    # Feature 2
+    # Get the top ten resources consuming the most bandwidth;
+    # Write the name of resources to output file
+    if analysis.enabled("resources"):
+        num_big_resources = 10
+        big_resources = resources.top(num_big_resources, resource.BANDWIDTH)
+        output_statistics(outdir, big_resources, "resources.txt",
+                          "Output the top {0} resources that consumes most bandwidth to file {1}"
+                          .format(num_big_resources, "resources.txt"), with_count=False)
+        log_error_bound("resources.txt", resources.error_bound(resource.BANDWIDTH))
+
+    # Feature 3
+    # Get the top busiest hours;
+    # write the top busiest hours and the number of logs to output
+    if analysis.enabled("time_window"):
+        top_busy_hours = time_window.top()
+        output_statistics(outdir, top_busy_hours, "hours.txt",
+                          "Output the top {0} busy hours to file {1}"
+                          .format(num_busy_hours, "hours.txt"))
+
+    # Feature 4
+    # Write the blocked entries to output
+    if analysis.enabled("blocked"):
+        output_logs(outdir, blocked_entries, "blocked.txt",
+                    "Output the blocked logs to file {0}".format("blocked.txt"),
+                    written.get("blocked.txt", 0))
+        written["blocked.txt"] = len(blocked_entries)
+
+    # Feature 5
+    # Get the non-overlapping top busiest hours;
+    # write the top busiest hours and the number of logs to output
+    if analysis.enabled("time_window"):
+        top_busy_hours = time_window.top_no_overlap()
+        output_statistics(outdir, top_busy_hours, "hours_no_overlap.txt",
+                          "Output the top {0} non-overlapping busy hours to file {1}"
+                          .format(num_busy_hours, "hours_no_overlap.txt"))
+
+    # Feature 6
+    # Get the top ten resources attracting the most requests;
+    # Write the name of resources and number of requests to output file
+    if analysis.enabled("resources"):
+        num_most_requested = 10
+        top_resources = resources.top(num_most_requested, resource.COUNT)
+        output_statistics(outdir, top_resources, "resources_most_requested.txt",
+                          "Output the top {0} resources that users like to request the most {1}"
+                          .format(num_most_requested, "resources_most_requested.txt"))
+        log_error_bound("resources_most_requested.txt", resources.error_bound(resource.COUNT))
+
+    # Feature 7
+    # Get the ten resources attracting the least requests;
+    # Write the name of resources and number of requests to output file
+    # The least requested resources are not kept with --top-capacity
+    if analysis.enabled("resources") and analysis.capacity is None:
+        num_least_requested = 10
+        bottom_resources = resources.bottom(num_least_requested, resource.COUNT)
+        output_statistics(outdir, bottom_resources, "resources_least_requested.txt",
+                          "Output the {0} resources that users like to request the least {1}"
+                          .format(num_least_requested, "resources_least_requested.txt"))
+
+    # Feature 8
+    # Write the logs with server error to output
+    if analysis.enabled("server_errors"):
+        output_logs(outdir, server_errs, "server_error.txt",
+                    "Output the logs with server errors to file {0}".format("server_err.txt"),
+                    written.get("server_error.txt", 0))
+        written["server_error.txt"] = len(server_errs)
+
+    # Feature 9
+    # Write the resources with status 404 (Not Found) to output
+    if analysis.enabled("not_found"):
+        resources_not_found = set(resource_names.decode(idx)+"\n" for idx in resources_not_found_order)
+        output_logs(outdir, resources_not_found, "resources_not_found.txt",
+                    "Output the resources with status 404 (Not Found) to file {0}"
+                    .format("resources_not_found.txt"))
+
+    # Feature 10
+    # Write the date and the number of hits on that day to output
+    if analysis.enabled("time_stat"):
+        daily_hits = time_stat.get_daily_hits()
+        output_statistics(outdir, daily_hits, "daily_hits.txt",
+                          "Output the number of logs on each day to file {0}".format("daily_hits.txt"))
+
+    # Feature 11
+    # Write the date and the number of hosts on that day to output
+    if analysis.enabled("time_stat"):
+        daily_hosts = time_stat.get_daily_hosts()
+        output_statistics(outdir, daily_hosts, "daily_hosts.txt",
+                          "Output the number of hosts on each day to file {0}".format("daily_hosts.txt"))
+
+    # Feature 12
+    if analysis.enabled("hosts"):
+        num_sample = 1000
+        sample_hosts = hosts.sample(num_sample)
+        output_statistics(outdir, sample_hosts, "hosts_sample.txt",
+                          "Output the selected random {0} hosts {1}"
+                          .format(num_sample, "hosts_sample.txt"), with_count=False)
+
+    # Feature 13
+    # Number of hits at different time of the day
+    # Write the hour and the number of hits during that hour to output
+    if analysis.enabled("time_stat"):
+        hourly_hits = time_stat.get_hourly_hits()
+        output_statistics(outdir, hourly_hits, "hourly_hits.txt",
+                          "Output the number of logs during each hour to file {0}".format("hourly_hits.txt"))
+
+    # Feature 14
+    # Number of hosts at different time of the day
+    # Write the hour and the number of hosts during that hour to output
+    if analysis.enabled("time_stat"):
+        hourly_hosts = time_stat.get_hourly_hosts()
+        output_statistics(outdir, hourly_hosts, "hourly_hosts.txt",
+                          "Output the number of hosts during each hour to file {0}".format("hourly_hosts.txt"))
+
+    # Feature 15
+    # Get the top ten paths right under / (directories or resources) consuming the most
+    # bandwidth, each directory followed by its top ten directories and resources;
+    # Write the prefixes and the bandwidth to output file
+    if analysis.enabled("paths"):
+        num_top_paths = 10
+        top_paths = []
+        for (bandwidth, prefix) in analysis.paths.top("/", num_top_paths, path_trie.BANDWIDTH):
+            top_paths.append((bandwidth, prefix))
+            top_paths.extend(analysis.paths.top(prefix, num_top_paths, path_trie.BANDWIDTH))
+        output_statistics(outdir, top_paths, "paths.txt",
+                          "Output the top {0} paths under / that consume most bandwidth and the "
+                          "top {0} paths under each of them to file {1}"
+                          .format(num_top_paths, "paths.txt"))
+
+    # Feature 16
+    # Get the largest groups of the entries by the fields of --group-by, overall or for
+    # each value of some of the fields;
+    # Write the fields, the number of requests, the bytes, and the smallest and largest
+    # sizes of the groups to output file
+    for (idx, per) in group_outputs:
+        groups = analysis.groups[idx]
+        filename = "group_by_{0}.txt".format(groups.name)
+        if per:
+            filename = "group_by_{0}_per_{1}.txt".format(
+                groups.name, "_".join(read_entry.LogRecord._fields[field] for field in per))
+        top_groups = [(",".join(str(value) for value in sums),
+                       ",".join(str(value) for value in values))
+                      for (values, sums) in groups.top(args.group_top, group_by.COUNT, per)]
+        output_statistics(outdir, top_groups, filename,
+                          "Output the top {0} groups by {1} to file {2}"
+                          .format(args.group_top, groups.name, filename))
+
+def write_results(time_window, written):
+    """
+    Write the output files, and the report if it is asked for
+    Args:
+        time_window(TimeWindow), written(dict): See write_outputs
+    """
+    with stats.phase("output"):
+        write_outputs(time_window, written)
+        try:
+            quarantined.flush()
+        except (IOError, OSError):
+            log.info("Fail to output the lines with format error. \n{0}"
+                     .format(traceback.format_exc()))
+    if args.report:
+        try:
+            stats.write(os.path.join(outdir, REPORT_FILE),
+                        analysis.num_lines - resumed_lines, analysis.num_errors - resumed_errors,
+                        input_file=infile, mode=mode, analyzers=analysis.analyzers,
+                        batch_size=batch_size, workers=args.workers,
+                        resumed_lines=resumed_lines, parse_error_reasons=quarantined.counts)
+        except:
+            log.info("Fail to output the report. \n{0}".format(traceback.format_exc()))
+
+def watched(items, every=1):
+    """
+    Publish the snapshots of the analysis for --serve while it is updated with the items
+    Args:
+        items(iterable): The lines or the batches
+        every(int): The number of items between the checks of the time to publish
+    Returns:
+        The items, or a generator of them if --serve is given (QueryServer.watch)
+    """
+    if server is None:
+        return items
+    return server.watch(items, analysis, every)
+
 # Main Program
-infile = sys.argv[1]
-outdir = sys.argv[2]
+parser = argparse.ArgumentParser(description="Analyze the server log file")
+parser.add_argument("input_file", help="The name of the input file")
+parser.add_argument("output_dir", help="The directory where you want to put the output files")
+parser.add_argument("--batch-size", type=int, default=0,
+                    help="Read the input file in batches of this many lines (requires numpy)")
+parser.add_argument("--cache", action="store_true",
+                    help="Load the parsed input file from its binary cache, or write the cache "
+                         "if it is missing or out of date (requires numpy)")
+parser.add_argument("--workers", type=int, default=0,
+                    help="Read the parts of the input file in this many worker processes "
+                         "(requires numpy)")
+parser.add_argument("--analyzers", default=",".join(log_analysis.DEFAULT_ANALYZERS),
+                    help="A comma-separated list of the analyzers to run, from: {0}. "
+                         "All but paths by default"
+                         .format(", ".join(log_analysis.ANALYZERS)))
+parser.add_argument("--follow", action="store_true",
+                    help="Keep reading the lines appended to the input file and refresh the "
+                         "outputs, until interrupted")
+parser.add_argument("--interval", type=float, default=60.0,
+                    help="The number of seconds between the refreshes of the outputs in "
+                         "--follow mode")
+parser.add_argument("--checkpoint",
+                    help="Resume from this checkpoint file if it is of the start of the input "
+                         "file, and save the checkpoint after reading")
+parser.add_argument("--report", action="store_true",
+                    help="Write the time and the throughput of the phases and the analyzers "
+                         "into {0} in the output directory".format(REPORT_FILE))
+parser.add_argument("--samples",
+                    help="Sample the memory, the lines read and the sizes of the large "
+                         "structures while running into this CSV (.csv) or JSON file")
+parser.add_argument("--sample-interval", type=float, default=run_stats.SAMPLE_SECONDS,
+                    help="The number of seconds between the samples of --samples")
+parser.add_argument("--quarantine",
+                    help="Write the lines with format error into this file, {0} in the "
+                         "output directory by default".format(QUARANTINE_FILE))
+parser.add_argument("--serve", type=int,
+                    help="Answer the queries about the results over HTTP on this port of "
+                         "localhost while reading")
+parser.add_argument("--top-capacity", type=int,
+                    help="Keep at most this many hosts and resources for the top lists, "
+                         "which are then approximate")
+parser.add_argument("--group-by", action="append",
+                    help="Group the entries by these comma-separated fields, from: {0}; with "
+                         "\":\" and some of the fields after it, write the top groups for each "
+                         "of their values. Can be given more than once"
+                         .format(", ".join(group_by.FIELDS)))
+parser.add_argument("--group-top", type=int, default=10,
+                    help="The number of groups written for --group-by")
+parser.add_argument("--time-histogram", action="store_true",
+                    help="Keep the number of entries in each second of the window for the "
+                         "busiest hours instead of the time of each entry")
+parser.add_argument("--serve-interval", type=float, default=query_server.PUBLISH_SECONDS,
+                    help="The number of seconds between the snapshots of the results that "
+                         "--serve answers from")
+args = parser.parse_args()
+analyzers = [name.strip() for name in args.analyzers.split(",") if name.strip()]
+for name in analyzers:
+    if name not in log_analysis.ANALYZERS:
+        parser.error("unknown analyzer {0}, choose from: {1}"
+                     .format(name, ", ".join(log_analysis.ANALYZERS)))
+# The fields of each GroupBy, and the GroupBy and the fields to get the top groups for of each
+# output file of --group-by
+(group_fields, group_outputs) = ([], [])
+for text in args.group_by or []:
+    (fields, _, per) = text.partition(":")
+    try:
+        fields = group_by.parse_fields(fields)
+        per = group_by.parse_fields(per) if per.strip() else ()
+    except (KeyError, ValueError):
+        parser.error("invalid --group-by {0}, the fields are from: {1}"
+                     .format(text, ", ".join(group_by.FIELDS)))
+    if not set(per) <= set(fields):
+        parser.error("invalid --group-by {0}, the fields after \":\" should be grouped by"
+                     .format(text))
+    if fields not in group_fields:
+        group_fields.append(fields)
+    group_outputs.append((group_fields.index(fields), per))
+if args.workers > 0 and args.cache:
+    parser.error("--workers can't be used together with --cache")
+if args.follow and (args.workers > 0 or args.cache):
+    parser.error("--follow can't be used together with --workers or --cache")
+if args.checkpoint and (args.workers > 0 or args.cache or args.follow):
+    parser.error("--checkpoint can't be used together with --workers, --cache or --follow")
+infile = args.input_file
+outdir = args.output_dir
 
 log = utility.Logger("./")
 
-# Initialization for the feature classes
-hosts = host.HostActivity()
-resources = resource.ResourceStatistics()
-time_stat = time_statistics.TimeStatistics()
-num_busy_hours = 10
-time_window = time_window.TimeWindow(hours=1, n_top=num_busy_hours)
-blocked = block_hosts.BlockedHosts(monitor_seconds=20, block_seconds=300, chances=3)
-
-blocked_entries = []
-server_errs = []
-resources_not_found = set()
+# The lines with format error are set aside with a summary in the log now and then
+quarantined = quarantine.Quarantine(args.quarantine or os.path.join(outdir, QUARANTINE_FILE),
+                                    log)
+
+# The host names and resource names are transferred into integer IDs when
+# reading the entries, and back into names only when writing the outputs.
+# The time of the entries is in integer epoch seconds, so that the time
+# arithmetic in the feature classes is done with integers.
+# The phases are always timed, the parsing and the analyzers only for the report
+stats = run_stats.RunStats()
+analysis = log_analysis.LogAnalysis(log=log, analyzers=analyzers,
+                                    stats=stats if args.report else None,
+                                    quarantine=quarantined, capacity=args.top_capacity,
+                                    group_by=group_fields, time_histogram=args.time_histogram)
+host_names = analysis.host_names
+resource_names = analysis.resource_names
+num_busy_hours = log_analysis.NUM_BUSY_HOURS
 
 log.info("Start to read and process the entries in input file {0}:".format(infile))
 
-try:
-    with open(infile, "r") as reader:
-        log.info("Reading and processing entry...")
+# The cache is read and written in batches
+batch_size = args.batch_size
+if args.cache and batch_size <= 0:
+    batch_size = 10000
+
+# The number of logs written to the line-based output files in --follow mode
+written = {}
+
+# The lines read before the checkpoint are not in the report
+(resumed_lines, resumed_errors) = (0, 0)
+read_start = time.time()
+read_peak = utility.peak_memory_usage()
+
+# The functions look up the analysis when they are called, it is replaced when a
+# checkpoint is loaded
+sampler = None
+if args.samples:
+    sampler = run_stats.Sampler(lambda: analysis.num_lines, lambda: analysis.sizes(),
+                                args.sample_interval)
+    sampler.start()
+
+# The queries are answered from snapshots published by the loops that read the entries
+server = None
+if args.serve is not None:
+    try:
+        server = query_server.QueryServer(args.serve, interval=args.serve_interval)
+    except (IOError, OSError):
+        log.Abort("Fail to serve the queries on port {0} due to reason: \n{1}"
+                  .format(args.serve, traceback.format_exc()))
+    server.start()
+    log.info("Serve the queries at http://{0}:{1}/".format(query_server.HOST, server.port))
 
-        for entry in reader:
-            # Read in each line and transform into a dictionary
+try:
+    compression = chunk_reader.compression(infile)
+    if compression is not None:
+        log.info("The input file is compressed with {0}".format(compression))
+        if args.cache or args.workers > 0:
+            log.warning("--cache and --workers are ignored for the compressed input file")
+            args.cache = False
+            args.workers = 0
+        if args.checkpoint:
+            log.warning("--checkpoint is ignored for the compressed input file")
+            args.checkpoint = None
+        if args.follow:
+            raise IOError("The compressed input file can't be followed")
+
+    cached_batch = None
+    if args.cache:
+        with stats.phase("parse"):
+            cached_batch = log_cache.load_cache(infile, host_names, resource_names)
+
+    if cached_batch is not None:
+        mode = "cache"
+        log.info("Loading and processing entries from cache {0}..."
+                 .format(log_cache.cache_path(infile)))
+        for batch in watched(cached_batch.split(batch_size)):
+            analysis.update_batch(batch)
+    elif args.follow:
+        mode = "follow"
+        log.info("Following the entries of the input file, the outputs are refreshed every "
+                 "{0} seconds...".format(args.interval))
+        signal.signal(signal.SIGTERM, stop_following)
+        with log_follower.LogFollower(infile) as follower:
+            refresh_time = time.time() + args.interval
             try:
-                dict_entry = read_entry.read_entry(entry)
-                entry_final = dict_entry
-            except TypeError:
-                log.warning("Entry format error: {0}{1}"
-                            .format(entry, traceback.format_exc()))
-
-            # Update the statistics 
+                while True:
+                    lines = follower.read()
+                    if batch_size > 0:
+                        for start in range(0, len(lines), batch_size):
+                            with stats.phase("parse"):
+                                batch = read_entry.read_batch(lines[start:start+batch_size],
+                                                              host_names, resource_names,
+                                                              analysis.fields)
+                            analysis.update_batch(batch)
+                    else:
+                        for entry in lines:
+                            analysis.update(entry)
+                    if server is not None and server.due():
+                        server.publish(analysis)
+
+                    # The time window analysis is finalized on a copy, so that the
+                    # following entries can still be added. A refresh that fails is
+                    # logged and tried again at the next one, the following goes on.
+                    if time.time() >= refresh_time:
+                        try:
+                            with stats.phase("finalize"):
+                                time_window = analysis.finalize(provisional=True)
+                            write_results(time_window, written)
+                        except Exception:
+                            log.warning("Fail to refresh the outputs. \n{0}"
+                                        .format(traceback.format_exc()))
+                        refresh_time = time.time() + args.interval
+                    if not lines:
+                        time.sleep(FOLLOW_POLL_SECONDS)
+            except KeyboardInterrupt:
+                pass
+    elif args.workers > 0:
+        mode = "workers"
+        log.info("Reading and processing entry in {0} worker processes...".format(args.workers))
+        if batch_size > 0:
+            parallel.process_parallel(infile, analysis, args.workers, batch_size)
+        else:
+            parallel.process_parallel(infile, analysis, args.workers)
+    else:
+        mode = "batch" if batch_size > 0 else "lines"
+        with chunk_reader.open_reader(infile) as reader:
+            # Only the bytes after the checkpoint are read, up to the last complete line
+            (start, end) = (0, None)
+            if args.checkpoint:
+                resumed = checkpoint.load_checkpoint(args.checkpoint, reader.data, reader.size,
+                                                     analysis.analyzers, log, quarantined,
+                                                     args.top_capacity, group_fields,
+                                                     args.time_histogram)
+                if resumed is not None:
+                    (analysis, start) = resumed
+                    analysis.set_stats(stats if args.report else None)
+                    (resumed_lines, resumed_errors) = (analysis.num_lines, analysis.num_errors)
+                    host_names = analysis.host_names
+                    resource_names = analysis.resource_names
+                    log.info("Resume from the checkpoint {0} at byte {1}"
+                             .format(args.checkpoint, start))
+                else:
+                    log.info("The checkpoint {0} is missing or out of date"
+                             .format(args.checkpoint))
+                end = checkpoint.complete_lines(reader.data, reader.size)
+
+            log.info("Reading and processing entry...")
+
+            cache = None
+            if args.cache:
+                try:
+                    cache = log_cache.CacheWriter(infile)
+                except (IOError, OSError):
+                    log.warning("Fail to create the cache of the input file {0}\n{1}"
+                                .format(infile, traceback.format_exc()))
+
+            # The unfinished cache is removed if the reading doesn't finish
             try:
-                hosts.update(dict_entry)
-                time_window.update(dict_entry)
-                time_stat.update(dict_entry)
-                resources.update(dict_entry)
-
-                is_blocked = blocked.update(dict_entry)
-                if is_blocked is True:
-                    blocked_entries.append(entry)
-
-                if dict_entry["Status"] == 404:
-                    resources_not_found.add(dict_entry["Request"]+"\n")
-
-                if dict_entry["Status"] >= 500 and dict_entry["Status"] < 600:
-                    server_errs.append(entry)
-
-            except TypeError:
-                log.warning("Fail to process entry {0}{1}"
-                            .format(entry, traceback.format_exc()))
-
-        # At the end of the file, time window analysis needs extra operations
-        # to get final results
-        time_window.finalize(entry_final)
-
-        log.info("Reading and processing entries is finished.")
+                if batch_size > 0:
+                    for batch in watched(read_batches(reader, batch_size, cache, start, end)):
+                        analysis.update_batch(batch)
+                else:
+                    for entry in watched(reader.lines(start, end), query_server.CHECK_LINES):
+                        analysis.update(entry)
+            except:
+                if cache is not None:
+                    cache.discard()
+                raise
+
+            if args.checkpoint:
+                try:
+                    checkpoint.save_checkpoint(args.checkpoint, analysis, reader.data, end)
+                    log.info("Save the checkpoint at byte {0} to {1}"
+                             .format(end, args.checkpoint))
+                except (IOError, OSError):
+                    log.warning("Fail to save the checkpoint {0}\n{1}"
+                                .format(args.checkpoint, traceback.format_exc()))
+
+            if cache is not None:
+                try:
+                    cache.close(host_names, resource_names)
+                    log.info("Write the cache of the input file to {0}"
+                             .format(log_cache.cache_path(infile)))
+                except (IOError, OSError):
+                    cache.discard()
+                    log.warning("Fail to write the cache of the input file {0}\n{1}"
+                                .format(infile, traceback.format_exc()))
+
+    # At the end of the file, time window analysis needs extra operations
+    # to get final results
+    stats.add_time("read", time.time() - read_start)
+    stats.add_memory("read", read_peak)
+    with stats.phase("finalize"):
+        time_window = analysis.finalize()
+    if server is not None:
+        server.publish(analysis, time_window)
+
+    log.info("Reading and processing entries is finished.")
 
 except:
     log.Abort("Fail to process the input file {0} due to reason: \n{1}"
               .format(infile, traceback.format_exc()))
 
-# Feature 1
-# Get the top ten active hosts;
-# Write the name of hosts and number of activities to output file
-num_top_hosts = 10
-top_hosts = hosts.top(num_top_hosts, host.COUNT)
-output_statistics(outdir, top_hosts, "hosts.txt",
-                  "Output the top {0} active hosts to file {1}".format(num_top_hosts, "hosts.txt"))
-
-# Feature 2
-# Get the top ten resources consuming the most bandwidth;
-# Write the name of resources to output file
-num_big_resources = 10
-big_resources = resources.top(num_big_resources, resource.BANDWIDTH)
-output_statistics(outdir, big_resources, "resources.txt",
-                  "Output the top {0} resources that consumes most bandwidth to file {1}"
-                  .format(num_big_resources, "resources.txt"), with_count=False)
-
-# Feature 3
-# Get the top busiest hours;
-# write the top busiest hours and the number of logs to output
-top_busy_hours = time_window.top()
-output_statistics(outdir, top_busy_hours, "hours.txt",
-                  "Output the top {0} busy hours to file {1}"
-                  .format(num_busy_hours, "hours.txt"))
-
-# Feature 4
-# Write the blocked entries to output
-output_logs(outdir, blocked_entries, "blocked.txt", 
-            "Output the blocked logs to file {0}".format("blocked.txt"))
-
-# Feature 5
-# Get the non-overlapping top busiest hours;
-# write the top busiest hours and the number of logs to output
-top_busy_hours = time_window.top_no_overlap()
-output_statistics(outdir, top_busy_hours, "hours_no_overlap.txt",
-                  "Output the top {0} non-overlapping busy hours to file {1}"
-                  .format(num_busy_hours, "hours_no_overlap.txt"))
-
-# Feature 6
-# Get the top ten resources attracting the most requests;
-# Write the name of resources and number of requests to output file
-num_most_requested = 10
-top_resources = resources.top(num_most_requested, resource.COUNT)
-output_statistics(outdir, top_resources, "resources_most_requested.txt",
-                  "Output the top {0} resources that users like to request the most {1}"
-                  .format(num_most_requested, "resources_most_requested.txt"))
-
-# Feature 7
-# Get the ten resources attracting the least requests;
-# Write the name of resources and number of requests to output file
-num_least_requested = 10
-bottom_resources = resources.bottom(num_least_requested, resource.COUNT)
-output_statistics(outdir, bottom_resources, "resources_least_requested.txt",
-                  "Output the {0} resources that users like to request the least {1}"
-                  .format(num_least_requested, "resources_least_requested.txt"))
-
-# Feature 8
-# Write the logs with server error to output
-output_logs(outdir, server_errs, "server_error.txt",
-            "Output the logs with server errors to file {0}".format("server_err.txt"))
-
-# Feature 9
-# Write the resources with status 404 (Not Found) to output
-output_logs(outdir, resources_not_found, "resources_not_found.txt",
-            "Output the resources with status 404 (Not Found) to file {0}"
-            .format("resources_not_found.txt"))
-
-# Feature 10
-# Write the date and the number of hits on that day to output
-daily_hits = time_stat.get_daily_hits()
-output_statistics(outdir, daily_hits, "daily_hits.txt",
-                  "Output the number of logs on each day to file {0}".format("daily_hits.txt"))
-
-# Feature 11
-# Write the date and the number of hosts on that day to output
-daily_hosts = time_stat.get_daily_hosts()
-output_statistics(outdir, daily_hosts, "daily_hosts.txt",
-                  "Output the number of hosts on each day to file {0}".format("daily_hosts.txt"))
-
-# Feature 12
-
-num_sample = 1000
-sample_hosts = hosts.sample(num_sample)
-output_statistics(outdir, sample_hosts, "hosts_sample.txt",
-                  "Output the selected random {0} hosts {1}"
-                  .format(num_sample, "hosts_sample.txt"), with_count=False)
-
-# Feature 13
-# Number of hits at different time of the day
-# Write the hour and the number of hits during that hour to output
-hourly_hits = time_stat.get_hourly_hits()
-output_statistics(outdir, hourly_hits, "hourly_hits.txt",
-                  "Output the number of logs during each hour to file {0}".format("hourly_hits.txt"))
-
-# Feature 14
-# Number of hosts at different time of the day
-# Write the hour and the number of hosts during that hour to output
-hourly_hosts = time_stat.get_hourly_hosts()
-output_statistics(outdir, hourly_hosts, "hourly_hosts.txt",
-                  "Output the number of hosts during each hour to file {0}".format("hourly_hosts.txt"))
+if args.follow:
+    log.info("Stop following the input file, write the final outputs.")
+write_results(time_window, written)
+quarantined.close()
+
+if sampler is not None:
+    sampler.stop()
+    try:
+        sampler.write(args.samples)
+        log.info("Output the samples of the memory to file {0}".format(args.samples))
+    except:
+        log.info("Fail to output the samples. \n{0}".format(traceback.format_exc()))
+
+if server is not None:
+    server.stop()
 
 log.info("Memory Usage : {0} MB".format(utility.memory_usage()))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class that sets aside the lines of a log file with format error.
+The lines are written with a reason code into a quarantine file in blocks, and counted by
+reason. Instead of a warning for every line, a summary of the counts is logged at most once
+in a while, so a log file full of garbage costs little more than a clean one.
+Author: Yuan Huang
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+# The number of lines kept in memory before they are written to the quarantine file.
+BUFFER_LINES = 1000
+
+# The minimum number of seconds between the summaries in the log.
+LOG_SECONDS = 10.0
+
+class Quarantine(object):
+    """
+    The class that writes the lines with format error into a file and counts them by reason.
+    Example: quarantine = Quarantine("quarantine.txt", log)
+             quarantine.add(line, error.reason)
+             quarantine.close()
+    Args:
+        path(str): the name of the quarantine file, created at the first line; None to only
+            count the lines. Each line of the file is the reason code, a tab and the line.
+        log(logging.Logger): the logger of the summaries, None for no summary.
+        log_seconds(float): the minimum number of seconds between the summaries.
+    Public variables:
+        path(str): see Args.
+        counts(OrderedDict): the number of lines by reason code, in the order first found.
+        total(int): the number of lines.
+    """
+    def __init__(self, path=None, log=None, log_seconds=LOG_SECONDS):
+        self.path = path
+        self.__log = log
+        self.__log_seconds = log_seconds
+        self.__logged = time.time()
+        self.__logged_total = 0
+        self.__buffer = []
+        self.__file = None
+        self.counts = OrderedDict()
+        self.total = 0
+
+    def add(self, line, code):
+        """
+        Set aside a line with format error.
+        Args:
+            line(str): the line.
+            code(str): the reason code of the error (read_entry.EntryError).
+        """
+        self.counts[code] = self.counts.get(code, 0) + 1
+        self.total += 1
+        if self.path is not None:
+            self.__buffer.append("{0}\t{1}".format(code, line if line.endswith("\n")
+                                                   else line + "\n"))
+            if len(self.__buffer) >= BUFFER_LINES:
+                self.flush()
+        if self.__log is not None and time.time() - self.__logged >= self.__log_seconds:
+            self.log_summary()
+
+    def flush(self):
+        """
+        Write the lines in memory into the quarantine file.
+        """
+        if not self.__buffer:
+            return
+        if self.__file is None:
+            self.__file = open(self.path, "w")
+        self.__file.writelines(self.__buffer)
+        self.__file.flush()
+        self.__buffer = []
+
+    def summary(self):
+        """
+        Get the summary of the counts.
+        Returns:
+            summary(str): e.g. "3 lines with format error (no_pattern: 2, bad_time: 1)".
+        """
+        return "{0} lines with format error ({1})".format(
+            self.total, ", ".join("{0}: {1}".format(code, count)
+                                  for (code, count) in self.counts.items()))
+
+    def log_summary(self):
+        """
+        Log the summary if there are new lines since the last summary.
+        """
+        self.__logged = time.time()
+        if self.__log is None or self.total == self.__logged_total:
+            return
+        self.__logged_total = self.total
+        where = "" if self.path is None else ", see {0}".format(self.path)
+        self.__log.warning("{0}{1}".format(self.summary(), where))
+
+    def close(self):
+        """
+        Write the rest of the lines, close the quarantine file and log the last summary.
+        """
+        self.flush()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        self.log_summary()
+
+class TestQuarantine(unittest.TestCase):
+    """
+    Unittest Class for setting aside the lines with format error.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "quarantine.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_add(self):
+        import read_entry
+        lines = ["junk\n", 'a - - [01/Jly/1995:00:00:01 -0400] "GET / HTTP/1.0" 200 1\n',
+                 'a - - [01/Jul/1995:00:00:01 -0400] "PUT / HTTP/1.0" 200 1\n', "junk",
+                 'a - - [01/Jul/1995:00:00:01 -0400] "GET / HTTP/1.0" 200 1x\n',
+                 'a - - [01/Jul/1995:00:00:01 -0400] "\xffGET / HTTP/1.0" 200 1\n']
+        messages = []
+
+        class Log(object):
+            def warning(self, msg):
+                messages.append(msg)
+
+        quarantine = Quarantine(self.path, Log(), log_seconds=0)
+        for line in lines:
+            try:
+                read_entry.read_entry(line, epoch=True)
+            except read_entry.EntryError as error:
+                quarantine.add(line, error.reason)
+        self.assertFalse(os.path.exists(self.path))
+        quarantine.close()
+        self.assertEqual(quarantine.counts, OrderedDict([("no_pattern", 2), ("bad_time", 1),
+                                                         ("bad_method", 1), ("bad_size", 1),
+                                                         ("bad_encoding", 1)]))
+        with open(self.path) as reader:
+            self.assertEqual(reader.readlines(),
+                             ["no_pattern\tjunk\n", "bad_time\t" + lines[1],
+                              "bad_method\t" + lines[2], "no_pattern\tjunk\n",
+                              "bad_size\t" + lines[4], "bad_encoding\t" + lines[5]])
+        self.assertEqual(len(messages), 6)
+        self.assertTrue(messages[-1].startswith("6 lines with format error (no_pattern: 2"))
+
+    def test_rate_limit(self):
+        messages = []
+
+        class Log(object):
+            def warning(self, msg):
+                messages.append(msg)
+
+        quarantine = Quarantine(log=Log(), log_seconds=3600)
+        for _ in range(BUFFER_LINES * 2):
+            quarantine.add("junk\n", "no_pattern")
+        self.assertEqual(messages, [])
+        quarantine.close()
+        self.assertEqual(messages, ["2000 lines with format error (no_pattern: 2000)"])
+        quarantine.close()
+        self.assertEqual(len(messages), 1)
+
+if __name__ == '__main__':
+    unittest.main()
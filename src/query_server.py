@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class that answers queries about the analysis over HTTP while the log file is
+still being read, e.g. for a dashboard:
+    GET /status               the numbers of lines and the sizes of the structures
+    GET /hosts?n=10           the most active hosts
+    GET /resources?by=count   the resources by bandwidth (default) or number of requests
+    GET /hours?overlap=0      the busiest hours, overlapping (default) or not
+    GET /blocked              the hosts blocked at the time of the last entry
+The results are published from the loop that reads the log file every few seconds, as a
+snapshot that is never changed afterwards, so a query always sees the results of the same
+lines, costs no more than serializing them to JSON, and never locks the reading loop. The
+server only listens on localhost.
+Author: Yuan Huang
+"""
+
+import json
+import time
+import threading
+import unittest
+from collections import OrderedDict
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib2 import urlopen, HTTPError
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+import host_activity
+import resource_statistics
+
+# The address that the server listens on.
+HOST = "127.0.0.1"
+
+# The minimum number of seconds between the snapshots.
+PUBLISH_SECONDS = 1.0
+
+# The number of hosts and resources kept in a snapshot, the most that a query can get.
+N_TOP = 100
+
+# The number of lines read between the checks of the time to publish, checking the clock for
+# every line would slow the reading down.
+CHECK_LINES = 1024
+
+def take_snapshot(analysis, time_window=None, number=N_TOP):
+    """
+    Get the results of the analysis that can be queried.
+    Args:
+        analysis(LogAnalysis): the analysis.
+        time_window(TimeWindow): the finalized TimeWindow, None to finalize a copy of the
+            one of the analysis (LogAnalysis.finalize(provisional=True)).
+        number(int): the number of hosts and resources to keep.
+    Returns:
+        snapshot(dict): the results by the name of the query, None for the analyzers that
+            don't run.
+    """
+    status = OrderedDict()
+    status["lines"] = analysis.num_lines
+    status["errors"] = analysis.num_errors
+    status["published"] = time.time()
+    final = analysis.entry_final
+    status["last_time"] = None if final is None else final.time
+    status["sizes"] = analysis.sizes()
+    snapshot = {"status": status, "hosts": None, "resources": None, "hours": None,
+                "blocked": None}
+
+    if analysis.hosts is not None:
+        snapshot["hosts"] = [OrderedDict([("host", name), ("count", count)])
+                             for (count, name) in analysis.hosts.top(number,
+                                                                     host_activity.COUNT)]
+    if analysis.resources is not None:
+        snapshot["resources"] = {}
+        for (by, sort_method) in (("bandwidth", resource_statistics.BANDWIDTH),
+                                  ("count", resource_statistics.COUNT)):
+            snapshot["resources"][by] = [
+                OrderedDict([("resource", name), (by, value)])
+                for (value, name) in analysis.resources.top(number, sort_method)]
+    if analysis.time_window is not None:
+        if time_window is None:
+            time_window = analysis.finalize(provisional=True)
+        snapshot["hours"] = {}
+        for (overlap, hours) in (("1", time_window.top()), ("0", time_window.top_no_overlap())):
+            snapshot["hours"][overlap] = [OrderedDict([("start", start), ("count", count)])
+                                          for (count, start) in hours]
+    if analysis.blocked is not None:
+        snapshot["blocked"] = []
+        if final is not None:
+            names = analysis.host_names.names
+            snapshot["blocked"] = [OrderedDict([("host", names[host]), ("seconds_left", left)])
+                                   for (host, left) in analysis.blocked.blocked(final.time)]
+    return snapshot
+
+class QueryServer(object):
+    """
+    The class that serves the snapshots of an analysis over HTTP in a background thread.
+    Example: server = QueryServer(8080)
+             server.start()
+             for line in server.watch(lines, analysis, CHECK_LINES): analysis.update(line)
+             server.stop()
+    Args:
+        port(int): the port to listen on, 0 for any free port.
+        host(str): the address to listen on.
+        interval(float): the minimum number of seconds between the snapshots.
+    Public variables:
+        port(int): the port that the server listens on.
+    """
+    def __init__(self, port=0, host=HOST, interval=PUBLISH_SECONDS):
+        self.__interval = interval
+        self.__snapshot = None
+        self.__published = 0.0
+        self.__server = _ThreadingHTTPServer((host, port), _QueryHandler)
+        self.__server.queries = self
+        self.port = self.__server.server_address[1]
+        self.__thread = None
+
+    def start(self):
+        """
+        Start serving in a background thread.
+        """
+        self.__thread = threading.Thread(target=self.__server.serve_forever,
+                                         name="query-server")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop serving, and close the socket.
+        """
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def due(self):
+        """
+        Check if it is time to publish a new snapshot.
+        Returns:
+            due(bool): True if the interval has passed since the last snapshot.
+        """
+        return time.time() - self.__published >= self.__interval
+
+    def publish(self, analysis, time_window=None):
+        """
+        Take a snapshot of the analysis and serve it from now on. It is called from the
+        thread that updates the analysis, so the snapshot is of the same lines.
+        Args:
+            analysis(LogAnalysis), time_window(TimeWindow): see take_snapshot.
+        """
+        snapshot = take_snapshot(analysis, time_window)
+        # The queries read the reference once, so they get either the old or the new one.
+        self.__snapshot = snapshot
+        self.__published = time.time()
+
+    def watch(self, items, analysis, every=1):
+        """
+        Publish the snapshots of the analysis while it is updated with the items.
+        Args:
+            items(iterable): the lines or the batches that update the analysis.
+            analysis(LogAnalysis): the analysis.
+            every(int): the number of items between the checks of the time.
+        Returns:
+            A generator of the items. A snapshot is taken after an item is processed, when
+            the next one is asked for.
+        """
+        countdown = every
+        for item in items:
+            yield item
+            countdown -= 1
+            if countdown == 0:
+                countdown = every
+                if self.due():
+                    self.publish(analysis)
+
+    def query(self, path, params):
+        """
+        Answer a query from the current snapshot.
+        Args:
+            path(str): the path of the query, e.g. "/hosts".
+            params(dict): the lists of the values of the parameters by name (parse_qs).
+        Returns:
+            (code, result): the HTTP status code and the result to send as JSON.
+        """
+        snapshot = self.__snapshot
+        name = path.strip("/")
+        if name == "":
+            return (200, {"queries": ["/status", "/hosts?n=10", "/resources?by=bandwidth&n=10",
+                                      "/resources?by=count&n=10", "/hours?overlap=1",
+                                      "/hours?overlap=0", "/blocked?n=100"]})
+        if name not in ("status", "hosts", "resources", "hours", "blocked"):
+            return (404, {"error": "unknown query {0}".format(path)})
+        if snapshot is None:
+            return (503, {"error": "no result is published yet"})
+        if name == "status":
+            return (200, snapshot["status"])
+        values = snapshot[name]
+        if values is None:
+            return (404, {"error": "the {0} analyzer doesn't run".format(name)})
+        try:
+            number = int(params.get("n", [N_TOP])[0])
+        except ValueError:
+            return (400, {"error": "n should be an integer"})
+        if name == "resources":
+            key = params.get("by", ["bandwidth"])[0]
+        elif name == "hours":
+            key = params.get("overlap", ["1"])[0]
+        else:
+            key = None
+        if key is not None:
+            if key not in values:
+                return (400, {"error": "unknown option {0}, choose from: {1}"
+                                       .format(key, ", ".join(sorted(values)))})
+            values = values[key]
+        result = OrderedDict()
+        result["lines"] = snapshot["status"]["lines"]
+        result["published"] = snapshot["status"]["published"]
+        result[name] = values[:max(number, 0)]
+        return (200, result)
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    The HTTP server that answers each query in its own thread.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    """
+    The handler of the HTTP requests, it answers with QueryServer.query.
+    """
+    def do_GET(self):
+        url = urlparse(self.path)
+        (code, result) = self.server.queries.query(url.path, parse_qs(url.query))
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """
+        Don't write a line to stderr for every query.
+        """
+        pass
+
+class TestQueryServer(unittest.TestCase):
+    """
+    Unittest Class for answering the queries over HTTP.
+    """
+    def setUp(self):
+        import log_analysis
+        self.lines = ['a - - [01/Jul/1995:00:00:01 -0400] "GET /x HTTP/1.0" 200 100\n',
+                      'b - - [01/Jul/1995:00:00:02 -0400] "GET /y HTTP/1.0" 200 500\n',
+                      'a - - [01/Jul/1995:00:00:03 -0400] "GET /y HTTP/1.0" 200 500\n']
+        self.lines += ['c - - [01/Jul/1995:00:00:0{0} -0400] "POST /login HTTP/1.0" 401 -\n'
+                       .format(second) for second in (4, 5, 6)]
+        self.lines.append('c - - [01/Jul/1995:00:00:07 -0400] "GET /x HTTP/1.0" 200 100\n')
+        self.analysis = log_analysis.LogAnalysis()
+
+    def get(self, server, path):
+        try:
+            reader = urlopen("http://{0}:{1}{2}".format(HOST, server.port, path))
+            return (reader.getcode(), json.loads(reader.read().decode("utf-8")))
+        except HTTPError as error:
+            return (error.code, json.loads(error.read().decode("utf-8")))
+
+    def test_query(self):
+        with QueryServer(interval=0) as server:
+            self.assertEqual(self.get(server, "/hosts")[0], 503)
+            for line in server.watch(self.lines[:3], self.analysis):
+                self.analysis.update(line)
+            self.assertEqual(self.get(server, "/status")[1]["lines"], 3)
+            server.publish(self.analysis)
+            (code, result) = self.get(server, "/hosts?n=1")
+            self.assertEqual(code, 200)
+            self.assertEqual(result["lines"], 3)
+            self.assertEqual(result["hosts"], [{"host": "a", "count": 2}])
+            self.assertEqual(self.get(server, "/resources")[1]["resources"][0],
+                             {"resource": "/y", "bandwidth": 1000})
+            self.assertEqual(self.get(server, "/resources?by=count&n=1")[1]["resources"],
+                             [{"resource": "/y", "count": 2}])
+            self.assertEqual(self.get(server, "/hours?n=1")[1]["hours"],
+                             [{"start": "01/Jul/1995:00:00:01 -0400", "count": 3}])
+            self.assertEqual(self.get(server, "/blocked")[1]["blocked"], [])
+            self.assertEqual(self.get(server, "/resources?by=size")[0], 400)
+            self.assertEqual(self.get(server, "/hosts?n=x")[0], 400)
+            self.assertEqual(self.get(server, "/nothing")[0], 404)
+            self.assertTrue("queries" in self.get(server, "/")[1])
+
+            for line in self.lines[3:]:
+                self.analysis.update(line)
+            server.publish(self.analysis)
+            self.assertEqual(self.get(server, "/blocked")[1]["blocked"],
+                             [{"host": "c", "seconds_left": 299}])
+        # The analysis can still be updated after a provisional snapshot
+        self.analysis.update(self.lines[0])
+        self.assertEqual(self.analysis.finalize().top()[0][0], 8)
+
+    def test_analyzers(self):
+        import log_analysis
+        analysis = log_analysis.LogAnalysis(analyzers=["hosts"])
+        server = QueryServer()
+        analysis.update(self.lines[0])
+        server.publish(analysis)
+        self.assertEqual(server.query("/hosts", {})[1]["hosts"], [{"host": "a", "count": 1}])
+        self.assertEqual(server.query("/hours", {})[0], 404)
+        self.assertEqual(server.query("/status", {})[1]["sizes"]["distinct_hosts"], 1)
+        server.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,15 @@ Author: Yuan Huang
 """
 import re
 import unittest
+from collections import namedtuple
+import utility
+try:
+    import numpy as np
+except ImportError:
+    np = None
 import datetime as dt
+import calendar
+import time
 from dateutil import parser
 
 # Regex for the Apache common log format.
@@ -23,10 +31,89 @@ PARTS = [r'(?P<Host>\S+)',                   # host %h
 # The pattern for the Apache log
 PATTERN = re.compile(r'\s+'.join(PARTS)+r'\s*\Z')
 
+# The request types accepted in a log.
+REQUEST_TYPES = {'GET': 'GET', 'POST': 'POST', 'HEAD': 'HEAD'}
+
+# The request types in the order of their integer codes in LogBatch.request_type.
+REQUEST_TYPE_NAMES = ('GET', 'POST', 'HEAD')
+REQUEST_TYPE_CODES = dict((name, code) for (code, name) in enumerate(REQUEST_TYPE_NAMES))
+
+# The integers of the status strings, e.g. "404" -> 404.
+STATUS_CODES = dict((str(code), code) for code in range(100, 600))
+
 # The map between the name of month and its number
 MONTH_MAP = {'Jan': 1, 'Feb': 2, 'Mar':3, 'Apr':4, 'May':5, 'Jun':6, 'Jul':7,
              'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
 
+# The maximum number of time strings kept in TIME_CACHE and EPOCH_CACHE.
+# The caches are emptied when they are full.
+TIME_CACHE_SIZE = 100000
+
+# Cache of time string -> datetime object.
+TIME_CACHE = {}
+
+# Cache of time string -> (epoch seconds, offset seconds).
+EPOCH_CACHE = {}
+
+# Shared table of time zone string -> (FixOffset object, offset seconds).
+ZONE_TABLE = {}
+
+# The reason codes of the lines that are not in the log format (EntryError.reason).
+(NO_PATTERN, BAD_METHOD, BAD_REQUEST, BAD_TIME, BAD_SIZE, BAD_ENCODING) = (
+    "no_pattern", "bad_method", "bad_request", "bad_time", "bad_size", "bad_encoding")
+
+class EntryError(TypeError):
+    """
+    The error raised by read_entry for a line that is not in the log format.
+    Args:
+        msg(str): the error message.
+        reason(str): the reason code, NO_PATTERN, BAD_METHOD, BAD_REQUEST, BAD_TIME, BAD_SIZE
+            or BAD_ENCODING.
+    Public variables:
+        reason(str): see Args.
+    """
+    def __init__(self, msg, reason):
+        TypeError.__init__(self, msg)
+        self.reason = reason
+
+class LogRecord(namedtuple("LogRecord", ["host", "user", "time", "offset",
+                                         "request_type", "request", "status", "size"])):
+    """
+    A compact record of a log item, a tuple with the fields in the order of
+    (host, user, time, offset, request_type, request, status, size). The fields hold the same
+    values as the keys "Host", "User", "Time", "Offset", "Request_Type", "Request", "Status"
+    and "Size" of the log dictionary. The fields can be read by name (record.host) or
+    by index (record[HOST]).
+    """
+    __slots__ = ()
+
+    # The keys of the log dictionary in the order of the fields.
+    KEYS = ("Host", "User", "Time", "Offset", "Request_Type", "Request", "Status", "Size")
+
+    @classmethod
+    def from_dict(cls, entry):
+        """
+        Transform a log dictionary into a LogRecord. Missing keys become None.
+        Args:
+            entry(dict or LogRecord): the log dictionary.
+        Returns:
+            LogRecord object. entry is returned directly if it is already a LogRecord.
+        """
+        if isinstance(entry, cls):
+            return entry
+        return tuple.__new__(cls, [entry.get(key) for key in cls.KEYS])
+
+    def to_dict(self):
+        """
+        Transform the LogRecord into a log dictionary.
+        Returns:
+            dictionary with keys in LogRecord.KEYS.
+        """
+        return dict(zip(self.KEYS, self))
+
+# Names for the indices of the fields in LogRecord.
+(HOST, USER, TIME, OFFSET, REQUEST_TYPE, REQUEST, STATUS, SIZE) = range(8)
+
 class FixOffset(dt.tzinfo):
     """
     Fixed offset in minutes east from UTC.
@@ -65,29 +152,119 @@ class FixOffset(dt.tzinfo):
     def __repr__(self):
         return repr(self.__name)
 
+def __timezone(zstr):
+    """
+    Get the shared time zone object and offset for a time zone string.
+    Args:
+        zstr(str): time zone string, e.g. "-0400"
+    Returns:
+        (tz, offset): the FixOffset object and the offset in seconds east from UTC.
+    """
+    zone = ZONE_TABLE.get(zstr)
+    if zone is None:
+        tz = FixOffset(zstr)
+        offset = tz.utcoffset(None)
+        zone = (tz, offset.days*86400 + offset.seconds)
+        ZONE_TABLE[zstr] = zone
+    return zone
+
 def __apachetime(tstr):
     """
-    Transform the time string in Apache time format (without timezone information)
-    into datetime object.
+    Transform the time string in Apache time format into datetime object.
+    The datetime objects are cached, since consecutive lines share the same time string.
     Args:
-        tstr(str): time string in format '%d/%b/%Y:%H:%M:%S', e.g. "01/Jul/1997:00:00:01"
+        tstr(str): time string in format '%d/%b/%Y:%H:%M:%S %z', e.g. "01/Jul/1997:00:00:01 -0400"
     Returns:
         datetime object.
+    Raises:
+        EntryError: Error occurs when the time is not a valid date and time.
+    """
+    result = TIME_CACHE.get(tstr)
+    if result is None:
+        try:
+            result = dt.datetime(int(tstr[7:11]), MONTH_MAP[tstr[3:6]], int(tstr[0:2]),
+                                 int(tstr[12:14]), int(tstr[15:17]), int(tstr[18:20]),
+                                 tzinfo=__timezone(tstr[21:26])[0])
+        except (KeyError, ValueError, IndexError):
+            raise EntryError("Time format is not correct in the entry: {0}".format(tstr),
+                             BAD_TIME)
+        if len(TIME_CACHE) >= TIME_CACHE_SIZE:
+            TIME_CACHE.clear()
+        TIME_CACHE[tstr] = result
+    return result
+
+def __apacheepoch(tstr):
+    """
+    Transform the time string in Apache time format into integer epoch seconds.
+    Args:
+        tstr(str): time string in format '%d/%b/%Y:%H:%M:%S %z', e.g. "01/Jul/1997:00:00:01 -0400"
+    Returns:
+        (epoch, offset): epoch(int) is the seconds since 1970-01-01 UTC, offset(int) is the
+        time zone offset in seconds east from UTC.
+    Raises:
+        EntryError: Error occurs when the time is not a valid date and time.
+    """
+    result = EPOCH_CACHE.get(tstr)
+    if result is None:
+        try:
+            offset = __timezone(tstr[21:26])[1]
+            local = dt.datetime(int(tstr[7:11]), MONTH_MAP[tstr[3:6]], int(tstr[0:2]),
+                                int(tstr[12:14]), int(tstr[15:17]), int(tstr[18:20]))
+        except (KeyError, ValueError, IndexError):
+            raise EntryError("Time format is not correct in the entry: {0}".format(tstr),
+                             BAD_TIME)
+        result = (calendar.timegm(local.timetuple()) - offset, offset)
+        if len(EPOCH_CACHE) >= TIME_CACHE_SIZE:
+            EPOCH_CACHE.clear()
+        EPOCH_CACHE[tstr] = result
+    return result
+
+def format_epoch(epoch, offset):
+    """
+    Transform the epoch seconds back to the time string in Apache time format.
+    Args:
+        epoch(int): the seconds since 1970-01-01 UTC.
+        offset(int): the time zone offset in seconds east from UTC.
+    Returns:
+        string in format '%d/%b/%Y:%H:%M:%S %z', e.g. "01/Jul/1997:00:00:01 -0400"
     """
-    tz = FixOffset(tstr[21:26])
-    return dt.datetime(int(tstr[7:11]), MONTH_MAP[tstr[3:6]], int(tstr[0:2]),
-                       int(tstr[12:14]), int(tstr[15:17]), int(tstr[18:20]), tzinfo=tz)
+    if offset < 0:
+        sign = "-"
+    else:
+        sign = "+"
+    hours, minutes = divmod(abs(offset)//60, 60)
+    return "{0} {1}{2:02d}{3:02d}".format(
+        time.strftime("%d/%b/%Y:%H:%M:%S", time.gmtime(epoch + offset)), sign, hours, minutes)
 
-def __format_standardize(entry_dict):
+def __size(sstr):
+    """
+    Transform the size string of a log into an integer.
+    Args:
+        sstr(str): the size string, a number of bytes or '-'.
+    Returns:
+        size(int): the number of bytes, 0 for '-'.
+    Raises:
+        EntryError: Error occurs when the size is not a number.
+    """
+    if sstr == "-":
+        return 0
+    try:
+        return int(sstr)
+    except ValueError:
+        raise EntryError("Size is not a number in the entry: {0}".format(sstr), BAD_SIZE)
+
+def __format_standardize(entry_dict, epoch=False):
     """
     Change the format and datatype of the Apache log dictionary.
     Args:
         entry_dict(dict): the groupdict result of pattern matches in a Apache log item.
+        epoch(bool): whether to transfer the time into epoch seconds instead of datetime.
     Returns:
         dictionary:
             Request is seperated into Request_Type(GET,POST,HEAD)
             and Request(The name of resource). '-' is turned into None (in User)
-            or 0 (in Size and Status). Time is transferred into a datetime object.
+            or 0 (in Size and Status). Time is transferred into a datetime object, or
+            into epoch seconds together with the time zone offset in seconds ("Offset").
     """
     # Clean up the request.
     request_list = entry_dict["Request"].split()
@@ -95,23 +272,26 @@ def __format_standardize(entry_dict):
 
     if len(request_list) >= 2:
         entry_dict["Request"] = request_list[1]
-        request_list[0] = (request_list[0].decode('utf-8').strip())[1:]
+        try:
+            request_list[0] = (request_list[0].decode('utf-8').strip())[1:]
+        except UnicodeDecodeError:
+            raise EntryError("Request Type is not in UTF-8 in the entry: {0!r}"
+                             .format(request_list[0]), BAD_ENCODING)
         if request_list[0] in ["GET", "POST", "HEAD"]:
             entry_dict["Request_Type"] = request_list[0]
         else:
-            raise TypeError("Request Type is not GET/POST/HEAD in the entry: {0}".format(entry_dict["Request_Type"]))
+            raise EntryError("Request Type is not GET/POST/HEAD in the entry: {0}".format(entry_dict["Request_Type"]),
+                             BAD_METHOD)
     else:
-        raise TypeError("Request format is not correct in the entry: {0}".format(entry_dict["Request"]))
+        raise EntryError("Request format is not correct in the entry: {0}".format(entry_dict["Request"]),
+                         BAD_REQUEST)
 
     # Some dashes become None.
     if entry_dict["User"] == "-":
         entry_dict["User"] = None
 
     # The size dash becomes 0.
-    if entry_dict["Size"] == "-":
-        entry_dict["Size"] = 0
-    else:
-        entry_dict["Size"] = int(entry_dict["Size"])
+    entry_dict["Size"] = __size(entry_dict["Size"])
 
     # The status dash becomes 0.
     if entry_dict["Status"] == "-":
@@ -120,33 +300,267 @@ def __format_standardize(entry_dict):
         entry_dict["Status"] = int(entry_dict["Status"])
 
     # Convert the timestamp into a datetime object. Accept the server's time zone.
-    entry_dict["Time"] = __apachetime(entry_dict["Time"])
+    if epoch:
+        entry_dict["Time"], entry_dict["Offset"] = __apacheepoch(entry_dict["Time"])
+    else:
+        entry_dict["Time"] = __apachetime(entry_dict["Time"])
     return entry_dict
 
-def read_entry(line):
+def __fast_split(line, epoch=False, record=False, hosts=None, resources=None, selected=None):
+    """
+    Split a well-formed Apache log line into a dictionary without regular expression,
+    using the fixed positions of the brackets and the quotes.
+    Args:
+        line(str): a string with Apache log format.
+        epoch(bool): whether to transfer the time into epoch seconds instead of datetime.
+        record(bool): whether to return a LogRecord instead of a dictionary.
+        hosts(Vocabulary), resources(Vocabulary): if given, the host and the request are
+        transferred into their integer IDs.
+        selected(set): if given, only the fields with these indices are decoded, see read_entry.
+    Returns:
+        dictionary (or LogRecord) with the same keys and values as
+        __format_standardize(PATTERN.match(line)), or None if the line is not in the simple
+        form handled here. The caller should then fall back to the regular expression.
+    """
+    line = line.rstrip()
+    if '\n' in line:
+        return None
+
+    # Host, indent and user are the three fields before the time bracket.
+    names = line.split(None, 3)
+    if len(names) != 4 or line[:1].isspace():
+        return None
+    left = len(line) - len(names[3])
+    if line.find('[', 0, left+1) != left:
+        return None
+
+    # The time string has a fixed length.
+    right = left + 27
+    if line[right:right+1] != ']':
+        return None
+
+    # The request is in between the time and the last two fields (status and size). No
+    # other closing bracket is allowed after the time, otherwise the greedy regular
+    # expression may split the line differently.
+    tail = line[right+1:]
+    if not tail[:1].isspace() or ']' in tail:
+        return None
+    tail = tail.rsplit(None, 2)
+    if len(tail) != 3 or not tail[1].isdigit():
+        return None
+    status = STATUS_CODES.get(tail[1])
+    if status is None:
+        status = int(tail[1])
+    request_list = tail[0].split(None, 2)
+    if len(request_list) < 2:
+        return None
+    request_type = REQUEST_TYPES.get(request_list[0][1:])
+    if request_type is None:
+        return None
+
+    # The caches are looked up here, the helpers only decode the strings that are new.
+    tstr = line[left+1:right]
+    if selected is None:
+        user = names[2]
+        if user == "-":
+            user = None
+        size = tail[2]
+        size = int(size) if size.isdigit() else __size(size)
+        if epoch:
+            (time, offset) = EPOCH_CACHE.get(tstr) or __apacheepoch(tstr)
+        else:
+            time = TIME_CACHE.get(tstr) or __apachetime(tstr)
+            offset = None
+        host = names[0] if hosts is None else hosts[names[0]]
+        request = request_list[1] if resources is None else resources[request_list[1]]
+    else:
+        (host, user, time, offset, request, size) = (None, None, None, None, None, None)
+        if USER in selected:
+            user = names[2]
+            if user == "-":
+                user = None
+        if SIZE in selected:
+            size = __size(tail[2])
+        if TIME in selected or OFFSET in selected:
+            if epoch:
+                time, offset = __apacheepoch(tstr)
+            else:
+                time = __apachetime(tstr)
+        if HOST in selected:
+            host = names[0]
+            if hosts is not None:
+                host = hosts[host]
+        if REQUEST in selected:
+            request = request_list[1]
+            if resources is not None:
+                request = resources[request]
+
+    if record:
+        return tuple.__new__(LogRecord, (host, user, time, offset, request_type,
+                                         request, status, size))
+    entry_dict = {"Host": host, "User": user, "Time": time, "Request_Type": request_type,
+                  "Request": request, "Status": status, "Size": size}
+    if epoch:
+        entry_dict["Offset"] = offset
+    return entry_dict
+
+def read_entry(line, epoch=False, record=False, hosts=None, resources=None, fields=None):
     """
     Transform a line in the log file into a dictionary with standardized format.
     Args:
         line(str): a string with Apache log format, e.g. '199.72.81.55 - -
         [01/Jul/1995:00:00:01 -0000] "POST /login HTTP/1.0" 401 -'.
+        epoch(bool): if True, "Time" is the integer epoch seconds and the dictionary has
+        an extra key "Offset"(int), the time zone offset in seconds east from UTC.
+        record(bool): if True, return a LogRecord instead of a dictionary.
+        hosts(utility.Vocabulary): if given, "Host" is the integer ID of the host in hosts.
+        resources(utility.Vocabulary): if given, "Request" is the integer ID of the resource
+        in resources.
+        fields(set): if given, only the fields with these indices (HOST, USER, TIME, ...) are
+        decoded, the other fields (except Request_Type and Status) are None. The line is
+        still checked to be in the log format. The host and the resource that are not decoded
+        are not added to the vocabularies.
     Returns:
         dictionary:
             A dictionary with keys "Host"(str), "User"(str), "Time"(datetime),
             "Request_Type"(str, GET/POST/HEAD), "Request"(str), "Status"(int), "Size"(int)
+    Raises:
+        EntryError: Error occurs when the line is not in the log format, with the reason code.
     """
 
+    # Most lines are well-formed and can be split without regular expression
+    dictionary = __fast_split(line, epoch, record, hosts, resources, fields)
+    if dictionary is not None:
+        return dictionary
+
     # Use regular expression to find the patterns in the log string
     matches = PATTERN.match(line)
     if matches is None:
-        raise TypeError("No pattern is found in line {0}".format(line))
+        raise EntryError("No pattern is found in line {0}".format(line), NO_PATTERN)
 
     # Get the dictionary of the log with all the matched patterns
     hit = matches.groupdict()
 
     # Change the format of the dictionary
-    dictionary = __format_standardize(hit)
+    dictionary = __format_standardize(hit, epoch)
+    if fields is not None:
+        for field in (HOST, USER, TIME, OFFSET, REQUEST, SIZE):
+            if field not in fields and LogRecord.KEYS[field] in dictionary:
+                dictionary[LogRecord.KEYS[field]] = None
+    if hosts is not None and dictionary["Host"] is not None:
+        dictionary["Host"] = hosts[dictionary["Host"]]
+    if resources is not None and dictionary["Request"] is not None:
+        dictionary["Request"] = resources[dictionary["Request"]]
+    if record:
+        return LogRecord.from_dict(dictionary)
     return dictionary
 
+class LogBatch(object):
+    """
+    A batch of log items stored in columns. Each column is a numpy array with one
+    element for each parsed line; the hosts and the requests are integer IDs and the
+    time is in epoch seconds.
+    Public variables:
+        lines(list): the parsed lines in order.
+        errors(list): a list of (line, message, reason code) for the lines that are not in
+            the log format (EntryError).
+        index(numpy.ndarray): the index of each parsed line in the chunk of lines it is read
+            from, or None if it is not known.
+        host, time, offset, request_type, request, status, size(numpy.ndarray): the columns.
+            request_type is coded by REQUEST_TYPE_CODES.
+    """
+    COLUMNS = ("host", "time", "offset", "request_type", "request", "status", "size")
+
+    def __init__(self, lines, errors, columns, index=None):
+        """
+        Args:
+            lines(list): the parsed lines, or any sequence that gives the line of an index.
+            errors(list): the lines with format error, the error messages and the reason
+                codes.
+            columns(list): the lists or arrays (host, time, offset, request_type, request,
+                status, size). int64 arrays (e.g. memory-mapped arrays) are not copied.
+            index(list): the index of each parsed line in the chunk it is read from.
+        """
+        self.lines = lines
+        self.errors = errors
+        self.index = None if index is None else np.asarray(index, dtype=np.int64)
+        (self.host, self.time, self.offset, self.request_type, self.request, self.status,
+         self.size) = [np.asarray(column, dtype=np.int64) for column in columns]
+
+    def __len__(self):
+        return len(self.lines)
+
+    def split(self, size):
+        """
+        Split the batch into smaller batches. The columns of the smaller batches are views
+        of the columns of this batch. The errors are kept in the first batch.
+        Args:
+            size(int): the number of lines in each smaller batch.
+        Returns:
+            A generator of LogBatch objects.
+        """
+        for start in range(0, len(self), size):
+            stop = start + size
+            yield LogBatch(self.lines[start:stop], self.errors if start == 0 else [],
+                           [getattr(self, name)[start:stop] for name in self.COLUMNS])
+
+    def record(self, idx):
+        """
+        Get the LogRecord of a line in the batch (the user is not kept in the batch).
+        Args:
+            idx(int): the index of the line in the batch.
+        Returns:
+            LogRecord object.
+        """
+        return LogRecord(int(self.host[idx]), None, int(self.time[idx]), int(self.offset[idx]),
+                         REQUEST_TYPE_NAMES[self.request_type[idx]], int(self.request[idx]),
+                         int(self.status[idx]), int(self.size[idx]))
+
+def read_batch(lines, hosts, resources, fields=None):
+    """
+    Transform a chunk of lines into a LogBatch. Lines that are not in the log format are
+    not in the batch, they are kept in LogBatch.errors.
+    Args:
+        lines(list): the lines in Apache log format.
+        hosts(utility.Vocabulary): the vocabulary of the host IDs.
+        resources(utility.Vocabulary): the vocabulary of the resource IDs.
+        fields(set): if given, only the fields with these indices are decoded, the columns
+            of the other fields are zeros (see read_entry).
+    Returns:
+        LogBatch object.
+    Raises:
+        ImportError: Error occurs when numpy is not installed.
+    """
+    if np is None:
+        raise ImportError("numpy is required to read the log in batches")
+
+    parsed = []
+    index = []
+    records = []
+    errors = []
+    for (idx, line) in enumerate(lines):
+        try:
+            records.append(read_entry(line, epoch=True, record=True,
+                                      hosts=hosts, resources=resources, fields=fields))
+            parsed.append(line)
+            index.append(idx)
+        except EntryError as error:
+            errors.append((line, str(error), error.reason))
+
+    # Transpose the records into columns, the records are released after that.
+    if records:
+        columns = zip(*records)
+    else:
+        columns = [()] * len(LogRecord._fields)
+    del records
+    if fields is not None:
+        columns = [column if (idx in fields or idx in (REQUEST_TYPE, STATUS))
+                   else [0] * len(parsed) for (idx, column) in enumerate(columns)]
+    request_types = [REQUEST_TYPE_CODES[key] for key in columns[REQUEST_TYPE]]
+    return LogBatch(parsed, errors, [columns[HOST], columns[TIME], columns[OFFSET], request_types,
+                                     columns[REQUEST], columns[STATUS], columns[SIZE]],
+                    index)
+
 class TestReadEntry(unittest.TestCase):
     """
     Unittest Class for the read_entry function.
@@ -178,5 +592,140 @@ class TestReadEntry(unittest.TestCase):
         self.assertEqual(entry_dict["Status"], 200)
         self.assertEqual(entry_dict["Size"], 1204)
 
+    def test_read_entry_epoch(self):
+        """
+        Test the epoch seconds and the time zone offset of the examples.
+        """
+        entry_dict = read_entry(self.file[0], epoch=True)
+        self.assertEqual(entry_dict["Time"], 804571201)
+        self.assertEqual(entry_dict["Offset"], -4*60*60)
+        self.assertEqual(format_epoch(entry_dict["Time"], entry_dict["Offset"]),
+                         "01/Jul/1995:00:00:01 -0400")
+
+        entry_dict = read_entry('199.72.81.55 - - [01/Jul/1995:00:00:01 -0400] '
+                                '"GET /a]b HTTP/1.0" 200 12', epoch=True)
+        self.assertEqual(entry_dict["Time"], 804571201)
+        self.assertEqual(entry_dict["Offset"], -4*60*60)
+
+    def test_read_entry_record(self):
+        """
+        Test the LogRecord has the same values as the dictionary.
+        """
+        for line in self.file + ['199.72.81.55 - - [01/Jul/1995:00:00:01 -0400] '
+                                 '"GET /a]b HTTP/1.0" 200 12']:
+            for epoch in (False, True):
+                entry_dict = read_entry(line, epoch=epoch)
+                record = read_entry(line, epoch=epoch, record=True)
+                self.assertTrue(isinstance(record, LogRecord))
+                self.assertEqual(record, LogRecord.from_dict(entry_dict))
+                self.assertEqual(record.host, entry_dict["Host"])
+                self.assertEqual(record[REQUEST], entry_dict["Request"])
+                self.assertEqual(record[SIZE], entry_dict["Size"])
+        self.assertEqual(record.to_dict()["Offset"], -4*60*60)
+
+    def test_read_entry_vocabulary(self):
+        """
+        Test the host and the resource are transferred into IDs.
+        """
+        hosts = utility.Vocabulary()
+        resources = utility.Vocabulary()
+        for line in self.file + self.file:
+            read_entry(line, record=True, hosts=hosts, resources=resources)
+        record = read_entry(self.file[1], record=True, hosts=hosts, resources=resources)
+        self.assertEqual(record.host, 1)
+        self.assertEqual(hosts.decode(record.host), "220.149.67.62")
+        entry_dict = read_entry(self.file[0] + " ", hosts=hosts, resources=resources)
+        self.assertEqual(entry_dict["Request"], 0)
+        self.assertEqual(resources.names, ["/login", "/images/KSC-logosmall.gif"])
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_read_batch(self):
+        """
+        Test the columns of the batch are the same as the records.
+        """
+        hosts = utility.Vocabulary()
+        resources = utility.Vocabulary()
+        batch = read_batch(self.file + ["bad line"] + self.file, hosts, resources)
+        self.assertEqual(len(batch), 4)
+        self.assertEqual(batch.errors[0][0], "bad line")
+        self.assertEqual(batch.errors[0][2], NO_PATTERN)
+        self.assertEqual(list(batch.host), [0, 1, 0, 1])
+        self.assertEqual(list(batch.status), [401, 200, 401, 200])
+        self.assertEqual(list(batch.request_type), [1, 0, 1, 0])
+        self.assertEqual(batch.record(1), read_entry(self.file[1], epoch=True, record=True,
+                                                     hosts=hosts, resources=resources))
+        self.assertEqual(list(batch.index), [0, 1, 3, 4])
+
+        parts = list(batch.split(3))
+        self.assertEqual([len(part) for part in parts], [3, 1])
+        self.assertEqual(len(parts[0].errors), 1)
+        self.assertEqual(parts[1].record(0), batch.record(3))
+
+        batch = read_batch([], hosts, resources)
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(len(batch.time), 0)
+
+    def test_read_entry_fields(self):
+        """
+        Test only the selected fields are decoded and added to the vocabularies.
+        """
+        hosts = utility.Vocabulary()
+        resources = utility.Vocabulary()
+        for line in (self.file[1], self.file[1].replace("GET ", "GET /a]b ")):
+            record = read_entry(line, epoch=True, record=True, hosts=hosts,
+                                resources=resources, fields=set([HOST, STATUS]))
+            self.assertEqual(record, LogRecord(0, None, None, None, "GET", None, 200, None))
+        self.assertEqual(len(resources), 0)
+        self.assertRaises(TypeError, read_entry, 'a - - [01/Jul/1995:00:00:01 -0400] 200 -',
+                          fields=set([HOST]))
+        if np is not None:
+            batch = read_batch(self.file, hosts, resources, fields=set([TIME, OFFSET]))
+            self.assertEqual(list(batch.host), [0, 0])
+            self.assertEqual(list(batch.status), [401, 200])
+            self.assertEqual(batch.time[0], 804571201)
+
+    def test_read_entry_irregular(self):
+        """
+        Test the lines that are not handled by the fast split and fall back to regex.
+        """
+        entry_dict = read_entry('199.72.81.55 - - [01/Jul/1995:00:00:01 -0400] '
+                                '"GET /a]b HTTP/1.0" 200 12')
+        self.assertEqual(entry_dict["Request"], "/a]b")
+        self.assertEqual(entry_dict["Size"], 12)
+
+        entry_dict = read_entry('199.72.81.55 - user [01/Jul/1995:00:00:01 -0400]  '
+                                '"HEAD /x"  304 -\n')
+        self.assertEqual(entry_dict["User"], "user")
+        self.assertEqual(entry_dict["Request_Type"], "HEAD")
+        self.assertEqual(entry_dict["Request"], '/x"')
+        self.assertEqual(entry_dict["Status"], 304)
+        self.assertEqual(entry_dict["Size"], 0)
+
+        entry_dict = read_entry('199.72.81.55\t-\t-\t[01/Jul/1995:00:00:01 -0400]\t'
+                                '"GET /x HTTP/1.0"\t200\t5')
+        self.assertEqual(entry_dict["Host"], "199.72.81.55")
+        self.assertEqual(entry_dict["Request"], "/x")
+
+        self.assertRaises(TypeError, read_entry, 'a - - [01/Jul/1995:00:00:01 -0400] 200 -')
+        self.assertRaises(TypeError, read_entry, 'a - - [01/Jul/1995:00:00:01 -0400] '
+                          '"PUT /x HTTP/1.0" 200 -')
+        for epoch in (False, True):
+            self.assertRaises(TypeError, read_entry, 'a - - [01/Jly/1995:00:00:01 -0400] '
+                              '"GET /x HTTP/1.0" 200 -', epoch=epoch)
+            self.assertRaises(TypeError, read_entry, 'a - - [31/Jun/1995:00:00:01 -0400] '
+                              '"GET /x HTTP/1.0" 200 -', epoch=epoch)
+        for (line, reason) in (('a - - [01/Jul/1995:00:00:01 -0400] "GET /x HTTP/1.0" 200 12a',
+                                 BAD_SIZE),
+                                ('a - - [01/Jul/1995:00:00:01 -0400] "\xff\xfeGET /x HTTP/1.0" '
+                                 '200 1', BAD_ENCODING),
+                                ('a - - [01/Jul/1995:00:00:01] "GET /x HTTP/1.0" 200 1', BAD_TIME)):
+            for epoch in (False, True):
+                with self.assertRaises(EntryError) as context:
+                    read_entry(line, epoch=epoch, record=epoch)
+                self.assertEqual(context.exception.reason, reason)
+            if np is not None:
+                batch = read_batch([line], utility.Vocabulary(), utility.Vocabulary())
+                self.assertEqual((len(batch), batch.errors[0][2]), (0, reason))
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,7 +6,14 @@ and get the top n resources that consumes the most bandwidth.
 Author: Yuan Huang
 """
 import unittest
+import array
 import utility
+import read_entry
+import heavy_hitters
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # COUNT, SIZE, BANDWIDTH are public variables which can be used when set
 # the sorting method in the ResourceStatistics.top() function.
@@ -22,38 +29,225 @@ class ResourceStatistics(object):
     """
     The class that records the information for each resources, including
     the times of request, the size and consumed bandwidth.
+    Args:
+        names(utility.Vocabulary): if the requests of the entries are integer IDs
+            (read_entry.read_entry(line, resources=names)), the vocabulary to get the
+            resource names. The counts and the bandwidth are then kept in two arrays indexed
+            by the resource IDs, instead of a list for each resource.
+        capacity(int): if given, only this many resources are kept for each of COUNT and
+            BANDWIDTH (heavy_hitters.SpaceSaving), so the memory doesn't grow with the number
+            of resources. Only top(number, COUNT) and top(number, BANDWIDTH) can be found
+            then, they are approximate and larger than the true ones by at most error_bound.
+    The average sizes are not kept, they are computed from the counts and the bandwidth when
+    the resources are sorted by SIZE. The top and bottom resources are selected by
+    partitioning the values (utility.nlargest_array) instead of a heap of all the resources.
+    The resources are indexed by their counts (utility.CountIndex) from the first time that
+    the top or bottom resources by COUNT are asked for, and the index is kept up to date
+    afterwards, so asking again costs O(number). The ties are broken by the resource names
+    in ascending order.
     """
     # Names for the indices of the list in ResourceStatistics.__resource.
-    (__COUNT, __SIZE, __BANDWIDTH) = (0, 1, 2)
-    def __init__(self):
+    (__COUNT, __BANDWIDTH) = (0, 1)
+    def __init__(self, names=None, capacity=None):
         """
+        Contains a dictionary __resource with resource names as keys and a list as values, or
+        two arrays indexed by the resource IDs.
         Private members:
             __resource(dict): The dictionary with resource name as its key and a list as value. The list is
-               length 3, for example
-               list[__COUNT, __SIZE, __BANDWIDTH] = (the total number of requests of the resource,
-                                                     the size of resource,
-                                                     total network traffic for the resource).
+               length 2, for example
+               list[__COUNT, __BANDWIDTH] = (the total number of requests of the resource,
+                                             total network traffic for the resource).
+            __names(Vocabulary): the resource names of the IDs, None if the keys are
+                resource names.
+            __columns(tuple): if the requests are IDs, the arrays (counts, bandwidth) indexed
+                by the resource IDs are used instead of __resource. They grow geometrically,
+                so the IDs with count 0 are not recorded.
+            __sketches(dict): if capacity is given, the SpaceSaving of the counts and the
+                one of the bandwidth by __COUNT and __BANDWIDTH are used instead.
+            __index(CountIndex): the index of the counts, None until it is needed.
         """
         self.__resource = {}
+        self.__names = names
+        self.__columns = (array.array('l'), array.array('l'))
+        self.__sketches = None
+        if capacity is not None:
+            self.__sketches = {self.__COUNT: heavy_hitters.SpaceSaving(capacity),
+                               self.__BANDWIDTH: heavy_hitters.SpaceSaving(capacity)}
+        self.__index = None
+
+    def __getstate__(self):
+        """
+        Get the state to pickle, e.g. into a checkpoint. The index is not pickled, it is
+        built again when it is needed.
+        """
+        state = self.__dict__.copy()
+        state["_ResourceStatistics__index"] = None
+        return state
 
     def update(self, entry):
         """Add the info of entry into the statistics of each resource.
         Args:
-            entry(dict): the dictionary of a log info
+            entry(LogRecord or dict): the record of a log info
         """
-        res = entry["Request"]
+        if isinstance(entry, dict):
+            entry = read_entry.LogRecord.from_dict(entry)
+        res = entry[read_entry.REQUEST]
+        if self.__names is not None:
+            root = self.__names.get("/")
+        else:
+            root = "/"
+        if res == root:
+            return
 
-        if res != "/":
-            if res in self.__resource:
-                self.__resource[res][self.__COUNT] += 1
-                self.__resource[res][self.__BANDWIDTH] += entry["Size"]
-                self.__resource[res][self.__SIZE] = self.__resource[res]\
-                    [self.__BANDWIDTH]/float(self.__resource[res][self.__COUNT])
+        if self.__sketches is not None:
+            self.__sketches[self.__COUNT].update(res)
+            self.__sketches[self.__BANDWIDTH].update(res, entry[read_entry.SIZE])
+            return
+        if self.__names is not None:
+            counts, bandwidths = self.__columns
+            if res >= len(counts):
+                self.__grow(res + 1)
+            counts[res] += 1
+            bandwidths[res] += entry[read_entry.SIZE]
+            count = counts[res]
+        else:
+            status = self.__resource.get(res)
+            if status is not None:
+                status[self.__COUNT] += 1
+                status[self.__BANDWIDTH] += entry[read_entry.SIZE]
             else:
-                self.__resource[res] = [0, 0, 0]
-                self.__resource[res][self.__COUNT] = 1
-                self.__resource[res][self.__SIZE] = float(entry["Size"])
-                self.__resource[res][self.__BANDWIDTH] = entry["Size"]
+                status = self.__resource[res] = [1, entry[read_entry.SIZE]]
+            count = status[self.__COUNT]
+        if self.__index is not None:
+            self.__index.move(res, count - 1, count)
+
+    def __grow(self, length):
+        """
+        Grow the arrays to at least a length, and at least twice as long, so the arrays are
+        copied only O(log n) times for n resources.
+        Args:
+            length(int): the length needed.
+        """
+        counts, bandwidths = self.__columns
+        zeros = array.array('l', [0]) * (max(length, 2 * len(counts)) - len(counts))
+        counts.extend(zeros)
+        bandwidths.extend(zeros)
+
+    def update_batch(self, batch):
+        """Add the info of a LogBatch into the statistics of each resource. The counts and
+        bandwidth of the resources in the batch are summed up with numpy.
+        Args:
+            batch(LogBatch): the batch of log items.
+        """
+        if self.__names is None:
+            for idx in range(len(batch)):
+                self.update(batch.record(idx))
+            return
+
+        requests = batch.request
+        sizes = batch.size
+        root = self.__names.get("/")
+        if root is not None:
+            mask = requests != root
+            requests = requests[mask]
+            sizes = sizes[mask]
+        if len(requests) == 0:
+            return
+
+        if self.__sketches is not None:
+            keys, inverse = np.unique(requests, return_inverse=True)
+            counts = np.bincount(inverse)
+            bandwidths = np.rint(np.bincount(inverse, weights=sizes)).astype(np.int64)
+            (count_sketch, bandwidth_sketch) = (self.__sketches[self.__COUNT],
+                                                self.__sketches[self.__BANDWIDTH])
+            for (res, count, bandwidth) in zip(keys.tolist(), counts.tolist(),
+                                               bandwidths.tolist()):
+                count_sketch.update(res, count)
+                bandwidth_sketch.update(res, bandwidth)
+            return
+
+        length = int(requests.max()) + 1
+        if length > len(self.__columns[self.__COUNT]):
+            self.__grow(length)
+        counts, bandwidths = self.__columns
+        batch_counts = np.bincount(requests, minlength=length)
+        column = np.frombuffer(counts, dtype=np.int_)[:length]
+        column += batch_counts
+        np.frombuffer(bandwidths, dtype=np.int_)[:length] += np.rint(
+            np.bincount(requests, weights=sizes, minlength=length)).astype(np.int_)
+        if self.__index is not None:
+            resources = np.flatnonzero(batch_counts)
+            for (res, count, added) in zip(resources.tolist(), column[resources].tolist(),
+                                           batch_counts[resources].tolist()):
+                self.__index.move(res, count - added, count)
+
+    def merge(self, other, resources=None):
+        """Add the statistics of another ResourceStatistics, e.g. of another part of the
+        log file.
+        Args:
+            other(ResourceStatistics): the other ResourceStatistics.
+            resources(list): if the requests are IDs, resources[idx] is the ID in this
+                ResourceStatistics of the resource ID idx in other (utility.Vocabulary.merge).
+        """
+        # The index is built again when it is needed
+        self.__index = None
+        if self.__sketches is not None:
+            for (idx, sketch) in self.__sketches.items():
+                sketch.merge(other.__sketches[idx], resources)
+            return
+        if self.__names is None:
+            for (res, (count, bandwidth)) in other.__resource.iteritems():
+                status = self.__resource.get(res)
+                if status is not None:
+                    status[self.__COUNT] += count
+                    status[self.__BANDWIDTH] += bandwidth
+                else:
+                    self.__resource[res] = [count, bandwidth]
+            return
+
+        other_counts, other_bandwidths = other.__columns
+        ids = [idx for (idx, count) in enumerate(other_counts) if count > 0]
+        length = max([resources[idx] for idx in ids] or [-1]) + 1
+        if length > len(self.__columns[self.__COUNT]):
+            self.__grow(length)
+        counts, bandwidths = self.__columns
+        for idx in ids:
+            counts[resources[idx]] += other_counts[idx]
+            bandwidths[resources[idx]] += other_bandwidths[idx]
+
+    def __values(self, sort_method):
+        """
+        Get the values of all the resources recorded. The average sizes are computed here,
+        with numpy if it is installed.
+        Args:
+            sort_method: COUNT, SIZE or BANDWIDTH.
+        Returns:
+            keys(list or numpy.ndarray): the keys of the resources.
+            values(list or numpy.ndarray): the values of the resources.
+        """
+        if self.__names is not None:
+            counts, bandwidths = self.__columns
+            if np is not None:
+                counts = np.frombuffer(counts, dtype=np.int_)
+                keys = np.flatnonzero(counts)
+                (counts, bandwidths) = (counts[keys],
+                                        np.frombuffer(bandwidths, dtype=np.int_)[keys])
+            else:
+                keys = [key for (key, count) in enumerate(counts) if count > 0]
+                (counts, bandwidths) = ([counts[key] for key in keys],
+                                        [bandwidths[key] for key in keys])
+        else:
+            keys = self.__resource.keys()
+            statuses = [self.__resource[key] for key in keys]
+            counts = [status[self.__COUNT] for status in statuses]
+            bandwidths = [status[self.__BANDWIDTH] for status in statuses]
+        if sort_method == COUNT:
+            return keys, counts
+        elif sort_method == BANDWIDTH:
+            return keys, bandwidths
+        if np is not None:
+            return keys, np.asarray(bandwidths, dtype=np.float64) / np.asarray(counts)
+        return keys, [bandwidth / float(count) for (count, bandwidth) in zip(counts, bandwidths)]
 
     def bottom(self, number, sort_method):
         """
@@ -66,18 +260,21 @@ class ResourceStatistics(object):
             second item is the name of the resource.
         Raises:
             NotImplementedError: Error occurs when choosen feature is not COUNT,
-            SIZE, or BANDWIDTH.
+            SIZE, or BANDWIDTH, or when the resources are approximate (capacity).
         """
-        if sort_method == COUNT:
-            idx = self.__COUNT
-        elif sort_method == BANDWIDTH:
-            idx = self.__BANDWIDTH
-        elif sort_method == SIZE:
-            idx = self.__SIZE
-        else:
+        if sort_method not in (COUNT, SIZE, BANDWIDTH):
             raise NotImplementedError
-        keys, values = utility.nsmallest_dict(number, self.__resource, idx)
-        return zip(values, keys)
+        if self.__sketches is not None:
+            raise NotImplementedError("the least requested resources are not kept "
+                                      "with capacity")
+        if sort_method == COUNT:
+            bottom = self.__count_index().bottom(number, self.__tie())
+            return zip([count for (count, _) in bottom],
+                       self.__decode([key for (_, key) in bottom]))
+        keys, values = self.__values(sort_method)
+        names = None if self.__names is None else self.__names.names
+        keys, values = utility.nsmallest_array(number, values, keys, names)
+        return zip(values, self.__decode(keys))
 
     def top(self, number, sort_method):
         """
@@ -90,18 +287,85 @@ class ResourceStatistics(object):
             second item is the name of the resource.
         Raises:
             NotImplementedError: Error occurs when choosen feature is not COUNT,
-            SIZE, or BANDWIDTH.
+            SIZE, or BANDWIDTH, or is SIZE when the resources are approximate (capacity).
         """
         if sort_method == COUNT:
             idx = self.__COUNT
         elif sort_method == BANDWIDTH:
             idx = self.__BANDWIDTH
         elif sort_method == SIZE:
-            idx = self.__SIZE
+            idx = None
         else:
             raise NotImplementedError
-        keys, values = utility.nlargest_dict(number, self.__resource, idx)
-        return zip(values, keys)
+        if self.__sketches is not None:
+            if idx is None:
+                raise NotImplementedError("the sizes of the resources are not kept with capacity")
+            sketch = self.__sketches[idx]
+            # The ties are broken by the names, as with the CountIndex
+            top = sketch.top(number, sorted(sketch, key=self.__tie()))
+            return zip([value for (value, _, _) in top],
+                       self.__decode([key for (_, _, key) in top]))
+        if sort_method == COUNT:
+            top = self.__count_index().top(number, self.__tie())
+            return zip([count for (count, _) in top], self.__decode([key for (_, key) in top]))
+        keys, values = self.__values(sort_method)
+        names = None if self.__names is None else self.__names.names
+        keys, values = utility.nlargest_array(number, values, keys, names)
+        return zip(values, self.__decode(keys))
+
+    def __tie(self):
+        """
+        Get the sort key that breaks the ties by the resource names.
+        Returns:
+            tie(function): the name of a resource ID, None if the resources are the names.
+        """
+        return None if self.__names is None else self.__names.names.__getitem__
+
+    def __count_index(self):
+        """
+        Get the index of the counts, build it if there is none.
+        Returns:
+            index(CountIndex): the index of the resources by their counts.
+        """
+        if self.__index is None:
+            if self.__names is not None:
+                self.__index = utility.CountIndex(
+                    (res, count) for (res, count) in enumerate(self.__columns[self.__COUNT])
+                    if count > 0)
+            else:
+                self.__index = utility.CountIndex((res, status[self.__COUNT])
+                                                  for (res, status) in self.__resource.iteritems())
+        return self.__index
+
+    def error_bound(self, sort_method):
+        """
+        Get the most that a count or a bandwidth of the top resources is larger than the
+        true one.
+        Args:
+            sort_method: can only take values COUNT or BANDWIDTH.
+        Returns:
+            bound(int): 0 if the resources are not approximate (capacity), or not yet.
+        Raises:
+            NotImplementedError: Error occurs when choosen feature is not COUNT or BANDWIDTH.
+        """
+        if sort_method not in (COUNT, BANDWIDTH):
+            raise NotImplementedError
+        if self.__sketches is None:
+            return 0
+        idx = self.__COUNT if sort_method == COUNT else self.__BANDWIDTH
+        return self.__sketches[idx].min()
+
+    def __decode(self, keys):
+        """
+        Transform the keys of __resource into resource names.
+        Args:
+            keys(list): the keys of __resource.
+        Returns:
+            A list of resource names.
+        """
+        if self.__names is None:
+            return keys
+        return [self.__names.names[key] for key in keys]
 
 class TestResource(unittest.TestCase):
     def setUp(self):
@@ -139,7 +403,8 @@ class TestResource(unittest.TestCase):
             resources.update(entry)
         top = resources.top(2, COUNT)
         self.assertEqual(top[0], (3, "A"))
-        self.assertEqual(top[1], (2, "C"))
+        # B and C are tied, the ties are broken by the names
+        self.assertEqual(top[1], (2, "B"))
 
         top = resources.top(2, BANDWIDTH)
         self.assertEqual(top[0], (33, "E"))
@@ -149,5 +414,103 @@ class TestResource(unittest.TestCase):
         self.assertEqual(top[0], (33, "E"))
         self.assertEqual(top[1], (11.5, "B"))
 
+    def test_update_vocabulary(self):
+        names = utility.Vocabulary()
+        resources = ResourceStatistics(names)
+        for entry in self.data + [{"Request": "/", "Size": 100}]:
+            entry = dict(entry)
+            entry["Request"] = names[entry["Request"]]
+            resources.update(entry)
+        top = resources.top(2, BANDWIDTH)
+        self.assertEqual(top, [(33, "E"), (23, "B")])
+        bottom = resources.bottom(2, BANDWIDTH)
+        self.assertEqual(bottom, [(2, "D"), (2, "F")])
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_update_batch(self):
+        names = utility.Vocabulary()
+        lines = ['h - - [01/Jul/1995:00:00:01 -0400] "GET {0} HTTP/1.0" 200 {1}'.format(
+            entry["Request"], entry["Size"]) for entry in self.data + [{"Request": "/",
+                                                                       "Size": 100}]]
+        resources = ResourceStatistics(names)
+        resources.update_batch(read_entry.read_batch(lines[:4], utility.Vocabulary(), names))
+        resources.update_batch(read_entry.read_batch(lines[4:], utility.Vocabulary(), names))
+        top = resources.top(2, BANDWIDTH)
+        self.assertEqual(top, [(33, "E"), (23, "B")])
+        bottom = resources.bottom(2, SIZE)
+        self.assertEqual(bottom, [(5.0/3, "A"), (2.0, "C")])
+
+    def test_merge(self):
+        names = utility.Vocabulary()
+        resources = ResourceStatistics(names)
+        for entry in self.data[:4]:
+            resources.update({"Request": names[entry["Request"]], "Size": entry["Size"]})
+        other_names = utility.Vocabulary()
+        other = ResourceStatistics(other_names)
+        for entry in self.data[4:]:
+            other.update({"Request": other_names[entry["Request"]], "Size": entry["Size"]})
+        resources.merge(other, names.merge(other_names))
+        top = resources.top(2, BANDWIDTH)
+        self.assertEqual(top, [(33, "E"), (23, "B")])
+        bottom = resources.bottom(2, SIZE)
+        self.assertEqual(bottom, [(5.0/3, "A"), (2.0, "C")])
+
+    def test_capacity(self):
+        names = utility.Vocabulary()
+        resources = ResourceStatistics(names, capacity=10)
+        exact = ResourceStatistics(names)
+        for entry in self.data + [{"Request": "/", "Size": 100}]:
+            entry = {"Request": names[entry["Request"]], "Size": entry["Size"]}
+            resources.update(entry)
+            exact.update(entry)
+        self.assertEqual(resources.top(6, COUNT), exact.top(6, COUNT))
+        self.assertEqual(resources.top(6, BANDWIDTH), exact.top(6, BANDWIDTH))
+        self.assertEqual(resources.error_bound(BANDWIDTH), 0)
+        self.assertRaises(NotImplementedError, resources.top, 2, SIZE)
+        self.assertRaises(NotImplementedError, resources.bottom, 2, COUNT)
+
+        resources = ResourceStatistics(capacity=2)
+        for entry in self.data:
+            resources.update(entry)
+        self.assertEqual(resources.top(1, BANDWIDTH), [(44, "E")])
+        self.assertEqual(resources.error_bound(BANDWIDTH), 25)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_capacity_batch(self):
+        names = utility.Vocabulary()
+        lines = ['h - - [01/Jul/1995:00:00:01 -0400] "GET {0} HTTP/1.0" 200 {1}'.format(
+            entry["Request"], entry["Size"]) for entry in self.data]
+        resources = ResourceStatistics(names, capacity=10)
+        resources.update_batch(read_entry.read_batch(lines[:4], utility.Vocabulary(), names))
+        other_names = utility.Vocabulary()
+        other = ResourceStatistics(other_names, capacity=10)
+        other.update_batch(read_entry.read_batch(lines[4:], utility.Vocabulary(), other_names))
+        resources.merge(other, names.merge(other_names))
+        self.assertEqual(resources.top(2, BANDWIDTH), [(33, "E"), (23, "B")])
+        self.assertEqual(resources.top(1, COUNT), [(3, "A")])
+
+    def test_columns(self):
+        import random
+        random_state = random.Random(0)
+        entries = [{"Request": "/r{0}".format(int(300 * random_state.random() ** 2)),
+                    "Size": random_state.randint(0, 5)} for _ in range(3000)]
+        names = utility.Vocabulary()
+        resources = ResourceStatistics(names)
+        exact = ResourceStatistics()
+        for entry in entries:
+            exact.update(entry)
+            resources.update({"Request": names[entry["Request"]], "Size": entry["Size"]})
+        for sort_method in (COUNT, SIZE, BANDWIDTH):
+            self.assertEqual(resources.top(20, sort_method), exact.top(20, sort_method))
+            self.assertEqual(resources.bottom(20, sort_method), exact.bottom(20, sort_method))
+        self.assertEqual(len(resources.top(1000, SIZE)), len(names))
+
+    def test_update_record(self):
+        resources = ResourceStatistics()
+        for entry in self.data:
+            resources.update(read_entry.LogRecord.from_dict(entry))
+        top = resources.top(2, BANDWIDTH)
+        self.assertEqual(top, [(33, "E"), (23, "B")])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the classes that collect the timing, the throughput and the memory of a run of
+process_log.py.
+    RunStats:
+        Collect the time of the phases and of the analyzers, and write them into a JSON report.
+    Sampler:
+        Sample the memory, the number of lines read and the sizes of the large structures at a
+        fixed interval in a background thread, and write the time series into a CSV or JSON
+        file.
+For RunStats, the phases of the run (read, parse, aggregate, finalize, output) are timed as
+a whole. The parsing and the updates of each analyzer are timed for every batch in batch
+mode; when the lines are read one by one, only one line in RunStats.sample_every is timed,
+and the times are scaled to all the lines, so the timing costs little.
+Author: Yuan Huang
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict
+import utility
+
+# The number of lines read one by one for each timed line.
+SAMPLE_EVERY = 64
+
+# The number of seconds between the samples of a Sampler.
+SAMPLE_SECONDS = 1.0
+
+# The order of the phases in the report.
+PHASES = ("read", "parse", "aggregate", "finalize", "output")
+
+class Phase(object):
+    """
+    The context manager that adds the time of a block to a phase of RunStats.
+    """
+    def __init__(self, stats, name):
+        self.__stats = stats
+        self.__name = name
+        self.__start = None
+        self.__peak = None
+
+    def __enter__(self):
+        self.__start = time.time()
+        self.__peak = utility.peak_memory_usage()
+        return self
+
+    def __exit__(self, *args):
+        self.__stats.add_time(self.__name, time.time() - self.__start)
+        self.__stats.add_memory(self.__name, self.__peak)
+
+class RunStats(object):
+    """
+    The class that collects the numbers of lines, the time of the phases and of the analyzers,
+    and the memory of the phases.
+    Example: stats = RunStats()
+             with stats.phase("read"): ...
+             stats.write(path, lines, parse_errors)
+    Args:
+        sample_every(int): the number of lines read one by one for each timed line.
+    Public variables:
+        sample_every(int): see Args.
+    """
+    def __init__(self, sample_every=SAMPLE_EVERY):
+        self.sample_every = sample_every
+        self.__countdown = sample_every
+        # The number of lines read one by one, and how many of them are timed.
+        self.__single_lines = 0
+        self.__sampled_lines = 0
+        self.__seconds = {}
+        self.__memory = {}
+        self.__peak_growth = {}
+        self.__analyzers = OrderedDict()
+        self.__start = time.time()
+
+    def sample(self):
+        """
+        Count a line read one by one, and check if it should be timed.
+        Returns:
+            True if the line should be timed.
+        """
+        self.__single_lines += 1
+        self.__countdown -= 1
+        if self.__countdown > 0:
+            return False
+        self.__countdown = self.sample_every
+        self.__sampled_lines += 1
+        return True
+
+    def phase(self, name):
+        """
+        Get the context manager that times a phase.
+        Args:
+            name(str): the name of the phase.
+        Returns:
+            Phase object.
+        """
+        return Phase(self, name)
+
+    def add_time(self, name, seconds, sampled=False):
+        """
+        Add time to a phase.
+        Args:
+            name(str): the name of the phase.
+            seconds(float): the time.
+            sampled(bool): True if the time is of a sampled line, see RunStats.sample.
+        """
+        if sampled:
+            name = (name, "sampled")
+        self.__seconds[name] = self.__seconds.get(name, 0.0) + seconds
+
+    def add_analyzer_time(self, name, seconds, sampled=False):
+        """
+        Add time to the updates of an analyzer.
+        Args:
+            name(str): the name of the analyzer.
+            seconds(float): the time.
+            sampled(bool): True if the time is of a sampled line, see RunStats.sample.
+        """
+        self.add_time(("analyzer", name), seconds, sampled)
+        self.__analyzers[name] = True
+
+    def add_memory(self, name, start_peak=None):
+        """
+        Record the resident memory at the end of a phase, and how much the peak memory of
+        the process grew during the phase.
+        Args:
+            name(str): the name of the phase.
+            start_peak(float): the peak memory (utility.peak_memory_usage) at the start of
+                the phase, None if the growth is not known.
+        """
+        self.__memory[name] = utility.memory_usage()
+        peak = utility.peak_memory_usage()
+        if start_peak is not None and peak is not None:
+            self.__peak_growth[name] = self.__peak_growth.get(name, 0.0) + peak - start_peak
+
+    def __seconds_of(self, name):
+        """
+        Get the time of a phase or an analyzer, with the sampled time scaled to all the lines
+        read one by one.
+        Args:
+            name(str or tuple): the name of the phase, or ("analyzer", name).
+        Returns:
+            seconds(float): the time.
+        """
+        seconds = self.__seconds.get(name, 0.0)
+        if self.__sampled_lines > 0:
+            seconds += self.__seconds.get((name, "sampled"), 0.0) * \
+                       self.__single_lines / float(self.__sampled_lines)
+        return seconds
+
+    def report(self, lines, parse_errors):
+        """
+        Get the report of the run.
+        Args:
+            lines(int): the number of lines read.
+            parse_errors(int): the number of lines with format error.
+        Returns:
+            report(OrderedDict): the numbers of lines, the peak memory of the process, the
+                time, the throughput, the resident memory at the end and the growth of the
+                peak memory of each phase (None if the phase isn't measured on its own), and
+                the time of each analyzer under analyzer_seconds. The time of parse and
+                aggregate is part of the time of read, and is estimated from the sampled
+                lines if the lines are read one by one.
+        """
+        report = OrderedDict()
+        report["lines"] = lines
+        report["entries"] = lines - parse_errors
+        report["parse_errors"] = parse_errors
+        report["total_seconds"] = time.time() - self.__start
+        report["peak_memory_mb"] = utility.peak_memory_usage()
+        report["sampled"] = self.__sampled_lines > 0
+        phases = OrderedDict()
+        for name in PHASES:
+            if name not in self.__seconds and (name, "sampled") not in self.__seconds:
+                continue
+            seconds = self.__seconds_of(name)
+            phase = OrderedDict()
+            phase["seconds"] = seconds
+            if name in ("read", "parse", "aggregate"):
+                phase["lines_per_second"] = lines / seconds if seconds > 0 else None
+            phase["memory_mb"] = self.__memory.get(name)
+            phase["peak_memory_growth_mb"] = self.__peak_growth.get(name)
+            phases[name] = phase
+        report["phases"] = phases
+        analyzers = OrderedDict()
+        for name in self.__analyzers:
+            analyzers[name] = OrderedDict([("seconds", self.__seconds_of(("analyzer", name)))])
+        report["analyzer_seconds"] = analyzers
+        return report
+
+    def write(self, path, lines, parse_errors, **info):
+        """
+        Write the report into a JSON file.
+        Args:
+            path(str): the name of the file.
+            lines(int), parse_errors(int): see RunStats.report.
+            info: other items of the report, e.g. the name of the input file and the
+                selected analyzers.
+        """
+        report = OrderedDict(sorted(info.items()))
+        report.update(self.report(lines, parse_errors))
+        with open(path, "w") as writer:
+            json.dump(report, writer, indent=2)
+            writer.write("\n")
+
+class Sampler(object):
+    """
+    The class that samples the memory and the progress of a run in a background thread.
+    Each sample has the seconds since the start, the resident memory (utility.memory_usage),
+    the number of lines read, the lines read per second since the previous sample, and
+    the sizes of the structures (e.g. LogAnalysis.sizes).
+    Example: with Sampler(lambda: analysis.num_lines, analysis.sizes) as sampler: ...
+             sampler.write("memory.csv")
+    Args:
+        lines(function): the function that returns the number of lines read so far.
+        sizes(function): the function that returns a dictionary of the sizes, None if there
+            are no sizes.
+        interval(float): the number of seconds between the samples.
+    Public variables:
+        samples(list): the samples (OrderedDict) in order of time.
+    """
+    def __init__(self, lines, sizes=None, interval=SAMPLE_SECONDS):
+        self.__lines = lines
+        self.__sizes = sizes
+        self.__interval = interval
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__start = None
+        self.samples = []
+
+    def start(self):
+        """
+        Take the first sample, and start the background thread.
+        """
+        self.__start = time.time()
+        self.sample()
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread, and take the last sample.
+        """
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+            self.sample()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __run(self):
+        """
+        Take a sample every interval, until the sampler is stopped.
+        """
+        while not self.__stop.wait(self.__interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Take a sample.
+        Returns:
+            sample(OrderedDict): the sample, also added to samples.
+        """
+        now = time.time()
+        lines = self.__lines()
+        sample = OrderedDict()
+        sample["seconds"] = round(now - self.__start, 3)
+        sample["memory_mb"] = utility.memory_usage()
+        sample["lines"] = lines
+        sample["lines_per_second"] = None
+        if self.samples and now - self.__start > self.samples[-1]["seconds"]:
+            sample["lines_per_second"] = (lines - self.samples[-1]["lines"]) / \
+                                         (now - self.__start - self.samples[-1]["seconds"])
+        if self.__sizes is not None:
+            sample.update(self.__sizes())
+        self.samples.append(sample)
+        return sample
+
+    def write(self, path):
+        """
+        Write the samples into a CSV file if the name ends with .csv, or a JSON file.
+        Args:
+            path(str): the name of the file.
+        """
+        if not path.endswith(".csv"):
+            with open(path, "w") as writer:
+                json.dump(self.samples, writer, indent=2)
+                writer.write("\n")
+            return
+        # The sizes may appear later, e.g. after a checkpoint is loaded.
+        columns = []
+        for sample in self.samples:
+            columns.extend(key for key in sample if key not in columns)
+        with open(path, "wb" if sys.version_info[0] < 3 else "w") as writer:
+            csv_writer = csv.writer(writer)
+            csv_writer.writerow(columns)
+            for sample in self.samples:
+                csv_writer.writerow(["" if sample.get(key) is None else sample[key]
+                                     for key in columns])
+
+class TestRunStats(unittest.TestCase):
+    """
+    Unittest Class for collecting the statistics of a run.
+    """
+    def test_sample(self):
+        stats = RunStats(sample_every=4)
+        timed = [stats.sample() for _ in range(10)]
+        self.assertEqual(timed, [False, False, False, True] * 2 + [False, False])
+        for _ in range(2):
+            stats.add_analyzer_time("hosts", 1.0, sampled=True)
+        stats.add_time("parse", 0.5, sampled=True)
+        stats.add_time("parse", 3.0)
+        with stats.phase("read"):
+            pass
+        report = stats.report(10, 0)
+        self.assertEqual(report["analyzer_seconds"]["hosts"]["seconds"], 10.0)
+        self.assertEqual(report["phases"]["parse"]["seconds"], 3.0 + 2.5)
+        self.assertEqual(list(report["phases"]), ["read", "parse"])
+        # Only the phase timed as a block has its own memory
+        self.assertTrue(report["phases"]["read"]["peak_memory_growth_mb"] >= 0)
+        self.assertEqual(report["phases"]["parse"]["peak_memory_growth_mb"], None)
+        self.assertTrue(report["sampled"])
+
+    def test_write(self):
+        directory = tempfile.mkdtemp()
+        try:
+            stats = RunStats()
+            with stats.phase("output"):
+                pass
+            path = os.path.join(directory, "report.json")
+            stats.add_analyzer_time("hosts", 1.0)
+            stats.write(path, 3, 1, input_file="log.txt", analyzers=["hosts", "blocked"])
+            with open(path) as reader:
+                report = json.load(reader)
+            self.assertEqual(report["input_file"], "log.txt")
+            self.assertEqual(report["analyzers"], ["hosts", "blocked"])
+            self.assertEqual(report["analyzer_seconds"], {"hosts": {"seconds": 1.0}})
+            self.assertEqual(report["entries"], 2)
+            self.assertTrue("output" in report["phases"])
+            self.assertFalse(report["sampled"])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_sampler(self):
+        lines = [0]
+        sizes = lambda: OrderedDict([("distinct_hosts", lines[0] // 2)])
+        directory = tempfile.mkdtemp()
+        try:
+            with Sampler(lambda: lines[0], sizes, interval=0.01) as sampler:
+                for _ in range(5):
+                    lines[0] += 100
+                    time.sleep(0.01)
+            samples = sampler.samples
+            self.assertTrue(len(samples) >= 2)
+            self.assertEqual((samples[0]["lines"], samples[-1]["lines"]), (0, 500))
+            self.assertEqual(samples[-1]["distinct_hosts"], 250)
+            self.assertTrue(samples[-1]["memory_mb"] > 0)
+
+            path = os.path.join(directory, "memory.csv")
+            sampler.write(path)
+            with open(path) as reader:
+                rows = list(csv.reader(reader))
+            self.assertEqual(rows[0], ["seconds", "memory_mb", "lines", "lines_per_second",
+                                       "distinct_hosts"])
+            self.assertEqual(len(rows), len(samples) + 1)
+            sampler.write(os.path.join(directory, "memory.json"))
+            with open(os.path.join(directory, "memory.json")) as reader:
+                self.assertEqual(json.load(reader)[-1]["lines"], 500)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Provide the class to generate synthetic log files of any size, to measure how the analysis
+scales (see benchmark.py).
+The lines are in the same format as the NASA log in log_input/, in the order of time. The
+hosts and the resources are drawn from a Zipf distribution, so a few of them are much more
+active than the others, like in a real log. Some hosts fail to login a few times in a row
+(a burst), which makes them blocked. The same options and seed always give the same lines.
+Author: Yuan Huang
+"""
+
+import time
+import bisect
+import random
+import itertools
+import unittest
+import read_entry
+import log_analysis
+
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+          "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# 01/Jul/1995:00:00:00 -0400, the start of the NASA log.
+START_TIME = 804571200
+
+# The statuses of the requests that are not login, and their weights.
+STATUSES = ((200, 0.85), (304, 0.08), (302, 0.03), (404, 0.035), (500, 0.005))
+
+# The extensions of the resources, and their weights.
+EXTENSIONS = ((".html", 0.4), (".gif", 0.45), (".jpg", 0.1), (".txt", 0.05))
+
+def zipf_cumulative(size, skew):
+    """
+    Get the cumulative distribution of the Zipf distribution over the ranks 1..size.
+    Args:
+        size(int): the number of ranks.
+        skew(float): the exponent of the distribution, 0 for the uniform distribution.
+    Returns:
+        cumulative(list): the cumulative probabilities of the ranks.
+    """
+    cumulative = []
+    total = 0.0
+    for rank in range(1, size + 1):
+        total += rank ** -skew
+        cumulative.append(total)
+    return [weight / total for weight in cumulative]
+
+def format_time(epoch, offset=-4 * 3600):
+    """
+    Format the time of a line, e.g. "01/Jul/1995:00:00:01 -0400".
+    Args:
+        epoch(int): the time in epoch seconds.
+        offset(int): the time zone offset in seconds east from UTC.
+    Returns:
+        time(str): the formatted time.
+    """
+    local = time.gmtime(epoch + offset)
+    sign = "-" if offset < 0 else "+"
+    zone = "{0}{1:02d}{2:02d}".format(sign, abs(offset) // 3600, abs(offset) % 3600 // 60)
+    return "{0:02d}/{1}/{2}:{3:02d}:{4:02d}:{5:02d} {6}".format(
+        local.tm_mday, MONTHS[local.tm_mon - 1], local.tm_year,
+        local.tm_hour, local.tm_min, local.tm_sec, zone)
+
+class LogGenerator(object):
+    """
+    The class that generates the lines of a synthetic log file.
+    Example: generator = LogGenerator(hosts=10000, seed=1)
+             generator.write("log.txt", 1000000)
+    Args:
+        hosts(int): the number of distinct hosts.
+        resources(int): the number of distinct resources.
+        skew(float): the exponent of the Zipf distribution of the hosts and the resources.
+        span(int): the number of seconds from the first to the last line.
+        burst_rate(float): the probability that a line starts a burst of failed logins.
+        burst_size(int): the number of failed logins in a burst, the host also makes a
+            request after them that is blocked.
+        error_rate(float): the probability that a line is malformed.
+        start(int): the time of the first line in epoch seconds.
+        seed(int): the seed of the random numbers.
+    Public variables:
+        All the Args.
+    """
+    def __init__(self, hosts=10000, resources=2000, skew=1.1, span=30 * 24 * 3600,
+                 burst_rate=0.0005, burst_size=3, error_rate=0.0, start=START_TIME, seed=0):
+        self.hosts = hosts
+        self.resources = resources
+        self.skew = skew
+        self.span = span
+        self.burst_rate = burst_rate
+        self.burst_size = burst_size
+        self.error_rate = error_rate
+        self.start = start
+        self.seed = seed
+
+        random_state = random.Random(seed)
+        self.__host_names = [self.__host_name(random_state, idx) for idx in range(hosts)]
+        self.__resource_names = [self.__resource_name(random_state, idx)
+                                 for idx in range(resources)]
+        # The ranks of the Zipf distribution are not in the order of the names.
+        random_state.shuffle(self.__host_names)
+        random_state.shuffle(self.__resource_names)
+        self.__host_weights = zipf_cumulative(hosts, skew)
+        self.__resource_weights = zipf_cumulative(resources, skew)
+        self.__statuses = self.__cumulative(STATUSES)
+
+    @staticmethod
+    def __cumulative(choices):
+        """
+        Get the cumulative weights of the weighted choices.
+        Args:
+            choices(tuple): the (value, weight) pairs.
+        Returns:
+            (values, cumulative): the values and their cumulative weights.
+        """
+        (values, cumulative) = ([], [])
+        total = sum(weight for (_, weight) in choices)
+        running = 0.0
+        for (value, weight) in choices:
+            running += weight
+            values.append(value)
+            cumulative.append(running / total)
+        return (values, cumulative)
+
+    @staticmethod
+    def __host_name(random_state, idx):
+        """
+        Make the name of a host, an IP address or a domain name.
+        Args:
+            random_state(random.Random): the random numbers.
+            idx(int): the index of the host, which makes the name unique.
+        Returns:
+            name(str): the name of the host.
+        """
+        if random_state.random() < 0.4:
+            return "{0}.{1}.{2}.{3}".format(random_state.randint(1, 223), idx // 65536 % 256,
+                                            idx // 256 % 256, idx % 256)
+        return "host{0}.{1}.{2}".format(idx, random_state.choice(("net", "com", "edu")),
+                                         random_state.choice(("us", "uk", "de", "jp", "org")))
+
+    def __resource_name(self, random_state, idx):
+        """
+        Make the path of a resource.
+        Args:
+            random_state(random.Random): the random numbers.
+            idx(int): the index of the resource, which makes the path unique.
+        Returns:
+            path(str): the path of the resource.
+        """
+        if idx == 0:
+            return "/"
+        (extensions, cumulative) = self.__cumulative(EXTENSIONS)
+        extension = extensions[bisect.bisect(cumulative, random_state.random())]
+        depth = random_state.randint(0, 3)
+        directories = "".join("/dir{0}".format(random_state.randint(0, 9)) for _ in range(depth))
+        return "{0}/file{1}{2}".format(directories, idx, extension)
+
+    @staticmethod
+    def __line(host, when, method, resource, status, size):
+        """
+        Format a line of the log file.
+        Args:
+            host(str), when(str), method(str), resource(str), status(int), size(int or str):
+                the fields of the line.
+        Returns:
+            line(str): the line with the new line character.
+        """
+        return '{0} - - [{1}] "{2} {3} HTTP/1.0" {4} {5}\n'.format(
+            host, when, method, resource, status, size)
+
+    def lines(self, count):
+        """
+        Generate the lines of the log file in the order of time.
+        Args:
+            count(int): the number of lines.
+        Returns:
+            A generator of the lines.
+        """
+        random_state = random.Random(self.seed + 1)
+        uniform = random_state.random
+        (statuses, status_weights) = self.__statuses
+        (last_second, when) = (None, None)
+        burst = []
+        # The indices are counted lazily, a list of 100 million indices doesn't fit in memory.
+        for idx in itertools.islice(itertools.count(), count):
+            second = self.start + (self.span * idx // count if count > 0 else 0)
+            if second != last_second:
+                (last_second, when) = (second, format_time(second))
+
+            if burst:
+                yield burst.pop()
+                continue
+            if uniform() < self.error_rate:
+                yield "{0} - - [{1}] malformed request\n".format(
+                    self.__host_names[bisect.bisect(self.__host_weights, uniform())], when)
+                continue
+
+            host = self.__host_names[bisect.bisect(self.__host_weights, uniform())]
+            if uniform() < self.burst_rate:
+                # The host fails to login in a row, and then tries another resource; the
+                # lines are popped from the end.
+                resource = self.__resource_names[bisect.bisect(self.__resource_weights,
+                                                               uniform())]
+                burst.append(self.__line(host, when, "GET", resource, 200,
+                                         random_state.randint(100, 50000)))
+                for _ in range(self.burst_size - 1):
+                    burst.append(self.__line(host, when, "POST", "/login", 401, "-"))
+                yield self.__line(host, when, "POST", "/login", 401, "-")
+                continue
+            if uniform() < 0.002:
+                yield self.__line(host, when, "POST", "/login", 200, "-")
+                continue
+
+            resource = self.__resource_names[bisect.bisect(self.__resource_weights, uniform())]
+            status = statuses[bisect.bisect(status_weights, uniform())]
+            size = random_state.randint(100, 50000) if status == 200 else \
+                   "-" if status == 304 else 0
+            yield self.__line(host, when, "GET", resource, status, size)
+
+    def write(self, path, count):
+        """
+        Write a synthetic log file.
+        Args:
+            path(str): the name of the file.
+            count(int): the number of lines.
+        """
+        with open(path, "w") as writer:
+            writer.writelines(self.lines(count))
+
+class TestLogGenerator(unittest.TestCase):
+    """
+    Unittest Class for generating synthetic log files.
+    """
+    def test_format_time(self):
+        self.assertEqual(format_time(START_TIME + 1), "01/Jul/1995:00:00:01 -0400")
+        self.assertEqual(format_time(0, 0), "01/Jan/1970:00:00:00 +0000")
+
+    def test_zipf(self):
+        cumulative = zipf_cumulative(3, 1.0)
+        self.assertAlmostEqual(cumulative[0], 6.0 / 11)
+        self.assertAlmostEqual(cumulative[-1], 1.0)
+        self.assertAlmostEqual(zipf_cumulative(4, 0.0)[1], 0.5)
+
+    def test_lines(self):
+        generator = LogGenerator(hosts=50, resources=30, span=3600, burst_rate=0.01,
+                                 error_rate=0.01, seed=3)
+        lines = list(generator.lines(5000))
+        self.assertEqual(lines, list(LogGenerator(hosts=50, resources=30, span=3600,
+                                                  burst_rate=0.01, error_rate=0.01,
+                                                  seed=3).lines(5000)))
+        self.assertNotEqual(lines, list(LogGenerator(hosts=50, resources=30, span=3600,
+                                                     seed=4).lines(5000)))
+        self.assertEqual(len(lines), 5000)
+
+        (hosts, times, errors) = (set(), [], 0)
+        for line in lines:
+            try:
+                entry = read_entry.read_entry(line, epoch=True)
+            except TypeError:
+                errors += 1
+                continue
+            hosts.add(entry["Host"])
+            times.append(entry["Time"])
+        self.assertTrue(0 < errors < 150)
+        self.assertTrue(len(hosts) <= 50)
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(times[0], START_TIME)
+        self.assertTrue(times[-1] < START_TIME + 3600)
+
+        analysis = log_analysis.LogAnalysis()
+        for line in lines:
+            analysis.update(line)
+        self.assertTrue(len(analysis.blocked_entries) > 0)
+        self.assertEqual(len(analysis.errors), errors)
+
+if __name__ == '__main__':
+    unittest.main()
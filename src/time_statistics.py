@@ -7,15 +7,29 @@ Author: Yuan Huang
 """
 import unittest
 import datetime as dt
+import calendar
 import time
 import utility
+import read_entry
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class TimeStatistics(object):
     """
     The class that keep track of the time window with a fixed period with highest
     number of activities.
+    Args:
+        epoch(bool): True if the "Time" of the entries is in integer epoch seconds
+            (read_entry.read_entry(line, epoch=True)), False if it is a datetime object.
+        host_ids(bool): True if the hosts of the entries are integer IDs
+            (read_entry.read_entry(line, hosts=...)). The hosts on each day and hour are
+            then kept in bit sets instead of sets.
     """
-    def __init__(self):
+    # The ordinal of the date 1970-01-01.
+    __EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+    def __init__(self, epoch=False, host_ids=False):
         """
         Private variables:
             __daily_hits(dict): A dictionary with date as key and the number of events on
@@ -26,44 +40,153 @@ class TimeStatistics(object):
             __hourly_hits(dict): Hour(int) as key, and number of events as value.
             __hourly_hosts(dict): Hour(int) as key, and a set of host names as value.
 
+            __dates(dict): In epoch mode, the number of days since 1970-01-01 as key, and the
+                date object as value.
         """
+        self.__epoch = epoch
+        if host_ids:
+            self.__host_set = utility.BitSet
+        else:
+            self.__host_set = set
+        self.__dates = {}
         self.__daily_hits = {}
         self.__daily_hosts = {}
         self.__hourly_hits = {}
         self.__hourly_hosts = {}
 
+    def __date(self, day):
+        """
+        Get the date object of a day in epoch mode.
+        Args:
+            day(int): the number of days since 1970-01-01.
+        Returns:
+            date object.
+        """
+        date = self.__dates.get(day)
+        if date is None:
+            date = dt.date.fromordinal(self.__EPOCH_ORDINAL + day)
+            self.__dates[day] = date
+        return date
+
     def __update_daily_statistics(self, entry):
         """
         Given a new entry, add it to the daily statistics
         """
-        date = entry["Time"].date()
+        if self.__epoch:
+            date = self.__date((entry[read_entry.TIME] + entry[read_entry.OFFSET]) // 86400)
+        else:
+            date = entry[read_entry.TIME].date()
         if date not in self.__daily_hits:
             self.__daily_hits[date] =  0
-            self.__daily_hosts[date] = set()
+            self.__daily_hosts[date] = self.__host_set()
         self.__daily_hits[date] += 1
-        self.__daily_hosts[date].add(entry["Host"])
+        self.__daily_hosts[date].add(entry[read_entry.HOST])
 
     def __update_hourly_statistics(self, entry):
         """
         Given a new entry, add it to the hourly statistics
         """
-        hour = entry["Time"].hour
+        if self.__epoch:
+            hour = (entry[read_entry.TIME] + entry[read_entry.OFFSET]) // 3600 % 24
+        else:
+            hour = entry[read_entry.TIME].hour
         if hour not in self.__hourly_hits:
             self.__hourly_hits[hour] =  0
-            self.__hourly_hosts[hour] = set()
+            self.__hourly_hosts[hour] = self.__host_set()
         self.__hourly_hits[hour] += 1
-        self.__hourly_hosts[hour].add(entry["Host"])
+        self.__hourly_hosts[hour].add(entry[read_entry.HOST])
 
     def update(self, entry):
         """
         Given a new entry, update the current time window's queue and update the __top_overlap
         list and __top_no_overlap list.
         Args:
-            entry(dict): the new log dictionary.
+            entry(LogRecord or dict): the new log record.
         """
+        if isinstance(entry, dict):
+            entry = read_entry.LogRecord.from_dict(entry)
         self.__update_daily_statistics(entry)
         self.__update_hourly_statistics(entry)
 
+    def update_batch(self, batch):
+        """
+        Given a LogBatch, update the daily and hourly statistics. The hits and hosts of each
+        day and hour are counted with numpy if the TimeStatistics is in epoch mode and
+        the hosts are IDs.
+        Args:
+            batch(LogBatch): the batch of log items.
+        """
+        if not self.__epoch or self.__host_set is not utility.BitSet:
+            for idx in range(len(batch)):
+                self.update(batch.record(idx))
+            return
+        if len(batch) == 0:
+            return
+
+        local = batch.time + batch.offset
+        for (day, hits, hosts) in self.__group_batch(local // 86400, batch.host):
+            date = self.__date(day)
+            if date not in self.__daily_hits:
+                self.__daily_hits[date] = 0
+                self.__daily_hosts[date] = self.__host_set()
+            self.__daily_hits[date] += hits
+            self.__daily_hosts[date].add_array(hosts)
+
+        for (hour, hits, hosts) in self.__group_batch(local // 3600 % 24, batch.host):
+            if hour not in self.__hourly_hits:
+                self.__hourly_hits[hour] = 0
+                self.__hourly_hosts[hour] = self.__host_set()
+            self.__hourly_hits[hour] += hits
+            self.__hourly_hosts[hour].add_array(hosts)
+
+    def merge(self, other, hosts=None):
+        """
+        Add the statistics of another TimeStatistics, e.g. of another part of the log file.
+        The new days and hours are added in ascending order, which is the order they are
+        added when the log file in time order is read by one TimeStatistics.
+        Args:
+            other(TimeStatistics): the other TimeStatistics.
+            hosts(list): if the hosts are IDs, hosts[idx] is the ID in this TimeStatistics of
+                the host ID idx in other (utility.Vocabulary.merge).
+        """
+        for (hits, other_hits, host_sets, other_host_sets) in (
+                (self.__daily_hits, other.__daily_hits, self.__daily_hosts, other.__daily_hosts),
+                (self.__hourly_hits, other.__hourly_hits, self.__hourly_hosts,
+                 other.__hourly_hosts)):
+            for key in sorted(other_hits):
+                if key not in hits:
+                    hits[key] = 0
+                    host_sets[key] = self.__host_set()
+                hits[key] += other_hits[key]
+                host_set = host_sets[key]
+                if hosts is None:
+                    for host in other_host_sets[key]:
+                        host_set.add(host)
+                else:
+                    for host in other_host_sets[key]:
+                        host_set.add(hosts[host])
+
+    @staticmethod
+    def __group_batch(keys, hosts):
+        """
+        Group the hosts in a batch by keys.
+        Args:
+            keys(numpy.ndarray): the key (day or hour) of each line.
+            hosts(numpy.ndarray): the host ID of each line.
+        Returns:
+            A list of (key, number of lines, array of hosts), in the order that the keys
+            first appear in the batch.
+        """
+        uniques, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        order = np.argsort(inverse, kind="mergesort")
+        counts = np.bincount(inverse)
+        ends = np.cumsum(counts)
+        groups = []
+        for idx in np.argsort(first).tolist():
+            groups.append((int(uniques[idx]), int(counts[idx]),
+                           hosts[order[ends[idx]-counts[idx]:ends[idx]]]))
+        return groups
+
     def get_daily_hosts(self):
         """
         Return the statistics for the number of hosts on each day
@@ -165,5 +288,67 @@ class TestTimeStatistics(unittest.TestCase):
         users_per_day = time_stat.get_daily_hosts()
         self.assertEquals(users_per_day[0], [2, "01/Jul/1995"])
 
+    def test_merge(self):
+        names = utility.Vocabulary()
+        time_stat = TimeStatistics(host_ids=True)
+        for entry in self.data[:3]:
+            time_stat.update(dict(entry, Host=names[entry["Host"]]))
+        other_names = utility.Vocabulary()
+        other = TimeStatistics(host_ids=True)
+        for entry in self.data[3:]:
+            other.update(dict(entry, Host=other_names[entry["Host"]]))
+        time_stat.merge(other, names.merge(other_names))
+
+        self.assertEquals(time_stat.get_hourly_hits()[1], [3, "01:00:00"])
+        self.assertEquals(time_stat.get_hourly_hosts()[1], [2, "01:00:00"])
+        self.assertEquals(time_stat.get_daily_hits()[0], [11, "01/Jul/1995"])
+        self.assertEquals(time_stat.get_daily_hosts()[0], [2, "01/Jul/1995"])
+
+    def test_update_top_epoch(self):
+        time_stat = TimeStatistics(epoch=True)
+        for entry in self.data:
+            entry = dict(entry)
+            entry["Time"] = calendar.timegm(entry["Time"].timetuple()) + 4*60*60
+            entry["Offset"] = -4*60*60
+            time_stat.update(read_entry.LogRecord.from_dict(entry))
+
+        hits_per_hour = time_stat.get_hourly_hits()
+        self.assertEquals(hits_per_hour[0], [1, "00:00:00"])
+        self.assertEquals(hits_per_hour[1], [3, "01:00:00"])
+
+        users_per_hour = time_stat.get_hourly_hosts()
+        self.assertEquals(users_per_hour[1], [2, "01:00:00"])
+
+        hits_per_day = time_stat.get_daily_hits()
+        self.assertEquals(hits_per_day[0], [11, "01/Jul/1995"])
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_update_batch(self):
+        names = utility.Vocabulary()
+        lines = ['{0} - - [{1} -0400] "GET / HTTP/1.0" 200 0'.format(
+            entry["Host"], entry["Time"].strftime("%d/%b/%Y:%H:%M:%S")) for entry in self.data]
+        time_stat = TimeStatistics(epoch=True, host_ids=True)
+        time_stat.update_batch(read_entry.read_batch(lines[:3], names, utility.Vocabulary()))
+        time_stat.update_batch(read_entry.read_batch(lines[3:], names, utility.Vocabulary()))
+
+        self.assertEquals(time_stat.get_hourly_hits()[1], [3, "01:00:00"])
+        self.assertEquals(time_stat.get_hourly_hosts()[1], [2, "01:00:00"])
+        self.assertEquals(time_stat.get_daily_hits()[0], [11, "01/Jul/1995"])
+        self.assertEquals(time_stat.get_daily_hosts()[0], [2, "01/Jul/1995"])
+
+    def test_update_host_ids(self):
+        time_stat = TimeStatistics(host_ids=True)
+        for entry in self.data:
+            entry = dict(entry)
+            entry["Host"] = ord(entry["Host"]) * 100
+            time_stat.update(entry)
+
+        users_per_hour = time_stat.get_hourly_hosts()
+        self.assertEquals(users_per_hour[0], [1, "00:00:00"])
+        self.assertEquals(users_per_hour[1], [2, "01:00:00"])
+
+        users_per_day = time_stat.get_daily_hosts()
+        self.assertEquals(users_per_day[0], [2, "01/Jul/1995"])
+
 if __name__ == '__main__':
     unittest.main()
@@ -5,12 +5,22 @@ Provide the class to keep track of the number of activities in a fixed
 time window, and get the top n busiest periods that have the most activities.
 Author: Yuan Huang
 """
+import copy
 import unittest
 import datetime as dt
+import calendar
 import time
 from collections import deque
 import heapq
+import bisect
+import array
+import random
 import utility
+import read_entry
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class TimeWindow(object):
     """
@@ -19,13 +29,27 @@ class TimeWindow(object):
     Args:
         hours(float): the length of time window in unit of hours
         n_top(int): the number of time windows with most activities
+        epoch(bool): True if the "Time" of the entries is in integer epoch seconds
+            (read_entry.read_entry(line, epoch=True)), False if it is a datetime object.
+        mergeable(bool): True if the TimeWindow only records the times of the entries, so
+            that it can be merged in order into another TimeWindow (TimeWindow.merge), e.g.
+            when the parts of a log file are read in parallel. It needs epoch=True.
+        histogram(bool): True if the entries in the current time window are kept as the
+            number of entries in each second (a ring buffer of one count for each second of
+            the window), instead of the time of each entry, so the memory doesn't grow with
+            the number of entries in the window. It needs epoch=True. When an entry is
+            earlier than the one before it, the times of the entries in the window are kept
+            as without histogram until the times in the window are in order again, so the
+            results are always the same.
     Public variables:
         time_window(timedelta): the length of the time window
         n_top(int): the number of top time periods to keep track on
     """
     # Names for the indices of the list in TimeWindow.__top_overlap and TimeWindow.__top_no_overlap.
     (__COUNT, __TIME) = (0, 1)
-    def __init__(self, hours=1, n_top=10):
+    # The number of recorded times replayed at once by TimeWindow.merge.
+    __MERGE_SIZE = 1 << 16
+    def __init__(self, hours=1, n_top=10, epoch=False, mergeable=False, histogram=False):
         """
         Private variables:
             __queue(deque): a queue stores the time of each activity in the current time window
@@ -36,11 +60,47 @@ class TimeWindow(object):
             __pending_data(list): the list of length 2 with indices name __COUNT and __TIME
             __is_pending(boolean): True if there is a pending data that has not yet been pushed
                 to the heap.
+            __offset_times(list), __offsets(list): in epoch mode, the times at which the time
+                zone offset of the entries changes, and the new offsets.
+            __times(array), __counts(array): if mergeable, the distinct times of consecutive
+                entries in the order of the entries, and the number of entries at each time.
+            __seconds(deque), __ring(array), __total(int): in histogram mode, the distinct
+                seconds of the entries in the current time window, the number of entries at
+                each second by the second modulo the window length, and their sum. Only the
+                seconds in __seconds are the starting times of time windows.
+            __use_histogram(bool), __histogram(bool): True if the histogram is asked for, and
+                if it is in use, i.e. unless an entry earlier than the one before it is in
+                the current time window.
+            __descents(int): the number of the entries in __queue that are earlier than the
+                one before them.
+        Raises:
+            NotImplementedError: Error occurs when mergeable or histogram is True and epoch
+                is False.
         """
-        self.__time_window = dt.timedelta(hours=hours)
+        if mergeable and not epoch:
+            raise NotImplementedError("mergeable TimeWindow needs epoch=True")
+        if histogram and not epoch:
+            raise NotImplementedError("histogram TimeWindow needs epoch=True")
+        self.__epoch = epoch
+        self.__mergeable = mergeable
+        # A mergeable TimeWindow only records the times, the histogram is of no use to it.
+        self.__use_histogram = histogram and not mergeable
+        self.__histogram = self.__use_histogram
+        self.__times = array.array('l')
+        self.__counts = array.array('l')
+        if epoch:
+            self.__time_window = int(round(hours*60*60))
+        else:
+            self.__time_window = dt.timedelta(hours=hours)
+        self.__offset_times = []
+        self.__offsets = []
         self.__n_top = n_top
 
         self.__queue = deque()
+        self.__descents = 0
+        self.__seconds = deque()
+        self.__ring = array.array('l', [0]) * (self.__time_window if self.__histogram else 0)
+        self.__total = 0
 
         self.__top_overlap = utility.Heap(self.__n_top) 
 
@@ -49,21 +109,21 @@ class TimeWindow(object):
 
         self.__top_no_overlap = utility.Heap(self.__n_top)
 
-    def __shift_time_window(self, entry):
+    def __shift_time_window(self, time):
         """
-        Given a new entry, push it into the queue of the current window and pop
+        Given the time of a new entry, push it into the queue of the current window and pop
         the earlier posts that is no longer in the window. Returns a list of completed
         time windows with its number of logs and starting time.
         Args:
-            entry(dict): the new log dictionary.
+            time(datetime or int): the time of the new log record.
         Returns:
             datalist(list): A list of length-2 lists, e.g. [number, time]. number(int) is number
             of logs in a last time window; time(datetime) is the starting
             time of a time window.
         """
-        time = entry["Time"]
-
         # Push the new event into the queue
+        if self.__queue and time < self.__queue[-1]:
+            self.__descents += 1
         self.__queue.append(time)
 
         datalist = []
@@ -76,6 +136,8 @@ class TimeWindow(object):
                 # smaller than the time window
                 while len(self.__queue) > 1 and self.__queue[0] <= time-self.__time_window:
                     head = self.__queue.popleft()
+                    if self.__queue[0] < head:
+                        self.__descents -= 1
                     # Append the number and starting time to the return list
                     if head != self.__queue[0]:
                         datalist.append([len(self.__queue) + n_same_time, head])
@@ -84,6 +146,96 @@ class TimeWindow(object):
                         n_same_time += 1
         return datalist
 
+    def __shift_histogram(self, time, count):
+        """
+        In histogram mode, given the time of some new entries, add them into the count of their
+        second and pop the earlier seconds that are no longer in the window. Returns a list
+        of completed time windows as __shift_time_window.
+        Args:
+            time(int): the time of the new log records in epoch seconds.
+            count(int): the number of the new log records.
+        Returns:
+            datalist(list): A list of length-2 lists [number, time], see __shift_time_window.
+        """
+        seconds = self.__seconds
+        ring = self.__ring
+        window = self.__time_window
+        if seconds and time < seconds[-1]:
+            # The windows starting at the seconds between an entry earlier than the one before
+            # it can't be told from the counts, so the times are kept until it leaves the
+            # window.
+            self.__leave_histogram()
+            return self.__shift(time, count)
+        if seconds and time == seconds[-1]:
+            # The same second as the entry before, no time window is completed.
+            ring[time % window] += count
+            self.__total += count
+            return []
+
+        # The entries of the current window are all earlier than the end of the window
+        # starting at each of its seconds, so the number of entries in that window is the
+        # sum of the counts from the second on.
+        datalist = []
+        while seconds and seconds[0] <= time - window:
+            head = seconds.popleft()
+            datalist.append([self.__total, head])
+            self.__total -= ring[head % window]
+            ring[head % window] = 0
+        seconds.append(time)
+        ring[time % window] += count
+        self.__total += count
+        return datalist
+
+    def __shift(self, time, count):
+        """
+        Given the time of some new entries, shift the time window in histogram mode if it is
+        in use, or else with the queue, and return to histogram mode when it is asked for
+        and the times in the queue are in order again.
+        Args:
+            time(int): the time of the new log records in epoch seconds.
+            count(int): the number of the new log records.
+        Returns:
+            datalist(list): A list of length-2 lists [number, time], see __shift_time_window.
+        """
+        if self.__histogram:
+            return self.__shift_histogram(time, count)
+        datalist = []
+        for _ in range(count):
+            datalist.extend(self.__shift_time_window(time))
+        if self.__use_histogram and self.__descents == 0:
+            self.__enter_histogram()
+        return datalist
+
+    def __leave_histogram(self):
+        """
+        Leave histogram mode: the entries of the current time window are put in the queue,
+        one time for each entry, and the time windows are shifted as without histogram
+        until the times in the queue are in order again (TimeWindow.__shift).
+        """
+        window = self.__time_window
+        self.__queue = deque(second for second in self.__seconds
+                             for _ in range(self.__ring[second % window]))
+        self.__descents = 0
+        self.__histogram = False
+        self.__seconds = deque()
+        self.__ring = array.array('l')
+        self.__total = 0
+
+    def __enter_histogram(self):
+        """
+        Return to histogram mode: the times in the queue, which are in order and span less
+        than the window, are counted by second.
+        """
+        window = self.__time_window
+        self.__ring = array.array('l', [0]) * window
+        for time in self.__queue:
+            if not self.__seconds or time != self.__seconds[-1]:
+                self.__seconds.append(time)
+            self.__ring[time % window] += 1
+        self.__total = len(self.__queue)
+        self.__queue = deque()
+        self.__histogram = True
+
     def __update_top_allow_overlap(self, number, time):
         """
         Given the number of logs and starting time of the current time window,
@@ -139,23 +291,231 @@ class TimeWindow(object):
         Given a new entry, update the current time window's queue and update the __top_overlap
         heap and __top_no_overlap heap.
         Args:
-            entry(dict): the new log dictionary.
+            entry(LogRecord or dict): the new log record.
         """
-        window_list  = self.__shift_time_window(entry)
+        if isinstance(entry, dict):
+            entry = read_entry.LogRecord.from_dict(entry)
+        if self.__epoch:
+            self.__update_offset(entry[read_entry.TIME], entry[read_entry.OFFSET])
+        if self.__mergeable:
+            self.__record(entry[read_entry.TIME], 1)
+            return
+        if self.__use_histogram:
+            window_list = self.__shift(entry[read_entry.TIME], 1)
+        else:
+            window_list = self.__shift_time_window(entry[read_entry.TIME])
         for (number, time) in window_list:
             self.__update_top_allow_overlap(number, time)
             self.__update_top_without_overlap(number, time)
 
-    def finalize(self, entry):
+    def __update_offset(self, time, offset):
+        """
+        In epoch mode, record the time zone offset if it changes.
+        Args:
+            time(int): the time of the entry in epoch seconds.
+            offset(int): the time zone offset of the entry.
+        """
+        if not self.__offsets or offset != self.__offsets[-1]:
+            self.__offset_times.append(time)
+            self.__offsets.append(offset)
+
+    def __record(self, time, count):
+        """
+        In mergeable mode, record a number of consecutive entries at a time.
+        Args:
+            time(int): the time of the entries in epoch seconds.
+            count(int): the number of entries.
+        """
+        if self.__times and self.__times[-1] == time:
+            self.__counts[-1] += count
+        else:
+            self.__times.append(time)
+            self.__counts.append(count)
+
+    def update_batch(self, batch):
+        """
+        Given a LogBatch, update the current time window's queue and the top heaps. If the
+        TimeWindow is in epoch mode and the times are in ascending order, the completed time
+        windows and their numbers of logs are found with numpy, and only the completed
+        windows are pushed to the heaps one by one.
+        Args:
+            batch(LogBatch): the batch of log items.
+        """
+        if len(batch) == 0:
+            return
+        if not self.__epoch:
+            for idx in range(len(batch)):
+                self.update(batch.record(idx))
+            return
+
+        changes = np.flatnonzero(batch.offset[1:] != batch.offset[:-1]) + 1
+        for idx in [0] + changes.tolist():
+            self.__update_offset(int(batch.time[idx]), int(batch.offset[idx]))
+
+        if self.__mergeable:
+            starts = np.flatnonzero(np.concatenate(([True], batch.time[1:] != batch.time[:-1])))
+            counts = np.diff(np.append(starts, len(batch)))
+            self.__record(int(batch.time[0]), int(counts[0]))
+            self.__times.extend(batch.time[starts[1:]].tolist())
+            self.__counts.extend(counts[1:].tolist())
+            return
+        if self.__histogram:
+            self.__update_histogram(batch.time, np.ones(len(batch), dtype=np.int64))
+            return
+        self.__update_times(batch.time)
+
+    def __update_histogram(self, new_times, new_counts):
+        """
+        In histogram mode, update the counts of the seconds and the top heaps with the times
+        of new entries. The seconds of the current window and the new seconds are put in
+        one array, so the number of entries in each completed time window is found with numpy
+        from the cumulative counts, and only the completed windows are pushed to the heaps
+        one by one.
+        Args:
+            new_times(numpy.ndarray): the times of the entries in epoch seconds, in the
+                order of the entries.
+            new_counts(numpy.ndarray): the number of entries at each time.
+        """
+        window = self.__time_window
+        old_times = np.fromiter(self.__seconds, np.int64, len(self.__seconds))
+        times = np.concatenate((old_times, new_times))
+        if np.any(times[1:] < times[:-1]):
+            # An entry is earlier than the one before it, see TimeWindow.__shift_histogram
+            self.__leave_histogram()
+            self.__update_times(np.repeat(new_times, new_counts))
+            return
+        ring = np.frombuffer(self.__ring, dtype=np.int_)
+        counts = np.concatenate((ring[old_times % window], new_counts))
+        first = np.flatnonzero(np.concatenate(([True], times[1:] != times[:-1])))
+        (seconds, counts) = (times[first], np.add.reduceat(counts, first))
+
+        # The number of entries in the time window starting at each completed second
+        sums = np.concatenate(([0], np.cumsum(counts)))
+        last = seconds[-1]
+        completed = np.searchsorted(seconds, last - window, side="right")
+        ends = np.searchsorted(seconds, seconds[:completed] + window)
+        numbers = sums[ends] - sums[:completed]
+        for (number, time) in zip(numbers.tolist(), seconds[:completed].tolist()):
+            self.__update_top_allow_overlap(number, time)
+            self.__update_top_without_overlap(number, time)
+
+        # Keep the seconds in the current time window
+        ring[old_times % window] = 0
+        ring[seconds[completed:] % window] = counts[completed:]
+        self.__total = int(counts[completed:].sum())
+        self.__seconds = deque(seconds[completed:].tolist())
+
+    def __update_times(self, new_times):
+        """
+        In epoch mode, update the current time window's queue and the top heaps with the times
+        of new entries.
+        Args:
+            new_times(numpy.ndarray): the times of the entries in epoch seconds, in the
+                order of the entries.
+        """
+        times = np.concatenate((np.fromiter(self.__queue, np.int64, len(self.__queue)),
+                                new_times))
+        if np.any(times[1:] < times[:-1]):
+            # Histogram mode may be returned to at any entry, see TimeWindow.__shift
+            for time in new_times.tolist():
+                for (number, start) in self.__shift(time, 1):
+                    self.__update_top_allow_overlap(number, start)
+                    self.__update_top_without_overlap(number, start)
+            return
+
+        # A time window starting at an event is completed when an event comes at least
+        # one window later. The number of logs in the window are the events in between.
+        last = times[-1]
+        first = np.flatnonzero(np.concatenate(([True], times[1:] != times[:-1])))
+        starts = times[first]
+        completed = starts <= last - self.__time_window
+        starts = starts[completed]
+        numbers = np.searchsorted(times, starts + self.__time_window) - first[completed]
+        for (number, time) in zip(numbers.tolist(), starts.tolist()):
+            self.__update_top_allow_overlap(number, time)
+            self.__update_top_without_overlap(number, time)
+
+        # Keep the events in the current time window in the queue
+        self.__queue = deque(times[np.searchsorted(times, last - self.__time_window,
+                                                   side="right"):].tolist())
+        self.__descents = 0
+        if self.__use_histogram:
+            self.__enter_histogram()
+
+    def merge(self, other):
+        """
+        Add the entries recorded by a mergeable TimeWindow that follow the entries of this
+        TimeWindow, e.g. the next part of the log file. The result is the same as updating
+        this TimeWindow with the entries of other one by one. If this TimeWindow is also
+        mergeable, the entries of other are only recorded.
+        Args:
+            other(TimeWindow): the mergeable TimeWindow.
+        Raises:
+            NotImplementedError: Error occurs when other is not mergeable.
+        """
+        if not other.__mergeable:
+            raise NotImplementedError("only a mergeable TimeWindow can be merged")
+        for (time, offset) in zip(other.__offset_times, other.__offsets):
+            self.__update_offset(time, offset)
+
+        if self.__mergeable:
+            if other.__times:
+                self.__record(other.__times[0], other.__counts[0])
+                self.__times.extend(other.__times[1:])
+                self.__counts.extend(other.__counts[1:])
+            return
+
+        for start in range(0, len(other.__times), self.__MERGE_SIZE):
+            times = other.__times[start:start+self.__MERGE_SIZE]
+            counts = other.__counts[start:start+self.__MERGE_SIZE]
+            if np is not None and self.__histogram:
+                self.__update_histogram(np.frombuffer(times, dtype=np.int_),
+                                        np.frombuffer(counts, dtype=np.int_))
+                continue
+            if np is not None and not self.__histogram:
+                self.__update_times(np.repeat(np.frombuffer(times, dtype=np.int_),
+                                              np.frombuffer(counts, dtype=np.int_)))
+                continue
+            for (time, count) in zip(times, counts):
+                # Histogram mode may be left and returned to at any entry
+                for (number, start_time) in self.__shift(time, count):
+                    self.__update_top_allow_overlap(number, start_time)
+                    self.__update_top_without_overlap(number, start_time)
+
+    def finalize(self, entry, provisional=False):
         """
         At the end of file, collect the time windows that is not with one full hour
         but contains the events in the last period of time.
+        Args:
+            entry(LogRecord or dict): the last log record in the file.
+            provisional(bool): if True, this TimeWindow is not changed and can still be
+                updated, e.g. when the log file is still growing. A finalized copy is
+                returned instead; copying costs as much as the events in the current window
+                (or the seconds of the window in histogram mode).
+        Returns:
+            window(TimeWindow): the finalized TimeWindow, this one if not provisional.
+        Raises:
+            NotImplementedError: Error occurs when provisional is True and the TimeWindow
+                is mergeable.
         """
-        # Make up a fake entry at the end of file
-        fake_entry = entry
-
-        # Set the time to be one hour later than the last time in the file
-        fake_entry["Time"] = entry["Time"] + self.__time_window
+        if provisional:
+            if self.__mergeable:
+                raise NotImplementedError("mergeable TimeWindow can't be finalized provisionally")
+            window = copy.copy(self)
+            window.__queue = deque(self.__queue)
+            window.__seconds = deque(self.__seconds)
+            window.__ring = array.array('l', self.__ring)
+            window.__top_overlap = copy.deepcopy(self.__top_overlap)
+            window.__top_no_overlap = copy.deepcopy(self.__top_no_overlap)
+            window.__pending_data = copy.copy(self.__pending_data)
+            window.__offset_times = list(self.__offset_times)
+            window.__offsets = list(self.__offsets)
+            return window.finalize(entry)
+
+        # Make up a fake entry at the end of file,
+        # set the time to be one hour later than the last time in the file
+        entry = read_entry.LogRecord.from_dict(entry)
+        fake_entry = entry._replace(time=entry[read_entry.TIME] + self.__time_window)
 
         # Update the fake entry data so that the time windows in the last hour can be added
         # to the list
@@ -168,6 +528,34 @@ class TimeWindow(object):
             self.__top_no_overlap.push(self.__pending_data)
             self.__is_pending = False
             self.__pending_data = None
+        return self
+
+    def __format_time(self, time):
+        """
+        Transform the starting time of a time window into string.
+        Args:
+            time(datetime or int): the starting time.
+        Returns:
+            string in format '%d/%b/%Y:%H:%M:%S %z'.
+        """
+        if not self.__epoch:
+            return time.strftime("%d/%b/%Y:%H:%M:%S %z")
+        idx = max(bisect.bisect_right(self.__offset_times, time) - 1, 0)
+        return read_entry.format_epoch(time, self.__offsets[idx])
+
+    def queue_length(self):
+        """
+        Get the number of items kept to shift the time window, e.g. to watch the memory.
+        Returns:
+            length(int): the number of entries in the current time window, or the number of
+                distinct times if mergeable, or of distinct seconds in the current time window
+                in histogram mode.
+        """
+        if self.__mergeable:
+            return len(self.__times)
+        if self.__histogram:
+            return len(self.__seconds)
+        return len(self.__queue)
 
     def top(self):
         """
@@ -176,10 +564,8 @@ class TimeWindow(object):
             result(list): A list of length-2 lists. Each length-2 lists contains list[0]
             as the number of activities of the time window and list[1] the starting time.
         """
-        result = self.__top_overlap.get()
-        for data in result:
-            data[1] = data[1].strftime("%d/%b/%Y:%H:%M:%S %z")
-        return result
+        return [[number, self.__format_time(time)]
+                for (number, time) in self.__top_overlap.get()]
 
     def top_no_overlap(self):
         """
@@ -188,10 +574,8 @@ class TimeWindow(object):
             result(list): A list of length-2 lists. Each length-2 lists contains list[0]
             as the number of activities of the time window and list[1] the starting time.
         """
-        result = self.__top_no_overlap.get()
-        for data in result:
-            data[1] = data[1].strftime("%d/%b/%Y:%H:%M:%S %z")
-        return result
+        return [[number, self.__format_time(time)]
+                for (number, time) in self.__top_no_overlap.get()]
 
 
 class TestTimeWindow(unittest.TestCase):
@@ -242,5 +626,217 @@ class TestTimeWindow(unittest.TestCase):
         self.assertEquals(result2[1], [3, '01/Jul/1995:01:00:03 '])
         self.assertEquals(result2[2], [2, '01/Jul/1995:02:00:06 '])
 
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_update_batch(self):
+        lines = ['{0} - - [{1} -0400] "GET / HTTP/1.0" 200 0'.format(
+            entry["Host"], entry["Time"].strftime("%d/%b/%Y:%H:%M:%S")) for entry in self.data]
+        hosts = utility.Vocabulary()
+        resources = utility.Vocabulary()
+        for split in range(len(lines)):
+            hours = TimeWindow(hours=1, n_top=3, epoch=True)
+            hours.update_batch(read_entry.read_batch(lines[:split], hosts, resources))
+            batch = read_entry.read_batch(lines[split:], hosts, resources)
+            hours.update_batch(batch)
+            hours.finalize(batch.record(len(batch)-1))
+
+            result = hours.top()
+            self.assertEquals(result[0], [5, '01/Jul/1995:08:00:11 -0400'])
+            self.assertEquals(result[1], [3, '01/Jul/1995:08:00:13 -0400'])
+            self.assertEquals(result[2], [3, '01/Jul/1995:01:00:03 -0400'])
+
+            result2 = hours.top_no_overlap()
+            self.assertEquals(result2[0], [5, '01/Jul/1995:08:00:11 -0400'])
+            self.assertEquals(result2[1], [3, '01/Jul/1995:01:00:03 -0400'])
+            self.assertEquals(result2[2], [2, '01/Jul/1995:02:00:06 -0400'])
+
+    def test_merge(self):
+        data = []
+        for entry in self.data:
+            entry = dict(entry)
+            entry["Time"] = calendar.timegm(entry["Time"].timetuple()) + 4*60*60
+            entry["Offset"] = -4*60*60
+            data.append(entry)
+        for split in range(len(data)):
+            hours = TimeWindow(hours=1, n_top=3, epoch=True)
+            first = TimeWindow(hours=1, n_top=3, epoch=True, mergeable=True)
+            second = TimeWindow(hours=1, n_top=3, epoch=True, mergeable=True)
+            for entry in data[:split]:
+                first.update(entry)
+            for entry in data[split:]:
+                second.update(entry)
+            first.merge(second)
+            hours.merge(first)
+            hours.finalize(data[-1])
+
+            result = hours.top()
+            self.assertEquals(result[0], [5, '01/Jul/1995:08:00:11 -0400'])
+            self.assertEquals(result[1], [3, '01/Jul/1995:08:00:13 -0400'])
+            self.assertEquals(result[2], [3, '01/Jul/1995:01:00:03 -0400'])
+
+            result2 = hours.top_no_overlap()
+            self.assertEquals(result2[0], [5, '01/Jul/1995:08:00:11 -0400'])
+            self.assertEquals(result2[1], [3, '01/Jul/1995:01:00:03 -0400'])
+            self.assertEquals(result2[2], [2, '01/Jul/1995:02:00:06 -0400'])
+        self.assertRaises(NotImplementedError, TimeWindow, mergeable=True)
+
+    def test_finalize_provisional(self):
+        hours = TimeWindow(hours=1, n_top=3)
+        for (idx, entry) in enumerate(self.data):
+            hours.update(entry)
+            window = hours.finalize(entry, provisional=True)
+            self.assertFalse(window is hours)
+            expected = TimeWindow(hours=1, n_top=3)
+            for previous in self.data[:idx+1]:
+                expected.update(previous)
+            expected.finalize(entry)
+            self.assertEqual(window.top(), expected.top())
+            self.assertEqual(window.top(), expected.top())
+            self.assertEqual(window.top_no_overlap(), expected.top_no_overlap())
+        self.assertEqual(hours.finalize(entry).top()[0], [5, '01/Jul/1995:08:00:11 '])
+
+    def test_histogram(self):
+        # Bursts of entries at the same seconds with gaps longer than the window, in
+        # ascending order, compared with the TimeWindow keeping the time of each entry.
+        random_state = random.Random(0)
+        (data, time) = ([], 804571201)
+        for _ in range(6000):
+            if random_state.random() < 0.002:
+                time += random_state.choice([900, 3700])
+            time += random_state.choice([0, 0, 0, 1, 2])
+            data.append({"Time": time, "Offset": -4*60*60})
+        expected = TimeWindow(hours=0.5, n_top=5, epoch=True)
+        hours = TimeWindow(hours=0.5, n_top=5, epoch=True, histogram=True)
+        lengths = []
+        for entry in data:
+            expected.update(entry)
+            hours.update(entry)
+            lengths.append((hours.queue_length(), expected.queue_length()))
+        # The seconds kept are at most the seconds of the window, the entries are more.
+        self.assertTrue(max(lengths)[0] <= 30*60)
+        self.assertTrue(max(lengths)[0] < max(expected for (_, expected) in lengths))
+        window = hours.finalize(data[-1], provisional=True)
+        expected.finalize(data[-1])
+        self.assertEqual(window.top(), expected.top())
+        self.assertEqual(window.top_no_overlap(), expected.top_no_overlap())
+
+        (first, second) = (TimeWindow(hours=0.5, n_top=5, epoch=True, mergeable=True),
+                           TimeWindow(hours=0.5, n_top=5, epoch=True, mergeable=True))
+        hours = TimeWindow(hours=0.5, n_top=5, epoch=True, histogram=True)
+        for entry in data[:1000]:
+            first.update(entry)
+        for entry in data[1000:]:
+            second.update(entry)
+        hours.merge(first)
+        hours.merge(second)
+        hours.finalize(data[-1])
+        self.assertEqual(hours.top(), expected.top())
+        self.assertEqual(hours.top_no_overlap(), expected.top_no_overlap())
+        self.assertRaises(NotImplementedError, TimeWindow, histogram=True)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_histogram_batch(self):
+        lines = ['{0} - - [{1} -0400] "GET / HTTP/1.0" 200 0'.format(
+            entry["Host"], entry["Time"].strftime("%d/%b/%Y:%H:%M:%S")) for entry in self.data]
+        hosts = utility.Vocabulary()
+        resources = utility.Vocabulary()
+        for split in range(len(lines)):
+            hours = TimeWindow(hours=1, n_top=3, epoch=True, histogram=True)
+            hours.update_batch(read_entry.read_batch(lines[:split], hosts, resources))
+            batch = read_entry.read_batch(lines[split:], hosts, resources)
+            hours.update_batch(batch)
+            hours.finalize(batch.record(len(batch)-1))
+            self.assertEqual(hours.top(), [[5, '01/Jul/1995:08:00:11 -0400'],
+                                           [3, '01/Jul/1995:08:00:13 -0400'],
+                                           [3, '01/Jul/1995:01:00:03 -0400']])
+            self.assertEqual(hours.top_no_overlap(), [[5, '01/Jul/1995:08:00:11 -0400'],
+                                                      [3, '01/Jul/1995:01:00:03 -0400'],
+                                                      [2, '01/Jul/1995:02:00:06 -0400']])
+
+    def test_histogram_unsorted(self):
+        # The entries at 2 are earlier than the one at 8 before them, the window starting
+        # at 2 is only seen from the time of each entry.
+        data = [{"Time": 804571200 + time, "Offset": -4*60*60}
+                for time in (0, 8, 2, 2, 2, 9, 20, 21)]
+        expected = TimeWindow(hours=10/3600.0, n_top=3, epoch=True)
+        hours = TimeWindow(hours=10/3600.0, n_top=3, epoch=True, histogram=True)
+        for entry in data:
+            expected.update(entry)
+            hours.update(entry)
+        window = hours.finalize(data[-1], provisional=True)
+        expected.finalize(data[-1])
+        self.assertEqual(expected.top()[2], [4, '01/Jul/1995:00:00:02 -0400'])
+        self.assertEqual(window.top(), expected.top())
+        self.assertEqual(window.top_no_overlap(), expected.top_no_overlap())
+
+        for split in range(len(data)):
+            (first, second) = (TimeWindow(hours=10/3600.0, n_top=3, epoch=True, mergeable=True),
+                               TimeWindow(hours=10/3600.0, n_top=3, epoch=True, mergeable=True))
+            hours = TimeWindow(hours=10/3600.0, n_top=3, epoch=True, histogram=True)
+            for entry in data[:split]:
+                first.update(entry)
+            for entry in data[split:]:
+                second.update(entry)
+            hours.merge(first)
+            hours.merge(second)
+            hours.finalize(data[-1])
+            self.assertEqual(hours.top(), expected.top())
+            self.assertEqual(hours.top_no_overlap(), expected.top_no_overlap())
+
+    def test_histogram_returns(self):
+        # One entry earlier than the one before it, and then more than a window of entries
+        # in order, five in each second.
+        times = [804571200 + second for second in range(30) for _ in range(5)]
+        times[40] -= 3
+        data = [{"Time": time, "Offset": -4*60*60} for time in times]
+        expected = TimeWindow(hours=10/3600.0, n_top=5, epoch=True)
+        hours = TimeWindow(hours=10/3600.0, n_top=5, epoch=True, histogram=True)
+        lengths = []
+        for entry in data:
+            expected.update(entry)
+            hours.update(entry)
+            lengths.append(hours.queue_length())
+        # The entries are counted by second again once the earlier one leaves the window
+        self.assertTrue(max(lengths[:60]) > 10)
+        self.assertTrue(max(lengths[-60:]) <= 10)
+        window = hours.finalize(data[-1], provisional=True)
+        expected.finalize(data[-1])
+        self.assertEqual(window.top(), expected.top())
+        self.assertEqual(window.top_no_overlap(), expected.top_no_overlap())
+
+        (first, second) = (TimeWindow(hours=10/3600.0, n_top=5, epoch=True, mergeable=True),
+                           TimeWindow(hours=10/3600.0, n_top=5, epoch=True, mergeable=True))
+        hours = TimeWindow(hours=10/3600.0, n_top=5, epoch=True, histogram=True)
+        for entry in data[:100]:
+            first.update(entry)
+        for entry in data[100:]:
+            second.update(entry)
+        hours.merge(first)
+        self.assertTrue(hours.queue_length() <= 10)
+        hours.merge(second)
+        hours.finalize(data[-1])
+        self.assertEqual(hours.top(), expected.top())
+        self.assertEqual(hours.top_no_overlap(), expected.top_no_overlap())
+
+    def test_update_top_epoch(self):
+        hours = TimeWindow(hours=1, n_top=3, epoch=True)
+
+        for entry in self.data:
+            entry = dict(entry)
+            entry["Time"] = calendar.timegm(entry["Time"].timetuple()) + 4*60*60
+            entry["Offset"] = -4*60*60
+            final = entry
+            hours.update(entry)
+        hours.finalize(final)
+
+        result = hours.top()
+        self.assertEquals(result[0], [5, '01/Jul/1995:08:00:11 -0400'])
+        self.assertEquals(result[1], [3, '01/Jul/1995:08:00:13 -0400'])
+        self.assertEquals(result[2], [3, '01/Jul/1995:01:00:03 -0400'])
+
+        result2 = hours.top_no_overlap()
+        self.assertEquals(result2[0], [5, '01/Jul/1995:08:00:11 -0400'])
+        self.assertEquals(result2[1], [3, '01/Jul/1995:01:00:03 -0400'])
+        self.assertEquals(result2[2], [2, '01/Jul/1995:02:00:06 -0400'])
+
 if __name__ == '__main__':
     unittest.main()
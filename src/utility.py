@@ -5,17 +5,30 @@ This module contains:
     Logger: 
         A modified logger class inherited from logging.Logger.
     memory_usage(): 
-        A function that returns the memory used.
+        A function that returns the memory used, cheaply enough to be sampled.
+    peak_memory_usage():
+        A function that returns the peak memory used so far.
     nlargest_dict: 
         A function to find n largest attributes in dictionary according to
         a specified attribute and return the list of those keys and values.
     nsmallest_dict: 
         A function to find n largest attributes in dictionary according to
         a specified attribute and return the list of those keys and values.
+    nlargest_column:
+        A function to find n largest entries in a list or array indexed by integer keys.
+    nlargest_array, nsmallest_array:
+        Functions to find n largest or smallest entries in an array by partitioning it.
+    BitSet:
+        A set of non-negative integers stored as bits.
+    Vocabulary:
+        A dictionary that maps each distinct string to a dense integer ID.
     LinkedList: 
         A class for linked lists sorted in ascending order.
     Node: 
         A class for node in linked lists.
+    CountIndex:
+        A class that keeps keys in buckets of the same count, to get the keys with the
+        largest or smallest counts at any time.
 Author: Yuan Huang
 """
 
@@ -24,6 +37,10 @@ import os
 import sys
 import heapq
 import unittest
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class Logger(logging.Logger):
     """
@@ -69,45 +86,254 @@ class Logger(logging.Logger):
 
 def memory_usage():
     """
-    Return the memory used in the job.
+    Return the memory used in the job, read from /proc/self/statm without starting a
+    process, so it can be called often (see run_stats.Sampler). Where there is no /proc
+    (e.g. Mac OS X), the peak memory so far is returned instead.
     Returns:
-        mem(float): the memory used in units of MB.
+        mem(float): the memory used in units of MB, None if it is not available.
     """
-    import subprocess
-    out = subprocess.Popen(['ps', 'v', '-p', str(os.getpid())],
-                           stdout=subprocess.PIPE).communicate()[0].split(b'\n')
-    vsz_index = out[0].split().index(b'RSS')
-    mem = float(out[1].split()[vsz_index]) / 1024
-    return mem
-
-def nlargest_dict(n_top, dictionary, axis):
+    try:
+        with open("/proc/self/statm") as reader:
+            pages = int(reader.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024.0 / 1024.0
+    except (IOError, OSError, ValueError, IndexError):
+        return peak_memory_usage()
+
+def peak_memory_usage():
+    """
+    Return the peak resident memory of the job so far (getrusage).
+    Returns:
+        mem(float): the peak memory in units of MB, None if it is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on Mac OS X and in kilobytes on Linux.
+    if sys.platform == "darwin":
+        return peak / 1024.0 / 1024.0
+    return peak / 1024.0
+
+def nlargest_dict(n_top, dictionary, axis, keys=None):
     """
     Find n largest entries in a dictionary, the sort axis is specified as axis.
     Args:
         n_top(int): the number of top entries
         dict(dict): the data in dictionary
         axis(int): the index to sort.
+        keys(iterable): the keys to search, in the order that ties are kept.
+            Default is all the keys in dict.
     Returns:
         top_keys(list): The top n keys in a list.
         top_values(list): The top n values in a list.
     """
-    top_keys = heapq.nlargest(n_top, dictionary, key = lambda x: dictionary[x][axis])
+    if keys is None:
+        keys = dictionary
+    top_keys = heapq.nlargest(n_top, keys, key = lambda x: dictionary[x][axis])
     return  top_keys, [dictionary[key][axis] for key in top_keys]
 
-def nsmallest_dict(n_bottom, dictionary, axis):
+def nlargest_column(n_top, column, keys):
+    """
+    Find n largest entries in a column (a list or array indexed by integer keys).
+    Args:
+        n_top(int): the number of top entries
+        column(list or array): the data in column
+        keys(iterable): the keys to search, in the order that ties are kept.
+    Returns:
+        top_keys(list): The top n keys in a list.
+        top_values(list): The top n values in a list.
+    """
+    top_keys = heapq.nlargest(n_top, keys, key=column.__getitem__)
+    return top_keys, [column[key] for key in top_keys]
+
+def nsmallest_dict(n_bottom, dictionary, axis, names=None):
     """
     Find n smallest entries in a dictionary, the sort axis is specified as axis.
+    Ties are broken by the order of the keys.
     Args:
         n_bottom(int): the number of least entries
         dict(dict): the data in dictionary
         axis(int): the index to sort.
+        names(list): if the keys are integer IDs, names[key] is the name to break ties.
     Returns:
         bottom_keys(list): The n keys at the bottom in a list.
         bottom_values(list): The n values at the bottom in a list.
     """
-    bottom_keys = heapq.nsmallest(n_bottom, dictionary, key=lambda x: (dictionary[x][axis], x))
+    if names is None:
+        key = lambda x: (dictionary[x][axis], x)
+    else:
+        key = lambda x: (dictionary[x][axis], names[x])
+    bottom_keys = heapq.nsmallest(n_bottom, dictionary, key=key)
     return  bottom_keys, [dictionary[key][axis] for key in bottom_keys]
 
+def nlargest_array(n_top, values, keys, names=None):
+    """
+    Find n largest entries in an array, e.g. a column indexed by integer keys.
+    The n-th largest value is found by partitioning (numpy.partition), and only the entries
+    not less than it are sorted. Ties are broken by the order of the keys.
+    Args:
+        n_top(int): the number of top entries
+        values(numpy.ndarray or list): the values.
+        keys(numpy.ndarray or list): keys[i] is the key of values[i].
+        names(list): if the keys are integer IDs, names[key] is the name to break ties.
+    Returns:
+        top_keys(list): The top n keys in a list.
+        top_values(list): The top n values in a list.
+    """
+    return __select_array(n_top, values, keys, names, True)
+
+def nsmallest_array(n_bottom, values, keys, names=None):
+    """
+    Find n smallest entries in an array, as nlargest_array.
+    Args:
+        n_bottom(int): the number of least entries
+        values, keys, names: see nlargest_array.
+    Returns:
+        bottom_keys(list): The n keys at the bottom in a list.
+        bottom_values(list): The n values at the bottom in a list.
+    """
+    return __select_array(n_bottom, values, keys, names, False)
+
+def __select_array(number, values, keys, names, largest):
+    """
+    Find n largest or smallest entries in an array, see nlargest_array.
+    """
+    if number <= 0 or len(values) == 0:
+        return [], []
+    if np is not None:
+        (values, keys) = (np.asarray(values), np.asarray(keys))
+        if number < len(values):
+            # The n-th largest or smallest value, the entries beyond it can't be selected.
+            if largest:
+                kth = np.partition(values, len(values) - number)[len(values) - number]
+                selected = np.flatnonzero(values >= kth)
+            else:
+                kth = np.partition(values, number - 1)[number - 1]
+                selected = np.flatnonzero(values <= kth)
+            (values, keys) = (values[selected], keys[selected])
+        (values, keys) = (values.tolist(), keys.tolist())
+    sign = -1 if largest else 1
+    if names is None:
+        tie = lambda idx: (sign * values[idx], keys[idx])
+    else:
+        tie = lambda idx: (sign * values[idx], names[keys[idx]])
+    order = heapq.nsmallest(number, range(len(values)), key=tie)
+    return [keys[idx] for idx in order], [values[idx] for idx in order]
+
+class BitSet(object):
+    """
+    A set of non-negative integers (e.g. the dense IDs of a Vocabulary), stored as one
+    bit for each integer. It uses much less memory than a set when the integers are dense.
+    """
+    def __init__(self):
+        """
+        Private members:
+            __bits(bytearray): bit i is set if integer i is in the set.
+            __length(int): the number of integers in the set.
+        """
+        self.__bits = bytearray()
+        self.__length = 0
+
+    def add(self, idx):
+        """
+        Add an integer into the set.
+        Args:
+            idx(int): the non-negative integer.
+        """
+        byte = idx >> 3
+        if byte >= len(self.__bits):
+            # Grow the bytearray at least geometrically
+            self.__bits.extend(bytearray(max(byte + 1, 2*len(self.__bits)) - len(self.__bits)))
+        bit = 1 << (idx & 7)
+        if not self.__bits[byte] & bit:
+            self.__bits[byte] |= bit
+            self.__length += 1
+
+    def add_array(self, ids):
+        """
+        Add a numpy array of integers into the set.
+        Args:
+            ids(numpy.ndarray): the non-negative integers.
+        """
+        if len(ids) == 0:
+            return
+        ids = np.unique(ids)
+        self.add(int(ids[-1]))
+        bits = np.frombuffer(self.__bits, dtype=np.uint8)
+        byte = ids >> 3
+        bit = np.left_shift(1, ids & 7).astype(np.uint8)
+        new = (bits[byte] & bit) == 0
+        self.__length += int(np.count_nonzero(new))
+        np.bitwise_or.at(bits, byte[new], bit[new])
+
+    def __iter__(self):
+        """
+        Iterate over the integers in the set in ascending order.
+        """
+        for (byte, bits) in enumerate(self.__bits):
+            if bits:
+                for bit in range(8):
+                    if bits & (1 << bit):
+                        yield (byte << 3) + bit
+
+    def __contains__(self, idx):
+        byte = idx >> 3
+        return byte < len(self.__bits) and bool(self.__bits[byte] & (1 << (idx & 7)))
+
+    def __len__(self):
+        return self.__length
+
+class Vocabulary(dict):
+    """
+    A dictionary that maps each distinct string to a dense integer ID, in the order
+    the strings are first seen. vocabulary[name] returns the ID of name, and adds the
+    name if it is new. vocabulary.names[ID] returns the name. Iterating over the
+    vocabulary gives the names in the same order as a dictionary with the names as keys.
+    Example: hosts = Vocabulary(); host_id = hosts["199.72.81.55"]
+    Public variables:
+        names(list): the list of names, the index is the ID.
+    """
+    def __init__(self):
+        super(Vocabulary, self).__init__()
+        self.names = []
+
+    def __missing__(self, name):
+        """
+        Add a new name to the vocabulary.
+        Args:
+            name(str): the new name.
+        Returns:
+            idx(int): the ID of the new name.
+        """
+        idx = len(self.names)
+        self[name] = idx
+        self.names.append(name)
+        return idx
+
+    def decode(self, idx):
+        """
+        Get the name of an ID.
+        Args:
+            idx(int): the ID.
+        Returns:
+            name(str): the name of the ID.
+        """
+        return self.names[idx]
+
+    def merge(self, other):
+        """
+        Add the names of another vocabulary, in the order of their IDs in the other
+        vocabulary. Merging the vocabularies of consecutive parts of a log in order gives the
+        same IDs as reading the whole log with one vocabulary. Merging the same vocabulary
+        again adds nothing and returns the same list.
+        Args:
+            other(Vocabulary): the other vocabulary.
+        Returns:
+            ids(list): ids[idx] is the ID in this vocabulary of the ID idx in other.
+        """
+        return [self[name] for name in other.names]
+
 class Node:
     """
     The Node class with pointer "next" and "data".
@@ -286,6 +512,16 @@ class Heap:
         else:
             heapq.heappushpop(self.__minheap, new_data)
 
+    def merge(self, other):
+        """
+        Push all the data of another heap into this heap. The result is the same as pushing
+        the data of both heaps into one heap.
+        Args:
+            other(Heap): the other heap.
+        """
+        for data in other.__minheap:
+            self.push(data)
+
     def length(self):
         """
         Get the length of the list.
@@ -315,6 +551,177 @@ class Heap:
         else:
             raise NotImplementedError("sorting order {0} is not implemented.".format(order))
 
+class CountBucket(object):
+    """
+    A bucket of the keys with the same count in CountIndex, linked to the buckets with the
+    next smaller (prev) and larger (next) counts.
+    """
+    __slots__ = ("count", "keys", "prev", "next")
+    def __init__(self, count):
+        self.count = count
+        self.keys = set()
+        self.prev = None
+        self.next = None
+
+class CountIndex(object):
+    """
+    An index of the counts of keys (a stream summary): the keys with the same count are in
+    a bucket, and the buckets are doubly linked in ascending order of the counts. When a
+    count grows by one, the key moves to the next bucket, so keeping the index up to date
+    costs O(1) for each update. The top or bottom n keys are then found by walking the
+    buckets from either end, in O(n log n) plus the size of the last bucket reached, instead
+    of searching all the keys. Ties are always broken in ascending order of the keys, or of
+    a given sort key, e.g. the names of the IDs of a Vocabulary.
+    Example: index = CountIndex([("a", 3), ("b", 1)])
+             index.move("b", 1, 2)
+             index.top(1)
+    Args:
+        counts(iterable): the (key, count) pairs to start with, the counts are positive.
+    """
+    def __init__(self, counts=None):
+        """
+        Private members:
+            __buckets(dict): the bucket of each count.
+            __head(CountBucket), __tail(CountBucket): the buckets of the smallest and the
+                largest count, None if there is no key.
+            __length(int): the number of keys.
+        """
+        self.__buckets = {}
+        (self.__head, self.__tail) = (None, None)
+        self.__length = 0
+        if counts is None:
+            return
+        for (key, count) in counts:
+            bucket = self.__buckets.get(count)
+            if bucket is None:
+                bucket = self.__buckets[count] = CountBucket(count)
+            bucket.keys.add(key)
+            self.__length += 1
+        prev = None
+        for count in sorted(self.__buckets):
+            bucket = self.__buckets[count]
+            bucket.prev = prev
+            if prev is None:
+                self.__head = bucket
+            else:
+                prev.next = bucket
+            prev = bucket
+        self.__tail = prev
+
+    def __len__(self):
+        return self.__length
+
+    def move(self, key, old, new):
+        """
+        Change the count of a key.
+        Args:
+            key: the key.
+            old(int): the count of the key in the index, 0 if the key is new.
+            new(int): the new count of the key, larger than old.
+        """
+        buckets = self.__buckets
+        bucket = buckets.get(new)
+        if bucket is None:
+            # Find the bucket with the largest count less than new, from the old bucket
+            # which is usually right before it.
+            current = buckets.get(old)
+            if current is None:
+                current = self.__head
+                if current is not None and current.count > new:
+                    current = None
+            if current is not None:
+                while current.next is not None and current.next.count < new:
+                    current = current.next
+            bucket = buckets[new] = CountBucket(new)
+            self.__link(bucket, current)
+        bucket.keys.add(key)
+
+        if old == 0:
+            self.__length += 1
+            return
+        bucket = buckets[old]
+        bucket.keys.discard(key)
+        if not bucket.keys:
+            self.__unlink(bucket)
+            del buckets[old]
+
+    def __link(self, bucket, prev):
+        """
+        Insert a bucket after another one.
+        Args:
+            bucket(CountBucket): the new bucket.
+            prev(CountBucket): the bucket before it, None to insert it at the head.
+        """
+        bucket.prev = prev
+        bucket.next = self.__head if prev is None else prev.next
+        if prev is None:
+            self.__head = bucket
+        else:
+            prev.next = bucket
+        if bucket.next is None:
+            self.__tail = bucket
+        else:
+            bucket.next.prev = bucket
+
+    def __unlink(self, bucket):
+        """
+        Remove a bucket from the linked buckets.
+        Args:
+            bucket(CountBucket): the bucket.
+        """
+        if bucket.prev is None:
+            self.__head = bucket.next
+        else:
+            bucket.prev.next = bucket.next
+        if bucket.next is None:
+            self.__tail = bucket.prev
+        else:
+            bucket.next.prev = bucket.prev
+
+    def __collect(self, number, bucket, forward, tie):
+        """
+        Collect the keys of the buckets from one end.
+        Args:
+            number(int): the number of keys.
+            bucket(CountBucket): the bucket at the end.
+            forward(bool): True to walk to the larger counts, False to the smaller ones.
+            tie(function): see top.
+        Returns:
+            A list of (count, key) tuples.
+        """
+        result = []
+        while bucket is not None and len(result) < number:
+            need = number - len(result)
+            if len(bucket.keys) <= need:
+                keys = sorted(bucket.keys, key=tie)
+            else:
+                keys = heapq.nsmallest(need, bucket.keys, key=tie)
+            result.extend((bucket.count, key) for key in keys)
+            bucket = bucket.next if forward else bucket.prev
+        return result
+
+    def top(self, number, tie=None):
+        """
+        Get the keys with the largest counts.
+        Args:
+            number(int): the number of keys.
+            tie(function): the sort key of the keys to break the ties in ascending order,
+                e.g. the name of an ID. None to compare the keys themselves.
+        Returns:
+            A list of (count, key) tuples in descending order of the counts.
+        """
+        return self.__collect(number, self.__tail, False, tie)
+
+    def bottom(self, number, tie=None):
+        """
+        Get the keys with the smallest counts.
+        Args:
+            number(int), tie(function): see top.
+        Returns:
+            A list of (count, key) tuples in ascending order of the counts.
+        """
+        return self.__collect(number, self.__head, True, tie)
+
 class TestAlgorithms(unittest.TestCase):
     """The unittest class for nlargest_dict and linked list."""
     def setUp(self):
@@ -345,6 +752,14 @@ class TestAlgorithms(unittest.TestCase):
         self.container.push(44)
         self.assertEqual(self.container.get("ascend"),[2,3,4,5,12,15,24,32,41,44])
 
+    def test_heap_merge(self):
+        """Test for merging two heaps."""
+        other = Heap(10)
+        for data in [40, 1, 33]:
+            other.push(data)
+        self.container.merge(other)
+        self.assertEqual(self.container.get("descend"), [41, 40, 33, 32, 24, 15, 12, 5, 4, 3])
+
     def test_nlargest_dict(self):
         """Test for the nlargest functionality for a dictionary."""
         keys, values = nlargest_dict(2, self.dict, 0)
@@ -359,5 +774,105 @@ class TestAlgorithms(unittest.TestCase):
         self.assertEqual(keys[1], "A")
         self.assertEqual(values[1], 300)
 
+    def test_bitset(self):
+        """Test for adding integers into the bit set."""
+        bits = BitSet()
+        for idx in [3, 100, 3, 0, 2000, 100]:
+            bits.add(idx)
+        self.assertEqual(len(bits), 4)
+        self.assertTrue(2000 in bits)
+        self.assertFalse(4 in bits)
+        self.assertFalse(5000 in bits)
+        self.assertEqual(list(bits), [0, 3, 100, 2000])
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_bitset_array(self):
+        """Test for adding an array of integers into the bit set."""
+        bits = BitSet()
+        bits.add(3)
+        bits.add_array(np.array([3, 100, 3, 0, 2000, 100]))
+        self.assertEqual(len(bits), 4)
+        self.assertTrue(2000 in bits)
+        self.assertTrue(100 in bits)
+        self.assertFalse(4 in bits)
+
+    def test_vocabulary(self):
+        """Test for the IDs of the vocabulary and the ties broken by names."""
+        vocabulary = Vocabulary()
+        self.assertEqual(vocabulary["B"], 0)
+        self.assertEqual(vocabulary["A"], 1)
+        self.assertEqual(vocabulary["B"], 0)
+        self.assertEqual(vocabulary.decode(1), "A")
+        self.assertEqual(len(vocabulary), 2)
+
+        data = {0: [15, 300], 1: [15, 200]}
+        keys, values = nlargest_dict(1, data, 0, [1, 0])
+        self.assertEqual(keys, [1])
+        keys, values = nsmallest_dict(1, data, 0, vocabulary.names)
+        self.assertEqual(keys, [1])
+
+    def test_vocabulary_merge(self):
+        """Test for merging vocabularies gives the IDs of one vocabulary."""
+        vocabulary = Vocabulary()
+        for name in "BAC":
+            vocabulary[name]
+        merged = Vocabulary()
+        merged["B"]
+        other = Vocabulary()
+        for name in "AC":
+            other[name]
+        self.assertEqual(merged.merge(other), [1, 2])
+        self.assertEqual(merged.merge(other), [1, 2])
+        self.assertEqual(merged.names, vocabulary.names)
+        self.assertEqual(list(merged), list(vocabulary))
+
+    def test_select_array(self):
+        import random
+        random_state = random.Random(0)
+        values = [random_state.randint(0, 20) for _ in range(300)]
+        keys = range(1000, 1300)
+        names = dict((key, "r{0}".format(1300 - key)) for key in keys)
+        expected = sorted(zip(values, keys), key=lambda item: (-item[0], item[1]))
+        for number in (0, 1, 10, 300, 400):
+            self.assertEqual(nlargest_array(number, values, keys),
+                             ([key for (_, key) in expected[:number]],
+                              [value for (value, _) in expected[:number]]))
+        expected = sorted(zip(values, keys), key=lambda item: (item[0], names[item[1]]))
+        self.assertEqual(nsmallest_array(15, values, keys, names),
+                         ([key for (_, key) in expected[:15]],
+                          [value for (value, _) in expected[:15]]))
+        self.assertEqual(nsmallest_array(2, [], []), ([], []))
+
+    def test_count_index(self):
+        import random
+        random_state = random.Random(0)
+        names = random_state.sample(["host{0}".format(idx) for idx in range(1000)], 50)
+        counts = {}
+        index = CountIndex()
+        for _ in range(2000):
+            key = random_state.randint(0, 49)
+            old = counts.get(key, 0)
+            counts[key] = old + random_state.choice((1, 1, 1, 5))
+            index.move(key, old, counts[key])
+        self.assertEqual(len(index), len(counts))
+        expected = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        for number in (0, 1, 7, 50, 60):
+            self.assertEqual(index.top(number),
+                             [(count, key) for (key, count) in expected[:number]])
+        expected = sorted(counts.items(), key=lambda item: (item[1], names[item[0]]))
+        self.assertEqual(index.bottom(10, names.__getitem__),
+                         [(count, key) for (key, count) in expected[:10]])
+        built = CountIndex(counts.items())
+        self.assertEqual(built.top(50), index.top(50))
+        self.assertEqual(built.bottom(50, names.__getitem__), index.bottom(50, names.__getitem__))
+
+        index = CountIndex([("b", 2), ("c", 2)])
+        index.move("a", 0, 2)
+        index.move("d", 0, 1)
+        self.assertEqual(index.top(3), [(2, "a"), (2, "b"), (2, "c")])
+        index.move("d", 1, 3)
+        self.assertEqual(index.bottom(2), [(2, "a"), (2, "b")])
+        self.assertEqual(index.top(1), [(3, "d")])
+
 if __name__ == '__main__':
     unittest.main()